@@ -0,0 +1,26 @@
+"""
+Configuração do gunicorn: gunicorn wallet_api_challenge.wsgi:application
+
+Com vários workers, as métricas do Prometheus precisam do modo multiprocesso: defina
+PROMETHEUS_MULTIPROC_DIR com um diretório gravável (ver wallet_app.metrics).
+"""
+import os
+import shutil
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+
+
+def on_starting(server):
+    # Os arquivos de métricas de uma execução anterior não podem ser reaproveitados
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Descarta os valores dos gauges "ao vivo" (ex: requisições em andamento) do worker encerrado
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,36 @@
+"""
+Configuração do cache a partir de variáveis de ambiente.
+"""
+
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+REDIS_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+MEMCACHED_BACKEND = 'django.core.cache.backends.memcached.PyMemcacheCache'
+REDIS_SCHEMES = ('redis', 'rediss', 'unix')
+
+
+def cache_config(url=''):
+    """
+    Converte uma URL de cache no formato de CACHES:
+
+    - `redis://[:senha@]host:6379/0` (ou `rediss://`, `unix://`): Redis, compartilhado entre
+      os processos (requer o pacote redis);
+    - `memcached://host:11211`: Memcached, também compartilhado (requer o pacote pymemcache);
+    - vazia: LocMem, na memória de cada processo.
+    """
+    if not url:
+        return {'BACKEND': LOCMEM_BACKEND}
+
+    parts = urlsplit(url)
+    if parts.scheme in REDIS_SCHEMES:
+        return {'BACKEND': REDIS_BACKEND, 'LOCATION': url}
+    if parts.scheme == 'memcached':
+        if not parts.netloc:
+            raise ImproperlyConfigured('Informe host:porta em CACHE_URL (ex: memcached://localhost:11211).')
+        return {'BACKEND': MEMCACHED_BACKEND, 'LOCATION': parts.netloc}
+    raise ImproperlyConfigured(
+        f"Esquema de CACHE_URL não suportado: '{parts.scheme}'. Use um de: {', '.join(REDIS_SCHEMES + ('memcached',))}."
+    )
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """
+    Nenhuma conexão ficou disponível no pool dentro do tempo limite.
+    """
+
+
+class ConnectionPool:
+    """
+    Pool de conexões do processo, independente do driver: `connect` é uma função sem
+    argumentos que abre uma conexão nova (ex: functools.partial(psycopg2.connect, ...)).
+
+    No máximo `max_size` conexões ficam abertas ao mesmo tempo; `min_size` conexões são
+    abertas na criação do pool e as devolvidas ficam ociosas para reutilização, sendo a
+    mais recente a primeira a ser reaproveitada. Quando todas estão em uso, getconn()
+    espera até `timeout` segundos por uma devolução e então levanta PoolTimeout.
+    O tempo de espera é contabilizado em stats().
+    """
+
+    def __init__(self, connect, min_size=2, max_size=10, timeout=10.0):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._stats = dict.fromkeys((
+            'requests_num', 'requests_queued', 'requests_wait_ms', 'requests_wait_max_ms',
+            'requests_errors', 'connections_num', 'connections_lost',
+        ), 0)
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    def _open(self):
+        connection = self._connect()
+        with self._lock:
+            self._size += 1
+            self._stats['connections_num'] += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._size -= 1
+            self._stats['connections_lost'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """
+        Retira uma conexão do pool, abrindo uma nova se não houver ociosas.
+        """
+        start = time.perf_counter()
+        queued = not self._slots.acquire(blocking=False)
+        acquired = not queued or self._slots.acquire(timeout=self.timeout)
+        wait_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            stats = self._stats
+            stats['requests_num'] += 1
+            if queued:
+                stats['requests_queued'] += 1
+                stats['requests_wait_ms'] += wait_ms
+                stats['requests_wait_max_ms'] = max(stats['requests_wait_max_ms'], wait_ms)
+            if not acquired:
+                stats['requests_errors'] += 1
+        if not acquired:
+            raise PoolTimeout(f'Nenhuma conexão disponível no pool após {self.timeout:g}s.')
+
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._open()
+                if not connection.closed:
+                    return connection
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection, discard=False):
+        """
+        Devolve ao pool uma conexão obtida com getconn(). Com `discard`, ou se a conexão
+        estiver fechada, ela é descartada e o lugar é liberado para uma nova.
+        """
+        try:
+            if discard or connection.closed or self._closed:
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Fecha as conexões ociosas. As que estão em uso são fechadas quando devolvidas.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'pool_min': self.min_size,
+                'pool_max': self.max_size,
+                'pool_size': self._size,
+                'pool_available': len(self._idle),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, connect, min_size=2, max_size=10, timeout=10.0):
+    """
+    Retorna o pool do processo para o alias e os parâmetros de conexão informados,
+    criando-o na primeira chamada. Parâmetros diferentes (ex: o banco de testes) têm
+    pools separados.
+    """
+    key = (alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(lambda: connect(**conn_params), min_size, max_size, timeout)
+        return pool
+
+
+def pool_stats():
+    """
+    Retorna as métricas de todos os pools do processo, indexadas por 'alias/banco'.
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {f"{alias}/{dict(params).get('dbname', '')}": pool.stats() for (alias, params), pool in pools}
+
+
+def close_pools(dbname=None):
+    """
+    Fecha as conexões ociosas dos pools (apenas os do banco `dbname`, se informado) e os remove.
+    """
+    with _pools_lock:
+        keys = [key for key in _pools if dbname is None or dict(key[1]).get('dbname') == dbname]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
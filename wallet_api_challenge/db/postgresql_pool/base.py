@@ -0,0 +1,75 @@
+"""
+Backend PostgreSQL com pool de conexões no processo.
+
+É o backend padrão do Django (psycopg2 ou psycopg 3) com uma diferença: as conexões
+são retiradas de um ConnectionPool (ver wallet_api_challenge.db.pool) em vez de abertas
+a cada requisição, e "fechá-las" as devolve ao pool. O tamanho e o tempo de espera
+vêm da chave POOL da configuração do banco (ver wallet_api_challenge.db.database_config).
+"""
+
+from django.db.backends.postgresql import base, creation
+
+from ..pool import close_pools, get_pool
+
+
+class _PooledDriver:
+    """
+    Expõe o módulo do driver com connect() retirando conexões do pool, para que
+    get_new_connection() do backend padrão configure a conexão como de costume.
+    """
+    def __init__(self, driver, pool):
+        self._driver = driver
+        self._pool = pool
+
+    def connect(self, **conn_params):
+        return self._pool.getconn()
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # O banco não pode ser removido enquanto houver conexões ociosas abertas para ele
+        close_pools(dbname=test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(
+            self.alias, conn_params, base.Database.connect,
+            min_size=options.get('MIN_SIZE', 2),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 10.0),
+        )
+
+    def get_new_connection(self, conn_params):
+        self._pool = self.get_pool(conn_params)
+        self.Database = _PooledDriver(base.Database, self._pool)
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            del self.Database
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # Desfaz uma transação deixada em aberto (não gera ida ao banco se não houver nenhuma)
+            # e descarta a conexão se ela falhou e não responde mais
+            discard = bool(self.connection.closed)
+            if not discard:
+                try:
+                    self.connection.rollback()
+                    discard = self.errors_occurred and not self.is_usable()
+                except self.Database.Error:
+                    discard = True
+            self._pool.putconn(self.connection, discard=discard)
@@ -21,6 +21,8 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
+from wallet_app.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Rotas para autenticação JWT
@@ -28,4 +30,6 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # Inclui as URLs do nosso aplicativo wallet_app
     path('api/', include('wallet_app.urls')),
+    # Métricas no formato do Prometheus
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class WalletAppConfig(AppConfig):
+    name = 'wallet_app'
+    verbose_name = 'Carteira Digital'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .middleware import install_query_recorder
+
+        # Mede as consultas de toda conexão, em qualquer thread (ver middleware.RequestTimingMiddleware)
+        connection_created.connect(install_query_recorder, dispatch_uid='wallet_app.query_recorder')
@@ -0,0 +1,682 @@
+"""
+Arquivo morto das transações antigas, em segmentos comprimidos no disco local.
+
+Cada segmento guarda as transações de um mês (UTC), ordenadas por (timestamp, id), em um
+arquivo zip com um membro comprimido por coluna (ids, remetentes e destinatários
+codificados como inteiros de 64 bits, com deltas onde a coluna é quase ordenada; valores
+em centavos; timestamps em microssegundos desde a época) e um índice por usuário (as
+posições das linhas de cada usuário). O catálogo dos segmentos e o índice de quais
+segmentos contêm cada usuário ficam no banco (ArchiveSegment e ArchiveSegmentUser), na
+mesma transação que remove as linhas da tabela, de modo que uma transação nunca está nos
+dois lugares nem em nenhum.
+
+A soma de verificação (SHA-256 da forma canônica das linhas) é calculada a partir das
+linhas lidas do banco, conferida relendo o arquivo antes de remover as linhas, e de novo
+sempre que um segmento é carregado para leitura.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+import zipfile
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .models import ArchiveSegmentUser, Transaction
+
+FORMAT_VERSION = 1
+SEGMENT_SUFFIX = '.seg'
+COLUMNS = ('id', 'sender_id', 'receiver_id', 'amount', 'transaction_type', 'timestamp')
+TRANSACTION_TYPES = ('DEPOSIT', 'TRANSFER') # Código de cada tipo: a posição na tupla
+SEGMENT_CACHE_SIZE = 16 # Segmentos decodificados mantidos em memória por processo
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class ArchiveIntegrityError(Exception):
+    """
+    Um segmento não pôde ser lido ou não confere com sua soma de verificação.
+    """
+
+
+def archive_dir():
+    return Path(settings.WALLET_ARCHIVE_DIR)
+
+
+def _update_checksum(digest, rows):
+    for row_id, sender_id, receiver_id, amount, transaction_type, timestamp in rows:
+        digest.update(
+            f'{row_id}|{sender_id}|{receiver_id}|{amount:f}|{transaction_type}|'
+            f'{timestamp.astimezone(dt_timezone.utc).isoformat()}\n'.encode()
+        )
+
+
+def rows_checksum(rows):
+    """
+    SHA-256 da forma canônica de uma sequência de linhas (tuplas na ordem de COLUMNS).
+    """
+    digest = hashlib.sha256()
+    _update_checksum(digest, rows)
+    return digest.hexdigest()
+
+
+def _micros(timestamp):
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _pack(values, typecode='q', delta=False, previous=0):
+    if delta:
+        values = [value - prior for prior, value in zip([previous] + values[:-1], values)]
+    packed = array(typecode, values)
+    if sys.byteorder == 'big': # O formato em disco é little-endian
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(data, typecode='q', delta=False, previous=0):
+    packed = array(typecode)
+    packed.frombytes(data)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    values = packed.tolist()
+    if delta:
+        total = previous
+        for index, value in enumerate(values):
+            total += value
+            values[index] = total
+    return values
+
+
+# Membros de coluna do segmento: (tipo do array, codificado em deltas)
+COLUMN_MEMBERS = {
+    'id': ('q', True),
+    'sender_id': ('q', False),
+    'receiver_id': ('q', False),
+    'amount': ('q', False),
+    'transaction_type': ('B', False),
+    'timestamp': ('q', True),
+}
+INDEX_MEMBERS = ('index/users', 'index/offsets', 'index/positions')
+
+
+class SegmentWriter:
+    """
+    Codifica um segmento a partir de lotes de linhas (tuplas na ordem de COLUMNS, em ordem
+    de (timestamp, id)), sem manter as linhas em memória: cada lote é empacotado e acrescentado
+    aos arquivos temporários das colunas, e a soma de verificação é atualizada. Até o fim
+    ficam em memória apenas as posições do índice por usuário (inteiros de 64 bits).
+    """
+    def __init__(self):
+        self.row_count = 0
+        self.first_timestamp = self.last_timestamp = None
+        self._digest = hashlib.sha256()
+        self._columns = {name: tempfile.TemporaryFile() for name in COLUMN_MEMBERS}
+        self._previous = dict.fromkeys(COLUMN_MEMBERS, 0)
+        self._positions = {}
+
+    @property
+    def checksum(self):
+        return self._digest.hexdigest()
+
+    def write(self, rows):
+        if not rows:
+            return
+        ids, senders, receivers, amounts, types, timestamps = (list(column) for column in zip(*rows))
+        columns = {
+            'id': ids,
+            'sender_id': senders,
+            'receiver_id': receivers,
+            'amount': [int(amount * 100) for amount in amounts],
+            'transaction_type': [TRANSACTION_TYPES.index(value) for value in types],
+            'timestamp': [_micros(value) for value in timestamps],
+        }
+        for name, (typecode, delta) in COLUMN_MEMBERS.items():
+            self._columns[name].write(_pack(columns[name], typecode, delta, self._previous[name]))
+            self._previous[name] = columns[name][-1]
+        for position, (sender_id, receiver_id) in enumerate(zip(senders, receivers), start=self.row_count):
+            self._positions.setdefault(sender_id, array('q')).append(position)
+            if receiver_id != sender_id:
+                self._positions.setdefault(receiver_id, array('q')).append(position)
+        _update_checksum(self._digest, rows)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamps[0]
+        self.last_timestamp = timestamps[-1]
+        self.row_count += len(rows)
+
+    def finish(self, output):
+        """
+        Grava o segmento (um zip) no arquivo binário `output` e descarta os temporários.
+        """
+        users = sorted(self._positions)
+        offsets = [0]
+        for user_id in users:
+            offsets.append(offsets[-1] + len(self._positions[user_id]))
+        meta = {'format': FORMAT_VERSION, 'rows': self.row_count, 'checksum': self.checksum}
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, column in self._columns.items():
+                column.seek(0)
+                with archive.open(name, 'w', force_zip64=True) as member:
+                    shutil.copyfileobj(column, member)
+            archive.writestr('index/users', _pack(users))
+            archive.writestr('index/offsets', _pack(offsets))
+            with archive.open('index/positions', 'w', force_zip64=True) as member:
+                for user_id in users:
+                    member.write(_pack(self._positions[user_id]))
+            archive.writestr('meta.json', json.dumps(meta).encode())
+        self.close()
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+
+
+def encode_segment(rows):
+    """
+    Codifica as linhas (tuplas na ordem de COLUMNS, ordenadas por (timestamp, id)) no
+    formato de segmento. Retorna os bytes do arquivo.
+    """
+    writer = SegmentWriter()
+    writer.write(list(rows))
+    buffer = io.BytesIO()
+    writer.finish(buffer)
+    return buffer.getvalue()
+
+
+class Segment:
+    """
+    Segmento decodificado: as colunas e o índice por usuário.
+    """
+    def __init__(self, columns, users, offsets, positions):
+        self.columns = columns
+        self.offsets = dict(zip(users, zip(offsets, offsets[1:])))
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def row(self, position):
+        return tuple(self.columns[column][position] for column in COLUMNS)
+
+    def rows(self):
+        return [self.row(position) for position in range(len(self))]
+
+    def user_rows(self, user_id):
+        start, end = self.offsets.get(user_id, (0, 0))
+        return [self.row(position) for position in self.positions[start:end]]
+
+
+def decode_segment(data, checksum=None):
+    """
+    Decodifica os bytes de um segmento, conferindo a soma de verificação das linhas com a
+    gravada no próprio segmento e, se informada, com `checksum` (a do catálogo).
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()} # Confere o CRC de cada membro
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as exc:
+        raise ArchiveIntegrityError(f'Segmento ilegível: {exc}')
+
+    try:
+        meta = json.loads(members['meta.json'])
+        if meta['format'] != FORMAT_VERSION:
+            raise ArchiveIntegrityError(f"Formato de segmento não suportado: {meta['format']}")
+        columns = {
+            'id': _unpack(members['id'], delta=True),
+            'sender_id': _unpack(members['sender_id']),
+            'receiver_id': _unpack(members['receiver_id']),
+            'amount': [Decimal(cents).scaleb(-2) for cents in _unpack(members['amount'])],
+            'transaction_type': [TRANSACTION_TYPES[code] for code in _unpack(members['transaction_type'], 'B')],
+            'timestamp': [EPOCH + timedelta(microseconds=value) for value in _unpack(members['timestamp'], delta=True)],
+        }
+        segment = Segment(
+            columns, _unpack(members['index/users']), _unpack(members['index/offsets']), _unpack(members['index/positions'])
+        )
+    except (KeyError, ValueError, IndexError) as exc:
+        raise ArchiveIntegrityError(f'Segmento corrompido: {exc!r}')
+    actual = rows_checksum(segment.rows())
+    if len(segment) != meta['rows'] or actual != meta['checksum'] or (checksum and actual != checksum):
+        raise ArchiveIntegrityError(f'Soma de verificação não confere: {actual}')
+    return segment
+
+
+def write_segment(writer, month):
+    """
+    Grava o segmento de `writer` (um SegmentWriter) como um novo segmento de `month` e retorna
+    seu caminho relativo. O arquivo é gravado com outro nome, sincronizado com o disco e então
+    renomeado, de modo que um segmento nunca fica pela metade.
+    """
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'transactions-{month:%Y%m}-{uuid.uuid4().hex[:12]}{SEGMENT_SUFFIX}'
+    temporary = directory / f'{name}.tmp'
+    try:
+        with open(temporary, 'wb') as output:
+            writer.finish(output)
+            output.flush()
+            os.fsync(output.fileno())
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    os.replace(temporary, directory / name)
+    return name
+
+
+def read_segment(path, checksum=None):
+    """
+    Lê e decodifica um segmento do disco, sem passar pelo cache.
+    """
+    try:
+        data = (archive_dir() / path).read_bytes()
+    except OSError as exc:
+        raise ArchiveIntegrityError(f'Segmento {path} indisponível: {exc}')
+    return decode_segment(data, checksum)
+
+
+def iter_segment(path, checksum=None, batch_size=5000):
+    """
+    Lê as linhas de um segmento do disco em lotes de até `batch_size`, sem decodificá-lo por
+    inteiro. Ao fim, confere a soma de verificação (a gravada no segmento e, se informada,
+    `checksum`) e o CRC de cada membro, levantando ArchiveIntegrityError se algo não conferir:
+    os lotes só devem ser considerados válidos depois de percorridos todos.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    try:
+        with zipfile.ZipFile(archive_dir() / path) as archive:
+            meta = json.loads(archive.read('meta.json'))
+            if meta['format'] != FORMAT_VERSION:
+                raise ArchiveIntegrityError(f"Formato de segmento não suportado: {meta['format']}")
+            members = {name: archive.open(name) for name in COLUMN_MEMBERS}
+            previous = dict.fromkeys(COLUMN_MEMBERS, 0)
+            while True:
+                columns = {}
+                for name, (typecode, delta) in COLUMN_MEMBERS.items():
+                    data = members[name].read(batch_size * array(typecode).itemsize)
+                    columns[name] = _unpack(data, typecode, delta, previous[name])
+                    if columns[name]:
+                        previous[name] = columns[name][-1]
+                if len({len(values) for values in columns.values()}) != 1:
+                    raise ArchiveIntegrityError(f'Segmento {path} corrompido: colunas de tamanhos diferentes.')
+                if not columns['id']:
+                    break
+                rows = list(zip(
+                    columns['id'], columns['sender_id'], columns['receiver_id'],
+                    [Decimal(cents).scaleb(-2) for cents in columns['amount']],
+                    [TRANSACTION_TYPES[code] for code in columns['transaction_type']],
+                    [EPOCH + timedelta(microseconds=value) for value in columns['timestamp']],
+                ))
+                _update_checksum(digest, rows)
+                count += len(rows)
+                yield rows
+            for member in members.values():
+                member.close()
+            for name in INDEX_MEMBERS: # Lidos até o fim apenas para conferir o CRC
+                with archive.open(name) as member:
+                    while member.read(1 << 20):
+                        pass
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as exc:
+        raise ArchiveIntegrityError(f'Segmento {path} ilegível: {exc}')
+    except (KeyError, ValueError, IndexError) as exc:
+        raise ArchiveIntegrityError(f'Segmento {path} corrompido: {exc!r}')
+    actual = digest.hexdigest()
+    if count != meta['rows'] or actual != meta['checksum'] or (checksum and actual != checksum):
+        raise ArchiveIntegrityError(f'Soma de verificação não confere: {actual}')
+
+
+def verify_segment(path, checksum=None, batch_size=5000):
+    """
+    Confere um segmento do disco lendo-o em lotes (ver iter_segment). Retorna a quantidade de linhas.
+    """
+    return sum(len(rows) for rows in iter_segment(path, checksum, batch_size))
+
+
+_segment_cache = OrderedDict()
+_segment_cache_lock = threading.Lock()
+
+
+def load_segment(path, checksum):
+    """
+    Retorna o segmento decodificado, mantendo os últimos SEGMENT_CACHE_SIZE em memória.
+    """
+    key = (str(archive_dir()), path, checksum)
+    with _segment_cache_lock:
+        segment = _segment_cache.get(key)
+        if segment is not None:
+            _segment_cache.move_to_end(key)
+            return segment
+    segment = read_segment(path, checksum)
+    with _segment_cache_lock:
+        _segment_cache[key] = segment
+        while len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return segment
+
+
+_listing = {'mtime': None, 'has_segments': False}
+
+
+def has_segments():
+    """
+    Indica se há segmentos no diretório do arquivo morto, sem consultar o banco: o resultado
+    é reaproveitado enquanto a data de modificação do diretório não mudar. Permite que as
+    leituras do histórico ignorem o arquivo morto quando ele está vazio.
+    """
+    directory = archive_dir()
+    try:
+        mtime = (str(directory), directory.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return False
+    if _listing['mtime'] != mtime:
+        _listing['has_segments'] = any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(directory))
+        _listing['mtime'] = mtime
+    return _listing['has_segments']
+
+
+# --- Leitura do histórico de um usuário ---
+
+FIELD_ALIASES = {'pk': 'id', 'sender': 'sender_id', 'receiver': 'receiver_id'}
+FIELDS = COLUMNS + ('sender__username', 'receiver__username') # Campos das linhas arquivadas
+
+
+def _text(function):
+    return lambda value, expected: value is not None and function(value, expected)
+
+
+LOOKUPS = {
+    'exact': lambda value, expected: value == expected,
+    'lt': lambda value, expected: value < expected,
+    'lte': lambda value, expected: value <= expected,
+    'gt': lambda value, expected: value > expected,
+    'gte': lambda value, expected: value >= expected,
+    'in': lambda value, expected: value in expected,
+    'range': lambda value, expected: expected[0] <= value <= expected[1],
+    'isnull': lambda value, expected: (value is None) == bool(expected),
+    'iexact': _text(lambda value, expected: value.lower() == expected.lower()),
+    'contains': _text(lambda value, expected: expected in value),
+    'icontains': _text(lambda value, expected: expected.lower() in value.lower()),
+    'startswith': _text(lambda value, expected: value.startswith(expected)),
+    'istartswith': _text(lambda value, expected: value.lower().startswith(expected.lower())),
+    'endswith': _text(lambda value, expected: value.endswith(expected)),
+    'iendswith': _text(lambda value, expected: value.lower().endswith(expected.lower())),
+}
+
+
+def resolve_field(name):
+    """
+    Nome, nas linhas arquivadas, de um campo de values() ou order_by(). Levanta ValueError
+    para os demais campos, que o arquivo morto não guarda.
+    """
+    field = FIELD_ALIASES.get(name, name)
+    if field not in FIELDS:
+        raise ValueError(f"Campo não suportado no arquivo morto: '{name}'. Use um de: {', '.join(FIELDS)}.")
+    return field
+
+
+def _resolve(lookup, expected):
+    """
+    Converte um filtro (lookup, valor) em (campo, comparação, valor). Levanta ValueError para
+    campos e lookups que o arquivo morto não suporta e TypeError para valores que são
+    expressões (ex: F()), que não podem ser avaliadas sobre as linhas arquivadas.
+    """
+    parts = lookup.split('__')
+    operator = parts.pop() if len(parts) > 1 and parts[-1] in LOOKUPS else 'exact'
+    try:
+        field = resolve_field('__'.join(parts))
+    except ValueError:
+        raise ValueError(f"Filtro não suportado no arquivo morto: '{lookup}'.")
+    if hasattr(expected, 'resolve_expression'):
+        raise TypeError(f"Expressões não são suportadas nos filtros do arquivo morto: '{lookup}'.")
+    if operator in ('in', 'range'):
+        expected = [getattr(value, 'pk', value) for value in expected]
+    else:
+        expected = getattr(expected, 'pk', expected)
+    return field, LOOKUPS[operator], expected
+
+
+def _validate(node):
+    if isinstance(node, Q):
+        for child in node.children:
+            _validate(child)
+    else:
+        _resolve(*node)
+
+
+def _matches(row, node):
+    if isinstance(node, Q):
+        results = (_matches(row, child) for child in node.children)
+        matched = all(results) if node.connector == Q.AND else any(results)
+        return not matched if node.negated else matched
+    field, compare, expected = _resolve(*node)
+    return compare(row[field], expected)
+
+
+def _tightest(bounds, side):
+    """
+    O limite mais estreito entre `bounds` (pares (valor, inclusivo)) do lado 'lower' ou 'upper'.
+    """
+    if side == 'lower':
+        return max(bounds, key=lambda bound: (bound[0], not bound[1]))
+    return min(bounds, key=lambda bound: (bound[0], bound[1]))
+
+
+def _loosest(bounds, side):
+    return _tightest(bounds, 'upper' if side == 'lower' else 'lower')
+
+
+def _timestamp_bounds(node):
+    """
+    Limites de timestamp implicados por uma condição (Q ou par (lookup, valor)), como
+    (inferior, superior), cada um um par (valor, inclusivo) ou None. Em uma conjunção vale o
+    limite mais estreito dos filhos, e em uma disjunção o mais largo (se todos os filhos
+    tiverem um). Condições negadas ou sobre outros campos não limitam. Usados para ignorar
+    os segmentos fora do período, inclusive com a condição de keyset da paginação,
+    `timestamp < t OU (timestamp = t E id < i)`, que limita a timestamp <= t.
+    """
+    if not isinstance(node, Q):
+        lookup, value = node
+        if lookup == 'timestamp__range':
+            return (value[0], True), (value[1], True)
+        bounds = {
+            'timestamp': ((value, True), (value, True)),
+            'timestamp__exact': ((value, True), (value, True)),
+            'timestamp__gt': ((value, False), None),
+            'timestamp__gte': ((value, True), None),
+            'timestamp__lt': (None, (value, False)),
+            'timestamp__lte': (None, (value, True)),
+        }
+        return bounds.get(lookup, (None, None))
+    if node.negated or not node.children:
+        return None, None
+    children = [_timestamp_bounds(child) for child in node.children]
+    result = []
+    for index, side in enumerate(('lower', 'upper')):
+        bounds = [child[index] for child in children]
+        if node.connector == Q.AND:
+            bounds = [bound for bound in bounds if bound is not None]
+            result.append(_tightest(bounds, side) if bounds else None)
+        else:
+            result.append(None if None in bounds else _loosest(bounds, side))
+    return tuple(result)
+
+
+def _is_timestamp_range(node):
+    """
+    Indica se a condição é apenas uma conjunção de limites de timestamp, isto é, se equivale
+    exatamente aos limites de _timestamp_bounds.
+    """
+    if not isinstance(node, Q):
+        return _timestamp_bounds(node) != (None, None)
+    return not node.negated and node.connector == Q.AND and all(_is_timestamp_range(child) for child in node.children)
+
+
+def _lookups(node):
+    if isinstance(node, Q):
+        for child in node.children:
+            yield from _lookups(child)
+    else:
+        yield node[0]
+
+
+def _within(first, last, lower, upper):
+    """
+    Indica se o período [first, last] está inteiramente dentro dos limites.
+    """
+    if lower is not None and not (first > lower[0] or (lower[1] and first == lower[0])):
+        return False
+    return upper is None or last < upper[0] or (upper[1] and last == upper[0])
+
+
+class ArchivedTransactions:
+    """
+    As transações arquivadas de um usuário, com o subconjunto da API de QuerySet usado por
+    TransactionHistory: filter(), exclude(), values() e order_by() (sobre os campos do
+    modelo e os nomes de usuário, ver FIELDS e LOOKUPS), count() e rows(). As condições são
+    avaliadas em Python sobre as linhas do usuário nos segmentos, localizadas pelo índice por
+    usuário. Campos, lookups e expressões não suportados são recusados já na chamada
+    (ValueError ou TypeError), e não durante a leitura.
+
+    O catálogo (ArchiveSegmentUser) guarda, por usuário e segmento, a quantidade e o período
+    das suas transações. Os segmentos fora do período pedido não são lidos; count() soma a
+    quantidade dos que estão inteiramente dentro dele e só lê os das bordas; e rows(limit),
+    em ordem de timestamp, lê os segmentos a partir da ponta pedida e para assim que os
+    seguintes não podem mais entrar entre as `limit` primeiras linhas. O custo de uma página
+    não cresce, então, com o tamanho do arquivo morto.
+    """
+    def __init__(self, user_id, conditions=(), fields=None, ordering=('-timestamp', '-id')):
+        self.user_id = user_id
+        self.conditions = tuple(conditions)
+        self.fields = fields
+        self.ordering = tuple(ordering)
+
+    def _clone(self, **changes):
+        state = {'conditions': self.conditions, 'fields': self.fields, 'ordering': self.ordering, **changes}
+        return ArchivedTransactions(self.user_id, **state)
+
+    def filter(self, *args, **kwargs):
+        condition = Q(*args, **kwargs)
+        _validate(condition)
+        return self._clone(conditions=self.conditions + (condition,))
+
+    def exclude(self, *args, **kwargs):
+        condition = Q(*args, **kwargs)
+        _validate(condition)
+        return self._clone(conditions=self.conditions + (~condition,))
+
+    def values(self, *fields):
+        for field in fields:
+            resolve_field(field)
+        return self._clone(fields=fields or None)
+
+    def order_by(self, *fields):
+        for field in fields:
+            resolve_field(field.lstrip('-'))
+        return self._clone(ordering=fields)
+
+    @property
+    def _condition(self):
+        return Q(*self.conditions)
+
+    @property
+    def _filters_or_sorts_by_username(self):
+        fields = list(_lookups(self._condition)) + [field.lstrip('-') for field in self.ordering]
+        return any('username' in field.split('__') for field in fields)
+
+    def _segments(self):
+        """
+        Os segmentos em que o usuário tem transações no período pedido, como tuplas
+        (caminho, soma de verificação, linhas do usuário, primeira e última transação dele).
+        """
+        lower, upper = _timestamp_bounds(self._condition)
+        entries = ArchiveSegmentUser.objects.filter(user_id=self.user_id)
+        if lower is not None:
+            entries = entries.filter(**{'last_timestamp__gte' if lower[1] else 'last_timestamp__gt': lower[0]})
+        if upper is not None:
+            entries = entries.filter(**{'first_timestamp__lte' if upper[1] else 'first_timestamp__lt': upper[0]})
+        return list(entries.values_list(
+            'segment__path', 'segment__checksum', 'row_count', 'first_timestamp', 'last_timestamp'
+        ))
+
+    def count(self):
+        condition = self._condition
+        segments = self._segments()
+        if not _is_timestamp_range(condition):
+            return sum(len(self._matching(segment)) for segment in segments)
+        lower, upper = _timestamp_bounds(condition)
+        total = 0
+        for segment in segments:
+            if _within(segment[3], segment[4], lower, upper):
+                total += segment[2] # Sem ler o segmento
+            else:
+                total += len(self._matching(segment))
+        return total
+
+    def _matching(self, segment):
+        """
+        As linhas do usuário no segmento que atendem às condições, como dicionários.
+        """
+        path, checksum = segment[:2]
+        rows = [dict(zip(COLUMNS, row)) for row in load_segment(path, checksum).user_rows(self.user_id)]
+        if self._filters_or_sorts_by_username:
+            self._add_usernames(rows)
+        return [row for row in rows if all(_matches(row, condition) for condition in self.conditions)]
+
+    def _add_usernames(self, rows):
+        if not rows:
+            return
+        user_ids = {row['sender_id'] for row in rows} | {row['receiver_id'] for row in rows}
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        for row in rows:
+            row['sender__username'] = usernames.get(row['sender_id'])
+            row['receiver__username'] = usernames.get(row['receiver_id'])
+
+    def _sort(self, rows):
+        for field in reversed(self.ordering):
+            name = field.lstrip('-')
+            rows.sort(key=lambda row: row[FIELD_ALIASES.get(name, name)], reverse=field.startswith('-'))
+
+    def rows(self, limit=None):
+        """
+        As linhas que atendem às condições, na ordem pedida, como dicionários de values() ou,
+        sem values(), instâncias (não salvas) de Transaction.
+        """
+        if limit == 0:
+            return []
+        segments = self._segments()
+        first = self.ordering[0] if self.ordering else None
+        by_timestamp = limit is not None and first is not None and first.lstrip('-') == 'timestamp'
+        descending = by_timestamp and first.startswith('-')
+        if by_timestamp:
+            # A partir da ponta pedida: os mais recentes primeiro (pela última transação) ou os mais antigos
+            segments.sort(key=lambda segment: segment[4] if descending else segment[3], reverse=descending)
+
+        rows = []
+        for segment in segments:
+            if by_timestamp and len(rows) >= limit:
+                self._sort(rows)
+                del rows[limit:]
+                edge = rows[-1]['timestamp']
+                if segment[4] < edge if descending else segment[3] > edge:
+                    break # Nenhuma linha deste segmento (nem dos seguintes) entra antes da última
+            rows.extend(self._matching(segment))
+        self._sort(rows)
+        if limit is not None:
+            rows = rows[:limit]
+        if self.fields is None:
+            return [Transaction(**{column: row[column] for column in COLUMNS}) for row in rows]
+        if not self._filters_or_sorts_by_username and any(field.endswith('__username') for field in self.fields):
+            self._add_usernames(rows) # Apenas das linhas devolvidas
+        return [{field: row[FIELD_ALIASES.get(field, field)] for field in self.fields} for row in rows]
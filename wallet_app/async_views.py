@@ -0,0 +1,209 @@
+"""
+Versões assíncronas (ASGI) dos endpoints de saldo, depósito, transferência e listagem.
+
+O DRF não suporta views assíncronas, então estas são views assíncronas do Django que
+reaproveitam as peças do DRF que não acessam o banco (autenticação JWT, serializadores,
+paginação, renderização e parsing). O acesso ao banco usa o ORM assíncrono do Django
+(aget/afirst/acount/async for); depósitos e transferências, que precisam de uma transação
+com bloqueio de linhas, rodam em services via sync_to_async(thread_sensitive=False)
+(ver _run_in_thread).
+As respostas têm o mesmo formato das views síncronas.
+"""
+
+import io
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import metrics, services
+from .authentication import WalletTokenUser, claimed_wallet_id
+from .cache import balance_cache
+from .middleware import measure_authentication
+from .models import Wallet
+from .pagination import TransactionCursorPagination
+from .parsers import FastJSONParser
+from .queries import TransactionHistory
+from .renderers import FastJSONRenderer
+from .serializers import DepositSerializer, TransferSerializer, WalletSerializer, TransactionValuesSerializer
+from .views import accepted_transfer_data, balance_at_data, get_balance_at, get_period_filters
+
+_renderer = FastJSONRenderer()
+_jwt = JWTAuthentication()
+_auth_header = 'Bearer realm="api"'
+
+
+def _json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(_renderer.render(data), status=status_code, content_type='application/json', headers=headers)
+
+
+async def _authenticate(request):
+    """
+    Autentica a requisição pelo token JWT. No modo sem estado (WALLET_STATELESS_JWT) o usuário
+    vem apenas das claims do token; caso contrário, é carregado com o ORM assíncrono.
+    """
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+
+    validated_token = _jwt.get_validated_token(raw_token)
+    if settings.WALLET_STATELESS_JWT:
+        return WalletTokenUser(validated_token)
+
+    user = await User.objects.filter(id=validated_token.get('user_id'), is_active=True).afirst()
+    if user is None:
+        raise exceptions.AuthenticationFailed('Usuário não encontrado ou inativo.', code='user_not_found')
+    return user
+
+
+def _run_in_thread(func, *args):
+    """
+    Executa uma operação síncrona do ORM (ex: services.transfer) fora do loop de eventos,
+    em uma thread do pool. Como essas threads não passam pelos sinais de início/fim de
+    requisição, as conexões velhas ou inutilizáveis são descartadas antes e depois da chamada,
+    respeitando CONN_MAX_AGE.
+    """
+    def call():
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def _parse_body(request):
+    parser_context = {'encoding': request.encoding or settings.DEFAULT_CHARSET}
+    return FastJSONParser().parse(io.BytesIO(request.body), parser_context=parser_context)
+
+
+def async_api_view(method):
+    """
+    Decorador para views assíncronas autenticadas: valida o método HTTP, autentica a
+    requisição e converte exceções do DRF em respostas JSON no mesmo formato do DRF.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != method:
+                return _json_response(
+                    {'detail': f'Método "{request.method}" não é permitido.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED,
+                    headers={'Allow': method}
+                )
+            try:
+                with measure_authentication():
+                    request.user = await _authenticate(request)
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                headers = None
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    headers = {'WWW-Authenticate': _auth_header}
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                return _json_response(data, exc.status_code, headers)
+
+        # csrf_exempt do Django 4.2 não preserva views assíncronas; a autenticação é por token
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view('GET')
+async def wallet_balance(request):
+    """
+    Retorna o saldo da carteira do usuário autenticado, ou, com o parâmetro `at`, o saldo
+    naquele instante.
+    """
+    at = get_balance_at(request.GET)
+    if at is not None:
+        if claimed_wallet_id(request.user) is None and not await Wallet.objects.filter(user_id=request.user.id).aexists():
+            return _json_response({"erro": services.WALLET_NOT_FOUND_ERROR}, status.HTTP_404_NOT_FOUND)
+        return _json_response(await _run_in_thread(balance_at_data, request.user.id, at))
+    balance = await balance_cache.aget_balance(request.user.id)
+    if balance is None:
+        return _json_response({"erro": services.WALLET_NOT_FOUND_ERROR}, status.HTTP_404_NOT_FOUND)
+    return _json_response(WalletSerializer({'balance': balance}).data)
+
+
+@async_api_view('POST')
+async def wallet_deposit(request):
+    """
+    Processa um depósito na carteira do usuário autenticado.
+    """
+    serializer = DepositSerializer(data=_parse_body(request))
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        wallet, _ = await _run_in_thread(services.deposit, request.user.id, serializer.validated_data['amount'])
+    except Wallet.DoesNotExist:
+        metrics.record_failure('deposit', services.WALLET_NOT_FOUND_ERROR)
+        return _json_response({"erro": services.WALLET_NOT_FOUND_ERROR}, status.HTTP_404_NOT_FOUND)
+    metrics.record_operations('deposit', [serializer.validated_data['amount']])
+    return _json_response({"mensagem": "Depósito realizado com sucesso.", "novo_saldo": wallet.total_balance})
+
+
+@async_api_view('POST')
+async def transaction_transfer(request):
+    """
+    Processa uma transferência entre o usuário autenticado e o destinatário informado.
+    """
+    serializer = TransferSerializer(data=_parse_body(request))
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    receiver_username = serializer.validated_data['receiver_username']
+    if request.user.username == receiver_username:
+        metrics.record_failure('transfer', services.SELF_TRANSFER_ERROR)
+        return _json_response({"erro": services.SELF_TRANSFER_ERROR}, status.HTTP_400_BAD_REQUEST)
+
+    receiver_id = await User.objects.filter(username=receiver_username).values_list('id', flat=True).afirst()
+    if receiver_id is None:
+        metrics.record_failure('transfer', services.RECEIVER_NOT_FOUND_ERROR)
+        return _json_response({"erro": services.RECEIVER_NOT_FOUND_ERROR}, status.HTTP_404_NOT_FOUND)
+
+    if settings.WALLET_TRANSFER_MODE == 'queued':
+        pending = await _run_in_thread(
+            services.enqueue_transfer, request.user.id, receiver_id, serializer.validated_data['amount']
+        )
+        return _json_response(accepted_transfer_data(pending), status.HTTP_202_ACCEPTED)
+
+    try:
+        sender_wallet, receiver_wallet, new_transaction = await _run_in_thread(
+            services.transfer, request.user.id, receiver_id, serializer.validated_data['amount']
+        )
+    except services.InsufficientBalanceError:
+        metrics.record_failure('transfer', services.INSUFFICIENT_BALANCE_ERROR)
+        return _json_response({"erro": services.INSUFFICIENT_BALANCE_ERROR}, status.HTTP_400_BAD_REQUEST)
+    except Wallet.DoesNotExist:
+        metrics.record_failure('transfer', services.WALLET_NOT_FOUND_ERROR)
+        return _json_response({"erro": services.WALLET_NOT_FOUND_ERROR}, status.HTTP_404_NOT_FOUND)
+    metrics.record_operations('transfer', [serializer.validated_data['amount']])
+    return _json_response({
+        "mensagem": "Transferência realizada com sucesso.",
+        "id_transacao": new_transaction.id,
+        "novo_saldo_remetente": sender_wallet.total_balance,
+        "novo_saldo_destinatario": receiver_wallet.total_balance
+    })
+
+
+@async_api_view('GET')
+async def transaction_list(request):
+    """
+    Lista as transações do usuário autenticado, com os mesmos filtros e paginação por cursor
+    de TransactionListView.
+    """
+    drf_request = Request(request)
+    queryset = TransactionHistory(request.user.id).filter(**get_period_filters(drf_request.query_params))
+    queryset = queryset.values(*TransactionValuesSerializer.values_fields)
+
+    paginator = TransactionCursorPagination()
+    rows = await paginator.apaginate_queryset(queryset, drf_request)
+    return _json_response(paginator.get_paginated_data(TransactionValuesSerializer(rows, many=True).data))
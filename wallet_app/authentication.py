@@ -0,0 +1,50 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from .middleware import measure_authentication
+
+
+class WalletTokenUser(TokenUser):
+    """
+    Usuário sem estado construído a partir das claims assinadas do token de acesso
+    (user_id, username e wallet_id), sem nenhuma consulta ao banco.
+    """
+    @cached_property
+    def wallet_id(self):
+        return self.token.get('wallet_id')
+
+
+def claimed_wallet_id(user):
+    """
+    Id da carteira nas claims do token do usuário sem estado, que dispensa consultar a
+    existência da carteira. None para um User carregado do banco ou um token sem carteira.
+    """
+    return user.wallet_id if isinstance(user, WalletTokenUser) else None
+
+
+class TimedAuthenticationMixin:
+    """
+    Mede authenticate() como uma fase própria da requisição (entrada `auth` do cabeçalho
+    Server-Timing, ver middleware.RequestTimingMiddleware).
+    """
+    def authenticate(self, request):
+        with measure_authentication():
+            return super().authenticate(request)
+
+
+class WalletJWTAuthentication(TimedAuthenticationMixin, JWTAuthentication):
+    """
+    Autenticação JWT padrão: valida o token e carrega o usuário de auth_user.
+    """
+
+
+class StatelessWalletJWTAuthentication(TimedAuthenticationMixin, JWTStatelessUserAuthentication):
+    """
+    Autenticação JWT opcional que confia nas claims assinadas do token em vez de carregar
+    a linha de auth_user a cada requisição. As views trabalham apenas com os ids do token,
+    então uma consulta de saldo autenticada custa no máximo uma consulta ao banco.
+
+    Como o usuário não é relido do banco, desativações e exclusões só passam a valer quando
+    o token de acesso expira (ACCESS_TOKEN_LIFETIME).
+    """
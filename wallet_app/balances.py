@@ -0,0 +1,152 @@
+"""
+Saldo após cada transação (Transaction.sender_balance_after e receiver_balance_after).
+
+Os services gravam, na mesma transação de banco que altera as carteiras, o saldo total
+(carteira mais shards) do remetente e do destinatário logo após cada transação. Assim, o
+saldo em uma data (balance_at) é o da última transação do usuário antes dela: uma busca nos
+índices (sender, -timestamp, -id) e (receiver, -timestamp, -id), sem somar o histórico.
+
+O saldo fica nulo quando não é conhecido no momento da escrita: nos créditos em carteiras
+quentes (feitos em um shard, sem bloquear a carteira nem os demais shards) e nas linhas
+anteriores à migração 0010. Nesses casos, balance_at parte do último saldo conhecido e soma as
+transações seguintes; o comando backfill_balances (ver backfill) preenche os nulos.
+"""
+
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q, Sum
+
+from . import archive
+from .models import ArchiveSegmentUser, Transaction, Wallet, WalletShard
+from .queries import TransactionHistory
+
+ROW_FIELDS = ('id', 'timestamp', 'sender_id', 'receiver_id', 'amount', 'sender_balance_after', 'receiver_balance_after')
+
+
+def change(row, user_id):
+    """
+    Variação do saldo do usuário causada pela transação (depósitos têm remetente == destinatário).
+    """
+    return row['amount'] if row['receiver_id'] == user_id else -row['amount']
+
+
+def balance_after(row, user_id):
+    return row['receiver_balance_after'] if row['receiver_id'] == user_id else row['sender_balance_after']
+
+
+def balance_at(user_id, before):
+    """
+    Saldo do usuário imediatamente antes de `before` (datetime com fuso): o saldo gravado na
+    sua última transação anterior a `before`, ou zero se não houver nenhuma.
+    """
+    # Apenas a tabela: o arquivo morto não guarda os saldos
+    history = TransactionHistory(user_id)
+    history = TransactionHistory(user_id, branches=history.branches).filter(timestamp__lt=before)
+    latest = next(iter(history.values(*ROW_FIELDS)[:1]), None)
+    if latest is not None and balance_after(latest, user_id) is not None:
+        return balance_after(latest, user_id)
+
+    # Saldo não gravado: parte do último saldo conhecido e soma as transações seguintes
+    anchor = None
+    if latest is not None:
+        known = (Q(sender_id=user_id, sender_balance_after__isnull=False)
+                 | Q(receiver_id=user_id, receiver_balance_after__isnull=False))
+        anchor = next(iter(history.filter(known).values(*ROW_FIELDS)[:1]), None)
+    if anchor is None:
+        # Nenhum saldo conhecido: todo o histórico, inclusive o arquivado
+        balance = Decimal('0.00')
+        rows = TransactionHistory(user_id).filter(timestamp__lt=before).values(*archive.COLUMNS)
+    else:
+        balance = balance_after(anchor, user_id)
+        rows = history.filter(
+            Q(timestamp__gt=anchor['timestamp']) | Q(timestamp=anchor['timestamp'], id__gt=anchor['id'])
+        ).values(*ROW_FIELDS)
+    return balance + sum((change(row, user_id) for row in rows.iterator()), Decimal('0.00'))
+
+
+def backfill(lower, upper, batch_size=5000):
+    """
+    Recalcula o saldo após cada transação dos usuários com id em [lower, upper), percorrendo
+    suas transações em ordem (timestamp, id) com um cursor do lado do servidor, a partir dos
+    totais do arquivo morto. Grava, em lotes de `batch_size`, apenas os saldos que faltam ou
+    diferem. Retorna a tupla (saldos gravados, usuários cujo saldo final não bate com a carteira).
+
+    Deve ser chamada dentro de transaction.atomic(). As carteiras do intervalo e seus shards são
+    bloqueados antes da leitura, como em rollups.rebuild, de modo que nenhuma transação desses
+    usuários fica em andamento durante o recálculo. Cada lado de uma transação é gravado apenas
+    pelo intervalo do seu usuário, e as linhas de cada lote são bloqueadas na ordem da leitura:
+    intervalos recalculados em paralelo não sobrescrevem nem aguardam em ciclo um ao outro.
+    """
+    wallets = list(
+        Wallet.objects.select_for_update().filter(user_id__gte=lower, user_id__lt=upper).order_by('id')
+    )
+    current = {wallet.user_id: wallet.balance for wallet in wallets}
+    owners = {wallet.id: wallet.user_id for wallet in wallets}
+    shards = (
+        WalletShard.objects.select_for_update().filter(wallet_id__in=owners)
+        .order_by('wallet_id', 'index').values_list('wallet_id', 'balance')
+    )
+    for wallet_id, balance in shards:
+        current[owners[wallet_id]] += balance
+
+    running = {}
+    archived = (
+        ArchiveSegmentUser.objects.filter(user_id__gte=lower, user_id__lt=upper)
+        .values('user_id').annotate(received=Sum('received'), sent=Sum('sent')).order_by()
+    )
+    for row in archived:
+        running[row['user_id']] = row['received'] - row['sent']
+
+    rows = (
+        Transaction.objects.filter(
+            Q(sender_id__gte=lower, sender_id__lt=upper) | Q(receiver_id__gte=lower, receiver_id__lt=upper)
+        ).order_by('timestamp', 'id').values(*ROW_FIELDS)
+    )
+    changed = {'sender_balance_after': [], 'receiver_balance_after': []}
+    written = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        # O destinatário primeiro: em um depósito, o remetente apenas repete o saldo dele
+        for field, user_id in (('receiver_balance_after', row['receiver_id']), ('sender_balance_after', row['sender_id'])):
+            if not lower <= user_id < upper:
+                continue
+            if field == 'receiver_balance_after' or row['sender_id'] != row['receiver_id']:
+                running[user_id] = running.get(user_id, Decimal('0.00')) + change(row, user_id)
+            if row[field] != running[user_id]:
+                changed[field].append((row['id'], row['timestamp'], running[user_id]))
+        if len(changed['sender_balance_after']) + len(changed['receiver_balance_after']) >= batch_size:
+            written += _write(changed)
+    written += _write(changed)
+
+    mismatched = sorted(
+        user_id for user_id, balance in current.items() if running.get(user_id, Decimal('0.00')) != balance
+    )
+    return written, mismatched
+
+
+def _write(changed):
+    """
+    Grava e esvazia os saldos acumulados por backfill, {campo: [(id, timestamp, saldo)]},
+    bloqueando antes as linhas em ordem (timestamp, id). Um UPDATE ... FROM (VALUES ...) por
+    campo, pela chave primária (id, timestamp) da tabela particionada.
+    Retorna quantos saldos foram gravados.
+    """
+    ids = {row[0] for rows in changed.values() for row in rows}
+    if not ids:
+        return 0
+    list(Transaction.objects.select_for_update().filter(id__in=ids).order_by('timestamp', 'id').values_list('id', flat=True))
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    written = 0
+    with connection.cursor() as cursor:
+        for field, rows in changed.items():
+            if not rows:
+                continue
+            cursor.execute(
+                f"UPDATE {table} SET {field} = v.balance "
+                f"FROM (VALUES {', '.join(['(%s, %s::timestamptz, %s::numeric)'] * len(rows))}) AS v(id, timestamp, balance) "
+                f"WHERE {table}.id = v.id AND {table}.timestamp = v.timestamp",
+                [value for row in rows for value in row],
+            )
+            written += len(rows)
+            rows.clear()
+    return written
@@ -0,0 +1,175 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Wallet, WalletShard
+
+
+class BalanceCache:
+    """
+    Cache de leitura do saldo das carteiras, sobre o framework de cache do Django, com chave
+    pelo id do usuário.
+
+    O backend precisa ser compartilhado entre os processos (ex: Redis ou Memcached): as escritas
+    feitas por um worker precisam ser vistas pelos demais. Com um backend local ao processo
+    (LocMem), o cache fica desativado e o saldo é sempre lido do banco, salvo com
+    WALLET_BALANCE_CACHE_ALLOW_LOCAL (apenas para um único processo).
+
+    Cada entrada guarda o par (versão, saldo), onde a versão é a coluna Wallet.version,
+    incrementada a cada alteração de saldo sob o bloqueio da linha. Uma escrita só é
+    aceita se sua versão for maior que a da entrada atual, de modo que um valor antigo
+    (de uma leitura lenta ou de um callback on_commit fora de ordem) nunca sobrescreve
+    um mais novo. A comparação e a escrita são feitas sob um bloqueio curto obtido com
+    cache.add(), que é atômico nos backends do Django.
+
+    Carteiras quentes (Wallet.shard_count > 0) não têm o saldo em cache: seus créditos vão
+    para os shards sem alterar a versão. Para elas a entrada guarda (versão, None), que as
+    leituras tratam como ausência de cache.
+    """
+    key_prefix = 'wallet:balance'
+    lock_timeout = 2 # segundos; libera o bloqueio caso o processo que o detém morra
+    lock_attempts = 20
+    lock_wait = 0.001
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias or getattr(settings, 'WALLET_BALANCE_CACHE_ALIAS', 'default')
+        self.timeout = timeout if timeout is not None else getattr(settings, 'WALLET_BALANCE_CACHE_TIMEOUT', 300)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return not isinstance(self.cache, LocMemCache) or getattr(settings, 'WALLET_BALANCE_CACHE_ALLOW_LOCAL', False)
+
+    def key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        Retorna os contadores de acertos e falhas deste processo.
+        """
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_balance(self, user_id):
+        """
+        Retorna o saldo da carteira do usuário, consultando o banco apenas em caso de falha
+        no cache. Retorna None se o usuário não possuir carteira.
+        """
+        if not self.enabled:
+            return self.load_balance(user_id)[1]
+        entry = self.cache.get(self.key(user_id))
+        if entry is not None and entry[1] is not None:
+            self._count(hit=True)
+            return entry[1]
+
+        self._count(hit=False)
+        version, balance, sharded = self.load_balance(user_id)
+        if version is not None:
+            self.store(user_id, version, None if sharded else balance)
+        return balance
+
+    def load_balance(self, user_id):
+        """
+        Lê do banco a tupla (versão, saldo com os shards, carteira quente), ou
+        (None, None, False) se o usuário não possuir carteira.
+        """
+        row = Wallet.objects.filter(user_id=user_id).values_list('version', 'balance', 'shard_count').first()
+        if row is None:
+            return None, None, False
+        version, balance, shard_count = row
+        if shard_count:
+            shards = WalletShard.objects.filter(wallet__user_id=user_id).aggregate(total=Sum('balance'))
+            balance += shards['total'] or 0
+        return version, balance, bool(shard_count)
+
+    async def aget_balance(self, user_id):
+        """
+        Versão assíncrona de get_balance(), usando a API assíncrona de cache e o ORM assíncrono.
+        """
+        if not self.enabled:
+            return (await self.aload_balance(user_id))[1]
+        entry = await self.cache.aget(self.key(user_id))
+        if entry is not None and entry[1] is not None:
+            self._count(hit=True)
+            return entry[1]
+
+        self._count(hit=False)
+        version, balance, sharded = await self.aload_balance(user_id)
+        if version is not None:
+            await sync_to_async(self.store, thread_sensitive=False)(user_id, version, None if sharded else balance)
+        return balance
+
+    async def aload_balance(self, user_id):
+        """
+        Versão assíncrona de load_balance().
+        """
+        row = await Wallet.objects.filter(user_id=user_id).values_list('version', 'balance', 'shard_count').afirst()
+        if row is None:
+            return None, None, False
+        version, balance, shard_count = row
+        if shard_count:
+            shards = await WalletShard.objects.filter(wallet__user_id=user_id).aaggregate(total=Sum('balance'))
+            balance += shards['total'] or 0
+        return version, balance, bool(shard_count)
+
+    def store(self, user_id, version, balance):
+        """
+        Grava (versão, saldo) no cache se a versão for mais nova que a armazenada
+        (saldo None para carteiras quentes).
+        Se o bloqueio não puder ser obtido, a escrita é abandonada, sem tocar na entrada, que
+        o detentor do bloqueio pode ter acabado de gravar; ela expira em no máximo `timeout`.
+        """
+        if not self.enabled:
+            return False
+        key = self.key(user_id)
+        lock_key = f'{key}:lock'
+        for _ in range(self.lock_attempts):
+            if self.cache.add(lock_key, 1, self.lock_timeout):
+                break
+            time.sleep(self.lock_wait)
+        else:
+            return False
+
+        try:
+            current = self.cache.get(key)
+            if current is not None and current[0] >= version:
+                return False
+            self.cache.set(key, (version, balance), self.timeout)
+            return True
+        finally:
+            self.cache.delete(lock_key)
+
+    def store_on_commit(self, wallet):
+        """
+        Agenda a escrita do saldo de `wallet` para quando a transação atual for confirmada.
+        """
+        user_id, version = wallet.user_id, wallet.version
+        balance = None if wallet.shard_count else wallet.balance
+        transaction.on_commit(lambda: self.store(user_id, version, balance))
+
+
+balance_cache = BalanceCache()
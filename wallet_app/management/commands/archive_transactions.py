@@ -0,0 +1,131 @@
+import time
+from itertools import islice
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from wallet_app import archive, partitions
+from wallet_app.models import ArchiveSegment, ArchiveSegmentUser, Transaction
+
+
+class Command(BaseCommand):
+    help = ('Move as transações anteriores a uma data para o arquivo morto: segmentos comprimidos, '
+            'um por mês, no diretório WALLET_ARCHIVE_DIR. As listagens e exportações continuam '
+            'incluindo essas transações. Com --verify, confere as somas de verificação dos segmentos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', metavar='AAAA-MM-DD',
+                            help='Arquiva as transações anteriores a esta data (no fuso horário do projeto).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Linhas lidas, gravadas no segmento e removidas da tabela por vez.')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas mostra o que seria arquivado.')
+        parser.add_argument('--verify', action='store_true', help='Confere todos os segmentos do arquivo morto.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+        if not options['before']:
+            raise CommandError('Informe --before AAAA-MM-DD (ou --verify).')
+        try:
+            before = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f"Data inválida: '{options['before']}'. Use o formato AAAA-MM-DD.")
+
+        months = Transaction.objects.filter(timestamp__lt=before).datetimes('timestamp', 'month', tzinfo=dt_timezone.utc)
+        total = 0
+        for month in months:
+            start, end = month, min(partitions.add_months(month, 1), before)
+            if options['dry_run']:
+                count = Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end).count()
+                self.stdout.write(f'{month:%Y-%m}: {count} transações seriam arquivadas')
+                continue
+            started = time.perf_counter()
+            segment = self.archive_month(month, start, end, options['batch_size'])
+            if segment is None:
+                continue # As linhas do mês saíram da tabela desde a listagem dos meses
+            total += segment.row_count
+            self.stdout.write(f'{month:%Y-%m}: {segment.row_count} transações em {segment.path} '
+                              f'({time.perf_counter() - started:.1f}s)')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{total} transações arquivadas.'))
+
+    def archive_month(self, month, start, end, batch_size):
+        """
+        Arquiva as transações de [start, end): grava e confere o segmento e então, em uma
+        única transação, registra o segmento no catálogo e remove as linhas da tabela.
+        Se algo falhar, o arquivo do segmento é apagado e a tabela fica como estava.
+
+        As linhas são lidas com um cursor do lado do servidor e gravadas no segmento em lotes
+        de `batch_size`; a conferência e a remoção também percorrem o segmento em lotes, de
+        modo que o mês nunca fica inteiro em memória.
+        """
+        rows = (
+            Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp', 'id').values_list(*archive.COLUMNS).iterator(chunk_size=batch_size)
+        )
+        writer = archive.SegmentWriter()
+        totals = {}
+        try:
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                writer.write(batch)
+                self.add_user_totals(totals, batch)
+            if not writer.row_count:
+                return None
+            path = archive.write_segment(writer, month)
+        finally:
+            writer.close()
+
+        try:
+            # Relê o que foi gravado: as linhas precisam voltar exatamente iguais
+            archive.verify_segment(path, writer.checksum, batch_size)
+            with transaction.atomic():
+                segment = ArchiveSegment.objects.create(
+                    path=path, first_timestamp=writer.first_timestamp, last_timestamp=writer.last_timestamp,
+                    row_count=writer.row_count, checksum=writer.checksum,
+                )
+                ArchiveSegmentUser.objects.bulk_create(
+                    (ArchiveSegmentUser(segment=segment, user_id=user_id, **user_totals)
+                     for user_id, user_totals in totals.items()),
+                    batch_size=batch_size,
+                )
+                for batch in archive.iter_segment(path, writer.checksum, batch_size):
+                    Transaction.objects.filter(
+                        timestamp__gte=start, timestamp__lt=end, id__in=[row[0] for row in batch]
+                    ).delete()
+        except BaseException:
+            (archive.archive_dir() / path).unlink()
+            raise
+        return segment
+
+    def add_user_totals(self, totals, rows):
+        """
+        Acumula em `totals`, por usuário: transações, primeira e última (as linhas chegam em
+        ordem de timestamp), total recebido (depósitos e transferências) e total enviado.
+        """
+        for _, sender_id, receiver_id, amount, transaction_type, timestamp in rows:
+            for user_id in {sender_id, receiver_id}:
+                totals.setdefault(user_id, {
+                    'row_count': 0, 'first_timestamp': timestamp, 'received': Decimal('0.00'), 'sent': Decimal('0.00'),
+                })
+                totals[user_id]['row_count'] += 1
+                totals[user_id]['last_timestamp'] = timestamp
+            totals[receiver_id]['received'] += amount
+            if transaction_type == 'TRANSFER':
+                totals[sender_id]['sent'] += amount
+
+    def verify(self):
+        failures = []
+        segments = ArchiveSegment.objects.order_by('first_timestamp')
+        for segment in segments:
+            try:
+                count = archive.verify_segment(segment.path, segment.checksum)
+            except archive.ArchiveIntegrityError as exc:
+                failures.append(f'{segment.path}: {exc}')
+                continue
+            if count != segment.row_count:
+                failures.append(f'{segment.path}: {count} linhas, esperadas {segment.row_count}')
+        if failures:
+            raise CommandError('Segmentos inválidos: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{len(segments)} segmentos conferidos.'))
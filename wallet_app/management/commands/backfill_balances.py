@@ -0,0 +1,75 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from wallet_app import balances
+
+
+def backfill_chunk(task):
+    """
+    Preenche os saldos após cada transação de um intervalo [início, fim) de ids de usuário,
+    em uma única transação.
+    """
+    lower, upper, batch_size = task
+    with transaction.atomic():
+        return balances.backfill(lower, upper, batch_size)
+
+
+def backfill_chunk_in_worker(task):
+    """
+    backfill_chunk em um processo do pool, que fecha a sua conexão ao terminar.
+    """
+    try:
+        return backfill_chunk(task)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Preenche o saldo após cada transação (sender_balance_after, receiver_balance_after) nas '
+            'linhas sem ele: as anteriores à coluna e os créditos em carteiras quentes. Os ids de usuário '
+            'são divididos em intervalos, processados em paralelo por um pool de processos, cada '
+            'intervalo em uma transação que lê as transações em streaming.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Processos em paralelo.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Usuários por intervalo.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Linhas lidas por vez do cursor e saldos gravados por comando UPDATE.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError('Use --workers >= 1, --chunk-size >= 1 e --batch-size >= 1.')
+        bounds = User.objects.aggregate(lower=Min('id'), upper=Max('id'))
+        if bounds['lower'] is None:
+            self.stdout.write('Nenhum usuário.')
+            return
+        chunk_size = options['chunk_size']
+        tasks = [(lower, min(lower + chunk_size, bounds['upper'] + 1), options['batch_size'])
+                 for lower in range(bounds['lower'], bounds['upper'] + 1, chunk_size)]
+
+        started = time.perf_counter()
+        if options['workers'] == 1:
+            results = [backfill_chunk(task) for task in tasks]
+        else:
+            # Os processos filhos abrem suas próprias conexões
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+                results = list(executor.map(backfill_chunk_in_worker, tasks))
+
+        mismatched = [user_id for _, users in results for user_id in users]
+        if mismatched:
+            self.stdout.write(self.style.WARNING(
+                f'{len(mismatched)} carteiras com saldo diferente do histórico (ex: usuários '
+                f'{", ".join(map(str, mismatched[:10]))}); veja queries.ledger_mismatches.'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(written for written, _ in results)} saldos gravados em {len(tasks)} intervalos '
+            f'({time.perf_counter() - started:.1f}s).'
+        ))
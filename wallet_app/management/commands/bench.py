@@ -0,0 +1,220 @@
+import io
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from wallet_app.serializers import WalletTokenObtainPairSerializer
+
+from .seed_data import DEFAULT_PASSWORD
+
+# Máximo de consultas SQL por requisição de cada endpoint; exceder qualquer um faz o comando falhar
+QUERY_BUDGETS = {
+    'register': 3,
+    'token': 2,
+    'balance': 2,
+    'deposit': 7, # Inclui o upsert dos totais diários (ver wallet_app.rollups)
+    'transfer': 9,
+    'list': 4,
+}
+# Endpoints que calculam o hash da senha (PBKDF2) a cada requisição
+PASSWORD_HASHING_ENDPOINTS = ('register', 'token')
+
+
+def percentile(sorted_values, fraction):
+    """
+    Percentil pelo método do posto mais próximo sobre uma lista já ordenada.
+    """
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Mede a latência (p50/p95/p99), a vazão e a quantidade de consultas SQL dos principais '
+            'endpoints em um banco de testes descartável, populado com seed_data. Falha se algum '
+            'endpoint exceder seu orçamento de consultas.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Usuários do conjunto de dados.')
+        parser.add_argument('--transactions', type=int, default=20000, help='Transações do conjunto de dados.')
+        parser.add_argument('--seed', type=int, default=42, help='Semente do conjunto de dados.')
+        parser.add_argument('--requests', type=int, default=200, help='Requisições medidas por endpoint.')
+        parser.add_argument('--auth-requests', type=int, default=20,
+                            help='Requisições medidas de register e token, que calculam o hash da senha.')
+        parser.add_argument('--warmup', type=int, default=5, help='Requisições descartadas antes da medição.')
+        parser.add_argument('--endpoints', nargs='+', choices=list(QUERY_BUDGETS), default=list(QUERY_BUDGETS))
+        parser.add_argument('--budget', action='append', default=[], metavar='ENDPOINT=N',
+                            help='Substitui o orçamento de consultas de um endpoint (pode ser repetido).')
+        parser.add_argument('--output', default='bench.json', help='Arquivo JSON com os resultados.')
+        parser.add_argument('--baseline', help='Resultados JSON anteriores, para comparar as latências.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Mantém o banco de testes (e seus dados) entre execuções.')
+
+    def handle(self, *args, **options):
+        budgets = {**QUERY_BUDGETS, **self.parse_budgets(options['budget'])}
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        try:
+            if not User.objects.exists():
+                self.stdout.write(f"Populando o banco de testes ({options['users']} usuários, "
+                                  f"{options['transactions']} transações)...")
+                call_command('seed_data', users=options['users'], transactions=options['transactions'],
+                             seed=options['seed'], stdout=self.stdout if options['verbosity'] > 1 else io.StringIO())
+            cache.clear()
+            with override_settings(ALLOWED_HOSTS=['testserver']): # Host usado pelo Client de teste
+                results = self.run(options, budgets)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database_engine': settings.DATABASES['default']['ENGINE'],
+                **{key: options[key] for key in ('users', 'transactions', 'seed', 'requests', 'auth_requests')},
+            },
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.print_report(results, options['baseline'])
+        self.stdout.write(f"Resultados gravados em {options['output']}")
+
+        over_budget = [name for name, result in results.items() if not result['within_budget']]
+        if over_budget:
+            raise CommandError('Orçamento de consultas excedido: ' + ', '.join(
+                f"{name} ({results[name]['queries_max']} > {results[name]['query_budget']})" for name in over_budget
+            ))
+
+    def parse_budgets(self, values):
+        budgets = {}
+        for value in values:
+            name, _, limit = value.partition('=')
+            if name not in QUERY_BUDGETS or not limit.isdigit():
+                raise CommandError(f"Orçamento inválido: '{value}'. Use ENDPOINT=N, com ENDPOINT em {', '.join(QUERY_BUDGETS)}.")
+            budgets[name] = int(limit)
+        return budgets
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def build_requests(self):
+        """
+        Retorna, para cada endpoint, uma função que faz a i-ésima requisição e o status esperado.
+        Saldo e listagem alternam entre vários usuários para misturar acertos e falhas no cache.
+        """
+        client = Client()
+        users = list(User.objects.filter(wallet__isnull=False).order_by('id')[:50])
+        if len(users) < 2:
+            raise CommandError('O conjunto de dados precisa de ao menos dois usuários com carteira.')
+        headers = [
+            {'Authorization': f'Bearer {WalletTokenObtainPairSerializer.get_token(user).access_token}'}
+            for user in users
+        ]
+        sender_headers, receivers = headers[0], [user.username for user in users[1:]]
+        run_id = uuid.uuid4().hex[:8]
+
+        def post(name, data, request_headers=None):
+            return client.post(reverse(name), data, content_type='application/json', headers=request_headers)
+
+        return {
+            'register': (lambda i: post('user_register', {
+                'username': f'bench_{run_id}_{i}', 'email': f'bench_{run_id}_{i}@example.com', 'password': DEFAULT_PASSWORD
+            }), 201),
+            'token': (lambda i: post('token_obtain_pair', {
+                'username': users[i % len(users)].username, 'password': DEFAULT_PASSWORD
+            }), 200),
+            'balance': (lambda i: client.get(reverse('wallet_balance'), headers=headers[i % len(headers)]), 200),
+            'deposit': (lambda i: post('wallet_deposit', {'amount': '10.00'}, sender_headers), 200),
+            'transfer': (lambda i: post('transaction_transfer', {
+                'receiver_username': receivers[i % len(receivers)], 'amount': '1.00'
+            }, sender_headers), 200),
+            'list': (lambda i: client.get(reverse('transaction_list'), headers=headers[i % len(headers)]), 200),
+        }
+
+    def run(self, options, budgets):
+        requests = self.build_requests()
+        results = {}
+        for name in options['endpoints']:
+            count = options['auth_requests'] if name in PASSWORD_HASHING_ENDPOINTS else options['requests']
+            make_request, expected_status = requests[name]
+            results[name] = self.measure(name, make_request, expected_status, count, options['warmup'])
+            results[name]['query_budget'] = budgets[name]
+            results[name]['within_budget'] = results[name]['queries_max'] <= budgets[name]
+        return results
+
+    def measure(self, name, make_request, expected_status, count, warmup):
+        """
+        Faz `count` requisições sequenciais (após `warmup` descartadas), medindo a latência e
+        as consultas SQL de cada uma.
+        """
+        for i in range(warmup):
+            make_request(count + i)
+
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for i in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = make_request(i)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != expected_status:
+                raise CommandError(f'{name}: status {response.status_code} inesperado: {response.content[:200]!r}')
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': count,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'throughput_rps': round(count / elapsed, 1),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def print_report(self, results, baseline_path):
+        baseline = {}
+        if baseline_path:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file).get('endpoints', {})
+
+        self.stdout.write(
+            f"{'endpoint':<10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'req/s':>8} "
+            f"{'consultas':>10} {'orçamento':>10}" + (f" {'p95 vs base':>12}" if baseline else '')
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:<10} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                f"{result['throughput_rps']:>8.1f} {result['queries_max']:>10} {result['query_budget']:>10}"
+            )
+            if name in baseline:
+                change = (result['p95_ms'] / baseline[name]['p95_ms'] - 1) * 100
+                line += f' {change:>+11.1f}%'
+            style = self.style.SUCCESS if result['within_budget'] else self.style.ERROR
+            self.stdout.write(style(line))
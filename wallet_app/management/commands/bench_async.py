@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from wallet_app.models import Wallet, Transaction
+from wallet_app.serializers import WalletTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compara a vazão concorrente dos endpoints síncronos (WSGI) e assíncronos (ASGI) '
+            'de saldo e listagem, no mesmo processo e com a mesma concorrência.')
+
+    endpoints = {
+        'balance': ('wallet_balance', 'async_wallet_balance'),
+        'list': ('transaction_list', 'async_transaction_list'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total de requisições por modo.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help='Níveis de concorrência (threads no WSGI, tarefas no ASGI).')
+        parser.add_argument('--endpoint', choices=sorted(self.endpoints), default='balance')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f'bench_async_{uuid.uuid4().hex[:8]}', password='password123')
+        Wallet.objects.create(user=user, balance=Decimal('1000.00'))
+        now = timezone.now()
+        Transaction.objects.bulk_create([
+            Transaction(sender=user, receiver=user, amount=Decimal('1.00'), transaction_type='DEPOSIT',
+                        timestamp=now - timedelta(minutes=i))
+            for i in range(100)
+        ])
+        token = WalletTokenObtainPairSerializer.get_token(user).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+        sync_name, async_name = self.endpoints[options['endpoint']]
+
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']): # Host usado pelos clientes de teste
+                self.run(options, sync_name, async_name, headers)
+        finally:
+            close_old_connections()
+            user.delete()
+
+    def run(self, options, sync_name, async_name, headers):
+        self.stdout.write(f"{'modo':>6} {'concorrência':>13} {'req/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+        for concurrency in options['concurrency']:
+            latencies, elapsed = self.run_sync(reverse(sync_name), headers, options['requests'], concurrency)
+            self.report('WSGI', concurrency, latencies, elapsed)
+            latencies, elapsed = asyncio.run(
+                self.run_async(reverse(async_name), headers, options['requests'], concurrency)
+            )
+            self.report('ASGI', concurrency, latencies, elapsed)
+
+    def report(self, mode, concurrency, latencies, elapsed):
+        latencies.sort()
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f'{mode:>6} {concurrency:>13} {len(latencies) / elapsed:>10.1f} '
+            f'{statistics.median(latencies) * 1000:>10.2f} {p95 * 1000:>10.2f}'
+        )
+
+    def run_sync(self, url, headers, total, concurrency):
+        """
+        Dispara as requisições pelo handler WSGI, cada thread com seu próprio Client e conexão.
+        """
+        local = threading.local()
+
+        def request(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.get(url, headers=headers)
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - start
+
+        def close_connection(_):
+            connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(request, range(total)))
+            list(executor.map(close_connection, range(concurrency)))
+        return latencies, time.perf_counter() - start
+
+    async def run_async(self, url, headers, total, concurrency):
+        """
+        Dispara as requisições pelo handler ASGI, com no máximo `concurrency` em andamento.
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(request() for _ in range(total)))
+        return list(latencies), time.perf_counter() - start
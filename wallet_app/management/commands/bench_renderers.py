@@ -0,0 +1,68 @@
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from wallet_app.renderers import FastJSONRenderer, orjson
+from wallet_app.serializers import TransactionValuesSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compara o tempo de renderização de páginas da listagem de transações '
+            'entre o JSONRenderer do DRF e o FastJSONRenderer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Tamanhos de página (quantidade de transações) a medir.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Quantidade de repetições; é reportado o melhor tempo.')
+
+    def build_page(self, size):
+        """
+        Monta uma página no mesmo formato da resposta de TransactionListView.
+        """
+        now = timezone.now()
+        rows = [
+            {
+                'id': 1000000 + i,
+                'sender__username': f'usuario_remetente_{i % 97}',
+                'receiver__username': f'usuario_destinatario_{i % 89}',
+                'amount': Decimal('1234.56') + i,
+                'transaction_type': 'TRANSFER' if i % 3 else 'DEPOSIT',
+                'timestamp': now - timedelta(minutes=i),
+            }
+            for i in range(size)
+        ]
+        return {
+            'count': size * 100,
+            'next': 'http://localhost:8000/api/transactions/list/?cursor=eyJ0IjoiMjAyNS0wNy0wOFQxMjowMDowMC0wMzowMCIsImkiOjEyM30%3D',
+            'previous': None,
+            'results': TransactionValuesSerializer(rows, many=True).data,
+        }
+
+    def measure(self, renderer, data, repeat):
+        """
+        Retorna o melhor tempo médio (em microssegundos) de uma renderização.
+        """
+        timer = timeit.Timer(lambda: renderer.render(data, 'application/json', {}))
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson não está instalado: o FastJSONRenderer usará o json padrão.'
+            ))
+
+        baseline, fast = JSONRenderer(), FastJSONRenderer()
+        self.stdout.write(f"{'linhas':>8} {'JSONRenderer (µs)':>20} {'FastJSONRenderer (µs)':>24} {'ganho':>8}")
+        for size in options['sizes']:
+            data = self.build_page(size)
+            baseline_time = self.measure(baseline, data, options['repeat'])
+            fast_time = self.measure(fast, data, options['repeat'])
+            self.stdout.write(
+                f'{size:>8} {baseline_time:>20.1f} {fast_time:>24.1f} {baseline_time / fast_time:>7.1f}x'
+            )
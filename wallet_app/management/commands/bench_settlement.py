@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from wallet_app import services
+from wallet_app.models import PendingTransfer, Transaction, Wallet
+
+from .bench import percentile
+from .run_settlement import Command as SettlementCommand
+
+
+class Command(BaseCommand):
+    help = ('Compara, em um banco de testes descartável, a liquidação síncrona das transferências '
+            '(uma transação de banco por transferência) com a fila liquidada em micro-lotes por '
+            'run_settlement, para cada combinação de --batch-size e --max-delay. Reporta a vazão, '
+            'a latência (p50/p95) até a liquidação e as escritas de carteira por transferência. '
+            'Com --pairs, as transferências vão e voltam entre poucos pares de usuários, o caso '
+            'em que a compensação do lote mais economiza escritas.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=50)
+        parser.add_argument('--transfers', type=int, default=2000, help='Transferências por cenário.')
+        parser.add_argument('--producers', type=int, default=8, help='Threads que enviam as transferências.')
+        parser.add_argument('--pairs', type=int, default=0,
+                            help='Sorteia as transferências entre N pares fixos, nos dois sentidos (0: entre quaisquer carteiras).')
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[10, 100, 500])
+        parser.add_argument('--max-delay', type=float, nargs='+', default=[0.01, 0.05])
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keepdb', action='store_true', help='Mantém o banco de testes entre execuções.')
+
+    def handle(self, *args, **options):
+        if options['wallets'] < 2:
+            raise CommandError('Use --wallets >= 2.')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        try:
+            cache.clear()
+            self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        password = make_password(None)
+        prefix = f'settle_{random.getrandbits(32):08x}'
+        users = User.objects.bulk_create([User(username=f'{prefix}_{i}', password=password) for i in range(options['wallets'])])
+        # Saldo suficiente para que nenhuma transferência seja recusada
+        balance = Decimal('1000000.00')
+        Wallet.objects.bulk_create([Wallet(user=user, balance=balance) for user in users])
+        Transaction.objects.bulk_create([
+            Transaction(sender=user, receiver=user, amount=balance, transaction_type='DEPOSIT', timestamp=timezone.now())
+            for user in users
+        ])
+        user_ids = [user.id for user in users]
+
+        self.stdout.write(
+            f"{'modo':<24} {'transf./s':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'aceite p50 (ms)':>16} {'escritas/transf.':>17}"
+        )
+        pairs = [rng.sample(user_ids, 2) for _ in range(options['pairs'])]
+        plan = []
+        for _ in range(options['transfers']):
+            sender_id, receiver_id = rng.choice(pairs) if pairs else rng.sample(user_ids, 2)
+            if rng.random() < 0.5:
+                sender_id, receiver_id = receiver_id, sender_id
+            plan.append((sender_id, receiver_id, Decimal(rng.randint(100, 5000)) / 100))
+        self.report('síncrono', *self.run_sync(plan, options['producers']))
+        for batch_size in options['batch_size']:
+            for max_delay in options['max_delay']:
+                label = f'fila lote={batch_size} {max_delay * 1000:g}ms'
+                self.report(label, *self.run_queued(plan, options['producers'], batch_size, max_delay))
+
+    def report(self, label, count, elapsed, latencies, wallet_writes, accept_latencies=None):
+        latencies.sort()
+        accept = f'{percentile(sorted(accept_latencies), 0.5) * 1000:>16.2f}' if accept_latencies else f"{'-':>16}"
+        self.stdout.write(
+            f'{label:<24} {count / elapsed:>10.1f} {percentile(latencies, 0.5) * 1000:>9.2f} '
+            f'{percentile(latencies, 0.95) * 1000:>9.2f} {accept} {wallet_writes / count:>17.3f}'
+        )
+
+    def produce(self, plan, producers, call):
+        """
+        Executa call(sender_id, receiver_id, amount) para cada item do plano, com `producers`
+        threads. Retorna a duração de cada chamada.
+        """
+        pending = iter(plan)
+        pending_lock = threading.Lock()
+        durations = []
+
+        def worker():
+            try:
+                while True:
+                    with pending_lock:
+                        item = next(pending, None)
+                    if item is None:
+                        return
+                    started = time.perf_counter()
+                    call(*item)
+                    durations.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(producers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return durations
+
+    def run_sync(self, plan, producers):
+        started = time.perf_counter()
+        durations = self.produce(plan, producers, services.transfer)
+        return len(plan), time.perf_counter() - started, durations, 2 * len(plan) # Remetente e destinatário
+
+    def run_queued(self, plan, producers, batch_size, max_delay):
+        first_id = (PendingTransfer.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        done = threading.Event()
+        settlement = SettlementCommand()
+        writes_before = REGISTRY.get_sample_value('wallet_settlement_wallet_writes_total') or 0
+
+        def settle():
+            try:
+                settlement.run(batch_size, max_delay, should_stop=done.is_set)
+                settlement.run(batch_size, max_delay, once=True) # O que restou na fila
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=settle)
+        started = time.perf_counter()
+        worker.start()
+        accept = self.produce(plan, producers, services.enqueue_transfer)
+        done.set()
+        worker.join()
+        elapsed = time.perf_counter() - started
+
+        settled = PendingTransfer.objects.filter(id__gte=first_id).values_list('created_at', 'settled_at', 'status')
+        latencies = [(settled_at - created_at).total_seconds() for created_at, settled_at, _ in settled]
+        rejected = sum(1 for *_, status in settled if status != PendingTransfer.STATUS_SETTLED)
+        if rejected or len(latencies) != len(plan):
+            raise CommandError(f'{len(latencies)} transferências processadas, {rejected} recusadas; esperadas {len(plan)}.')
+        wallet_writes = REGISTRY.get_sample_value('wallet_settlement_wallet_writes_total') - writes_before
+        return len(plan), elapsed, latencies, wallet_writes, accept
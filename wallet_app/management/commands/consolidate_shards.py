@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallet_app import services
+from wallet_app.models import Wallet
+
+
+class Command(BaseCommand):
+    help = ('Move o saldo acumulado nos shards das carteiras quentes para as próprias carteiras. '
+            'Com --interval, repete a consolidação a cada N segundos até ser interrompido.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None, help='Repete a cada N segundos.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.consolidate()
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def consolidate(self):
+        user_ids = Wallet.objects.filter(shard_count__gt=0).values_list('user_id', flat=True)
+        total = 0
+        for user_id in user_ids:
+            try:
+                total += services.consolidate_shards(user_id)
+            except Wallet.DoesNotExist:
+                continue # Carteira removida entre a listagem e a consolidação
+        self.stdout.write(f'{len(user_ids)} carteiras quentes consolidadas ({total} movidos).')
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from wallet_app import partitions
+
+
+def parse_month(value):
+    try:
+        return partitions.month_start(datetime.strptime(value, '%Y-%m'))
+    except ValueError:
+        raise CommandError(f"Mês inválido: '{value}'. Use o formato AAAA-MM.")
+
+
+class Command(BaseCommand):
+    help = ('Mantém as partições mensais da tabela de transações: cria com antecedência as '
+            'partições dos próximos meses e, opcionalmente, desanexa (ou apaga) as anteriores a um mês, '
+            'desde que já estejam vazias (arquivadas com archive_transactions).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Garante as partições do mês atual e dos próximos N meses.')
+        parser.add_argument('--detach-before', metavar='AAAA-MM',
+                            help='Desanexa as partições (já arquivadas) de meses anteriores a este, que ficam como tabelas avulsas.')
+        parser.add_argument('--drop', action='store_true', help='Apaga as partições desanexadas, em vez de mantê-las.')
+        parser.add_argument('--list', action='store_true', help='Apenas lista as partições mensais.')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned(connection):
+            raise CommandError('A tabela de transações não está particionada (requer PostgreSQL e a migração '
+                               '0005_partition_transactions).')
+        if options['drop'] and not options['detach_before']:
+            raise CommandError('--drop requer --detach-before.')
+
+        if options['list']:
+            for month, name in partitions.monthly_partitions(connection).items():
+                self.stdout.write(f'{month:%Y-%m}  {name}')
+            return
+
+        current = partitions.month_start(timezone.now())
+        for offset in range(max(0, options['ahead']) + 1):
+            created = partitions.create_partition(partitions.add_months(current, offset), connection)
+            if created:
+                name, moved = created
+                self.stdout.write(f'Partição {name} criada' + (f' ({moved} linhas movidas da partição padrão)' if moved else ''))
+
+        if options['detach_before']:
+            cutoff = parse_month(options['detach_before'])
+            if cutoff > current:
+                raise CommandError('--detach-before não pode ser posterior ao mês atual.')
+            for month, name in partitions.monthly_partitions(connection).items():
+                if month < cutoff:
+                    try:
+                        partitions.detach_partition(name, drop=options['drop'], connection=connection)
+                    except partitions.PartitionNotArchived as exc:
+                        raise CommandError(
+                            f"{exc} Ex: python manage.py archive_transactions --before {cutoff:%Y-%m-%d}"
+                        )
+                    self.stdout.write(f"Partição {name} {'apagada' if options['drop'] else 'desanexada'}")
+        self.stdout.write(self.style.SUCCESS('Partições em dia.'))
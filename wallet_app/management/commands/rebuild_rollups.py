@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from wallet_app import rollups
+
+
+def rebuild_chunk(user_range):
+    """
+    Recalcula os totais diários de um intervalo [início, fim) de ids de usuário, em uma
+    única transação.
+    """
+    with transaction.atomic():
+        return rollups.rebuild(*user_range)
+
+
+def rebuild_chunk_in_worker(user_range):
+    """
+    rebuild_chunk em um processo do pool, que fecha a sua conexão ao terminar.
+    """
+    try:
+        return rebuild_chunk(user_range)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Recalcula os totais diários (DailyRollup) a partir das transações e do arquivo morto. '
+            'Os ids de usuário são divididos em intervalos, recalculados em paralelo por um pool de '
+            'processos, cada intervalo em uma transação.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Processos em paralelo.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Usuários por intervalo.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Use --workers >= 1 e --chunk-size >= 1.')
+        bounds = User.objects.aggregate(lower=Min('id'), upper=Max('id'))
+        if bounds['lower'] is None:
+            self.stdout.write('Nenhum usuário.')
+            return
+        chunk_size = options['chunk_size']
+        ranges = [(lower, min(lower + chunk_size, bounds['upper'] + 1))
+                  for lower in range(bounds['lower'], bounds['upper'] + 1, chunk_size)]
+
+        started = time.perf_counter()
+        if options['workers'] == 1:
+            created = [rebuild_chunk(user_range) for user_range in ranges]
+        else:
+            # Os processos filhos abrem suas próprias conexões
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+                created = list(executor.map(rebuild_chunk_in_worker, ranges))
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(created)} totais diários recalculados em {len(ranges)} intervalos '
+            f'({time.perf_counter() - started:.1f}s).'
+        ))
@@ -0,0 +1,151 @@
+import multiprocessing
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from wallet_app.models import ReconciliationRange, ReconciliationRun, Transaction, Wallet
+from wallet_app.queries import ledger_balances
+
+# O modo incremental recua este tanto antes do início da conferência anterior: uma transação
+# recebe o timestamp pouco antes do commit e pode não ter sido vista por aquela conferência
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+
+
+def check_range(task):
+    """
+    Confere as carteiras de um intervalo [início, fim) de ids de usuário (ou apenas as dos ids
+    informados) e grava o intervalo, com as divergências, como concluído.
+    Retorna (carteiras conferidas, divergências).
+    """
+    run_id, lower, upper, user_ids = task
+    rows = ledger_balances(lower, upper, user_ids)
+    mismatches = [
+        {'user_id': user_id, 'balance': str(balance), 'ledger_balance': str(ledger_balance)}
+        for user_id, balance, ledger_balance in rows if balance != ledger_balance
+    ]
+    ReconciliationRange.objects.create(
+        run_id=run_id, lower_user_id=lower, upper_user_id=upper, wallets=len(rows), mismatches=mismatches
+    )
+    return len(rows), len(mismatches)
+
+
+def check_range_in_worker(task):
+    """
+    check_range em um processo do pool, que fecha a sua conexão ao terminar.
+    """
+    try:
+        return check_range(task)
+    finally:
+        connection.close()
+
+
+def touched_users(since):
+    """
+    Ids dos usuários com alguma transação (enviada ou recebida) a partir de `since`.
+    Como a tabela é particionada por timestamp, apenas as partições recentes são lidas.
+    """
+    recent = Transaction.objects.filter(timestamp__gte=since).order_by()
+    return (set(recent.values_list('sender_id', flat=True).distinct())
+            | set(recent.values_list('receiver_id', flat=True).distinct()))
+
+
+class Command(BaseCommand):
+    help = ('Confere se o saldo de cada carteira (com os shards) é igual ao registro de transações '
+            '(com o arquivo morto). Os ids de usuário são divididos em intervalos, conferidos em '
+            'paralelo por um pool de processos, com uma consulta agregada por intervalo. Cada intervalo '
+            'concluído é registrado: uma conferência interrompida é retomada de onde parou na próxima '
+            'execução do mesmo modo. Com --incremental, confere apenas as carteiras com transações '
+            'desde a conferência anterior. Termina com erro se houver divergências.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Processos em paralelo.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Usuários por intervalo (uma conferência retomada mantém o seu).')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Apenas as carteiras com transações desde o início da conferência anterior.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Começa uma nova conferência em vez de retomar a interrompida.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Use --workers >= 1 e --chunk-size >= 1.')
+        run = self.get_run(options)
+        if run is None:
+            self.stdout.write('Nenhuma carteira.')
+            return
+
+        done = set(run.ranges.values_list('lower_user_id', flat=True))
+        touched = sorted(touched_users(run.since)) if run.since is not None else None
+        tasks = []
+        for lower in range(run.lower_user_id, run.upper_user_id, run.chunk_size):
+            upper = min(lower + run.chunk_size, run.upper_user_id)
+            if lower in done:
+                continue
+            if touched is None:
+                tasks.append((run.id, lower, upper, None))
+                continue
+            user_ids = touched[bisect_left(touched, lower):bisect_left(touched, upper)]
+            if user_ids:
+                tasks.append((run.id, lower, upper, user_ids))
+
+        started = time.perf_counter()
+        if options['workers'] == 1:
+            for task in tasks:
+                check_range(task)
+        else:
+            # Os processos filhos abrem suas próprias conexões
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+                list(executor.map(check_range_in_worker, tasks))
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+        self.report(run, len(tasks), time.perf_counter() - started)
+
+    def get_run(self, options):
+        """
+        A conferência interrompida do modo pedido (salvo com --restart) ou uma nova. O modo
+        incremental sem uma conferência anterior concluída vira uma conferência completa.
+        """
+        mode, since = ReconciliationRun.MODE_FULL, None
+        if options['incremental']:
+            previous = ReconciliationRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+            if previous is None:
+                self.stdout.write('Nenhuma conferência anterior: conferindo todas as carteiras.')
+            else:
+                mode, since = ReconciliationRun.MODE_INCREMENTAL, previous.started_at - INCREMENTAL_OVERLAP
+
+        if not options['restart']:
+            run = ReconciliationRun.objects.filter(mode=mode, finished_at__isnull=True).order_by('-id').first()
+            if run is not None:
+                self.stdout.write(f'Retomando a conferência {run.id} ({run.ranges.count()} intervalos já conferidos).')
+                return run
+
+        bounds = Wallet.objects.aggregate(lower=Min('user_id'), upper=Max('user_id'))
+        if bounds['lower'] is None:
+            return None
+        return ReconciliationRun.objects.create(
+            mode=mode, lower_user_id=bounds['lower'], upper_user_id=bounds['upper'] + 1,
+            chunk_size=options['chunk_size'], since=since,
+        )
+
+    def report(self, run, checked_now, duration):
+        ranges = list(run.ranges.order_by('lower_user_id'))
+        mismatches = [mismatch for checked in ranges for mismatch in checked.mismatches]
+        wallets = sum(checked.wallets for checked in ranges)
+        summary = (f'Conferência {run.id}: {wallets} carteiras em {len(ranges)} intervalos '
+                   f'({checked_now} nesta execução, {duration:.1f}s)')
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(f'{summary}, nenhuma divergência.'))
+            return
+        self.stdout.write(f'{summary}.')
+        for mismatch in mismatches:
+            self.stdout.write(f"  usuário {mismatch['user_id']}: saldo {mismatch['balance']}, "
+                              f"registro de transações {mismatch['ledger_balance']}")
+        raise CommandError(f'{len(mismatches)} carteiras com saldo diferente do registro de transações.')
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet_app import metrics, services
+from wallet_app.models import PendingTransfer
+
+
+class Command(BaseCommand):
+    help = ('Liquida as transferências enfileiradas (WALLET_TRANSFER_MODE = queued) em micro-lotes: '
+            'um lote é liquidado em uma única transação de banco assim que tiver --batch-size '
+            'transferências ou quando a mais antiga estiver esperando há --max-delay segundos. '
+            'Vários processos podem rodar ao mesmo tempo.')
+    verbosity = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.WALLET_SETTLEMENT_BATCH_SIZE,
+                            help='Máximo de transferências por transação de banco.')
+        parser.add_argument('--max-delay', type=float, default=settings.WALLET_SETTLEMENT_MAX_DELAY,
+                            help='Espera máxima (segundos) para completar um lote.')
+        parser.add_argument('--once', action='store_true', help='Liquida o que estiver na fila e termina.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Use --batch-size >= 1.')
+        self.verbosity = options['verbosity']
+        try:
+            processed = self.run(options['batch_size'], options['max_delay'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'{processed} transferências processadas.'))
+
+    def run(self, batch_size, max_delay, once=False, should_stop=None):
+        """
+        Drena a fila até `should_stop()` ser verdadeiro (ou, com once=True, até ela esvaziar).
+        Retorna o número de transferências processadas.
+        """
+        processed = 0
+        while not (should_stop and should_stop()):
+            wait = 0 if once else self.batch_wait(batch_size, max_delay)
+            if wait:
+                time.sleep(wait)
+                continue
+            started = time.perf_counter()
+            pending, written = services.settle_pending(batch_size)
+            if not pending:
+                if once:
+                    break
+                time.sleep(max(max_delay, 0.01))
+                continue
+            duration = time.perf_counter() - started
+            metrics.record_settlement(pending, written, duration)
+            processed += len(pending)
+            if self.verbosity > 1:
+                rejected = sum(1 for item in pending if item.status == PendingTransfer.STATUS_REJECTED)
+                self.stdout.write(f'{len(pending)} transferências ({rejected} recusadas), {written} carteiras gravadas, '
+                                  f'em {duration * 1000:.1f} ms')
+        return processed
+
+    def batch_wait(self, batch_size, max_delay):
+        """
+        Segundos a esperar antes de liquidar o próximo lote: 0 se já houver um lote completo ou
+        se a transferência mais antiga já esperou max_delay; o intervalo de espera se a fila estiver vazia.
+        """
+        queue = PendingTransfer.objects.filter(status=PendingTransfer.STATUS_PENDING).order_by('id')
+        oldest = queue.values_list('created_at', flat=True).first()
+        if oldest is None:
+            return max(max_delay, 0.01)
+        if queue[batch_size - 1:batch_size].exists():
+            return 0
+        waited = time.time() - oldest.timestamp()
+        return max(0, max_delay - waited)
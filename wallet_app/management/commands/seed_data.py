@@ -1,96 +1,206 @@
+import io
+import multiprocessing
 import random
-from datetime import timedelta
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone as dt_timezone
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connection, connections, transaction
+from django.db.models import Max
 from django.utils import timezone
 from faker import Faker
 
+from wallet_app import rollups
 from wallet_app.models import Wallet, Transaction
 
+DEFAULT_PASSWORD = 'password123' # Senha padrão para usuários fictícios
+
+TRANSACTION_COLUMNS = ('sender_id', 'receiver_id', 'amount', 'transaction_type', 'timestamp',
+                       'sender_balance_after', 'receiver_balance_after')
+MAX_SEED_BALANCE_CENTS = 100_000_000 # Acima de 1.000.000,00 não há mais depósitos (balance tem 10 dígitos)
+
+
+def _format_cents(cents):
+    return f'{cents // 100}.{cents % 100:02d}'
+
+
+def _copy_rows(cursor, table, columns, data):
+    """
+    Grava no banco, via COPY, as linhas de `data` (texto no formato do COPY: colunas
+    separadas por tabulação, uma linha por registro). Funciona com psycopg2 e psycopg 3.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'): # psycopg2
+        raw_cursor.copy_expert(sql, io.StringIO(data))
+    else: # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(data)
+
+
+def seed_partition(task):
+    """
+    Gera o histórico de transações de um grupo de usuários, com o saldo após cada uma, e cria
+    suas carteiras com o saldo resultante. Cada processo trabalha em um grupo disjunto (as
+    transferências são entre usuários do mesmo grupo), então os saldos podem ser simulados em
+    memória, em ordem cronológica, sem nunca ficarem negativos.
+
+    Tudo é gravado em uma única transação: ou o grupo inteiro é criado, ou nada.
+    """
+    user_ids = task['user_ids']
+    rng = random.Random(task['seed'])
+    balances = {user_id: 0 for user_id in user_ids} # em centavos
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    columns = [connection.ops.quote_name(column) for column in TRANSACTION_COLUMNS]
+    start, end, total = task['start'], task['end'], task['transactions']
+    step = (end - start) / (total + 1)
+    counts = {'DEPOSIT': 0, 'TRANSFER': 0}
+
+    def timestamp(seconds):
+        return datetime.fromtimestamp(seconds, dt_timezone.utc).isoformat()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Depósito inicial de cada usuário, no início do período
+        lines = []
+        for user_id in user_ids:
+            cents = rng.randint(10_000, 100_000)
+            balances[user_id] = cents
+            balance = _format_cents(cents)
+            lines.append(f'{user_id}\t{user_id}\t{balance}\tDEPOSIT\t{timestamp(start)}\t{balance}\t{balance}\n')
+        counts['DEPOSIT'] += len(lines)
+        _copy_rows(cursor, table, columns, ''.join(lines))
+
+        lines = []
+        for i in range(total):
+            seconds = start + (i + 1 + rng.random()) * step # crescente: os saldos são simulados em ordem
+            sender_id = rng.choice(user_ids)
+            balance = balances[sender_id]
+            receiver_id = sender_id
+            if len(user_ids) > 1 and balance >= 1_000 and (
+                rng.random() >= task['deposit_ratio'] or balance >= MAX_SEED_BALANCE_CENTS
+            ):
+                while receiver_id == sender_id:
+                    receiver_id = rng.choice(user_ids)
+
+            if receiver_id == sender_id:
+                cents = rng.randint(1_000, 20_000)
+                balances[sender_id] = balance + cents
+                kind = 'DEPOSIT'
+            else:
+                # Como no seed original: no máximo metade do saldo, limitado a 150,00
+                cents = rng.randint(500, max(500, min(balance // 2, 15_000)))
+                balances[sender_id] = balance - cents
+                balances[receiver_id] += cents
+                kind = 'TRANSFER'
+            counts[kind] += 1
+            lines.append(
+                f'{sender_id}\t{receiver_id}\t{_format_cents(cents)}\t{kind}\t{timestamp(seconds)}\t'
+                f'{_format_cents(balances[sender_id])}\t{_format_cents(balances[receiver_id])}\n'
+            )
+
+            if len(lines) >= task['chunk_size']:
+                _copy_rows(cursor, table, columns, ''.join(lines))
+                lines = []
+        if lines:
+            _copy_rows(cursor, table, columns, ''.join(lines))
+
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user_id, balance=_format_cents(cents)) for user_id, cents in balances.items()],
+            batch_size=task['chunk_size'],
+        )
+
+    connection.close()
+    return {**counts, 'total_cents': sum(balances.values())}
+
+
 class Command(BaseCommand):
-    help = 'Popula o banco de dados com dados fictícios de usuários, carteiras e transações.'
+    help = ('Popula o banco de dados com dados fictícios de usuários, carteiras e transações. '
+            'Os saldos finais das carteiras batem com o histórico de transações gerado.')
 
-    def handle(self, *args, **kwargs):
-        fake = Faker('pt_BR') # Usar localidade brasileira para nomes e emails
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Quantidade de usuários (cada um com sua carteira).')
+        parser.add_argument('--transactions', type=int, default=50,
+                            help='Quantidade de transações, além do depósito inicial de cada usuário.')
+        parser.add_argument('--days', type=int, default=30, help='As transações são distribuídas nos últimos N dias.')
+        parser.add_argument('--seed', type=int, default=None, help='Semente aleatória, para gerar sempre os mesmos dados.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processos em paralelo; cada um gera as transações de um grupo de usuários.')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Linhas por comando COPY/bulk_create.')
+        parser.add_argument('--deposit-ratio', type=float, default=0.3, help='Proporção aproximada de depósitos.')
+
+    def handle(self, *args, **options):
+        num_users, num_transactions = options['users'], options['transactions']
+        if num_users < 1 or num_transactions < 0 or options['days'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Use --users >= 1, --transactions >= 0, --days >= 1 e --chunk-size >= 1.')
+        if connection.vendor != 'postgresql':
+            raise CommandError('seed_data usa COPY e requer PostgreSQL.')
 
-        self.stdout.write(self.style.SUCCESS('Iniciando a população de dados...'))
-
-        # Limpa dados existentes (opcional, para testes)
-        # User.objects.all().delete()
-        # Wallet.objects.all().delete()
-        # Transaction.objects.all().delete()
-
-        num_users = 10
-        num_transactions_per_user = 5
-        users = []
-
-        self.stdout.write(self.style.SUCCESS(f'Criando {num_users} usuários e carteiras...'))
-        for i in range(num_users):
-            username = fake.user_name() + str(i) # Garante unicidade
-            email = fake.email()
-            password = 'password123' # Senha padrão para usuários fictícios
-
-            with transaction.atomic():
-                user = User.objects.create_user(username=username, email=email, password=password)
-                wallet = Wallet.objects.create(user=user, balance=round(random.uniform(100.00, 1000.00), 2))
-                users.append(user)
-                self.stdout.write(f'  - Usuário criado: {user.username} com saldo inicial: {wallet.balance}')
-
-        self.stdout.write(self.style.SUCCESS('Criando transações fictícias...'))
-        for user in users:
-            self.stdout.write(f'  - Gerando transações para {user.username}...')
-            for _ in range(num_transactions_per_user):
-                # Decidir se é um depósito ou transferência
-                is_deposit = random.choice([True, False])
-
-                if is_deposit:
-                    # Depósito
-                    amount = round(random.uniform(10.00, 200.00), 2)
-                    with transaction.atomic():
-                        user_wallet = user.wallet
-                        user_wallet.balance += amount
-                        user_wallet.save()
-                        Transaction.objects.create(
-                            sender=user,
-                            receiver=user,
-                            amount=amount,
-                            transaction_type='DEPOSIT',
-                            timestamp=timezone.now() - timedelta(days=random.randint(1, 30)) # Transações nos últimos 30 dias
-                        )
-                    self.stdout.write(f'    - Depósito de {amount} para {user.username}')
-                else:
-                    # Transferência
-                    # Tenta encontrar um destinatário diferente
-                    possible_receivers = [u for u in users if u != user]
-                    if not possible_receivers:
-                        continue # Não há outros usuários para transferir
-
-                    receiver_user = random.choice(possible_receivers)
-                    amount = round(random.uniform(5.00, min(user.wallet.balance / 2, 150.00)), 2) # Limita o valor para evitar saldo negativo
-                    if amount <= 0:
-                        continue # Evita transferências de valor zero ou negativo
-
-                    with transaction.atomic():
-                        sender_wallet = user.wallet
-                        receiver_wallet = receiver_user.wallet
-
-                        if sender_wallet.balance >= amount:
-                            sender_wallet.balance -= amount
-                            receiver_wallet.balance += amount
-                            sender_wallet.save()
-                            receiver_wallet.save()
-                            Transaction.objects.create(
-                                sender=user,
-                                receiver=receiver_user,
-                                amount=amount,
-                                transaction_type='TRANSFER',
-                                timestamp=timezone.now() - timedelta(days=random.randint(1, 30))
-                            )
-                            self.stdout.write(f'    - Transferência de {amount} de {user.username} para {receiver_user.username}')
-                        else:
-                            self.stdout.write(f'    - Saldo insuficiente para {user.username} transferir {amount} para {receiver_user.username}. Saldo atual: {sender_wallet.balance}')
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        # Cada processo precisa de ao menos dois usuários para gerar transferências
+        workers = max(1, min(options['workers'], num_users // 2))
+        started = time.perf_counter()
 
+        self.stdout.write(self.style.SUCCESS(f'Iniciando a população de dados (semente {seed})...'))
+        user_ids = self.create_users(num_users, seed, options['chunk_size'])
+        self.stdout.write(f'  - {num_users} usuários criados em {time.perf_counter() - started:.1f}s')
+
+        end = timezone.now().timestamp()
+        tasks = [
+            {
+                'user_ids': user_ids[index::workers],
+                'transactions': num_transactions // workers + (index < num_transactions % workers),
+                'start': end - options['days'] * 86400,
+                'end': end,
+                'seed': seed + 1 + index,
+                'chunk_size': options['chunk_size'],
+                'deposit_ratio': options['deposit_ratio'],
+            }
+            for index in range(workers)
+        ]
+
+        self.stdout.write(f'  - Gerando transações com {workers} processo(s)...')
+        if workers == 1:
+            results = [seed_partition(tasks[0])]
+        else:
+            # Os processos filhos abrem suas próprias conexões
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(seed_partition, tasks))
+
+        with transaction.atomic():
+            rollups.rebuild(min(user_ids), max(user_ids) + 1)
+
+        deposits = sum(result['DEPOSIT'] for result in results)
+        transfers = sum(result['TRANSFER'] for result in results)
+        total = _format_cents(sum(result['total_cents'] for result in results))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'  - {deposits + transfers} transações ({deposits} depósitos, {transfers} transferências) '
+            f'em {elapsed:.1f}s ({(deposits + transfers) / elapsed:.0f} linhas/s); saldo total: {total}'
+        )
         self.stdout.write(self.style.SUCCESS('População de dados concluída!'))
-        self.stdout.write(self.style.SUCCESS('Você pode usar os usuários criados (ex: username0, username1, etc.) com a senha "password123" para testar a API.'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Você pode usar os usuários criados com a senha "{DEFAULT_PASSWORD}" para testar a API.'
+        ))
+
+    def create_users(self, num_users, seed, batch_size):
+        """
+        Cria os usuários em lote e retorna seus ids. O hash da senha padrão é calculado
+        uma única vez e reaproveitado por todos.
+        """
+        fake = Faker('pt_BR') # Usar localidade brasileira para nomes e emails
+        fake.seed_instance(seed)
+        password = make_password(DEFAULT_PASSWORD)
+        # Sufixo numérico a partir do maior id existente, para não colidir com execuções anteriores
+        offset = (User.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        users = User.objects.bulk_create(
+            [
+                User(username=f'{fake.user_name()}{offset + i}', email=fake.email(), password=password)
+                for i in range(num_users)
+            ],
+            batch_size=batch_size,
+        )
+        return [user.id for user in users]
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet_app import services
+from wallet_app.models import Wallet
+
+
+class Command(BaseCommand):
+    help = ('Transforma a carteira de um usuário em carteira quente: os créditos passam a ser '
+            'distribuídos entre N shards, sem disputar o bloqueio da carteira. Com --shards 0, '
+            'consolida os shards e volta a carteira ao modo comum.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--shards', type=int, required=True, help='Número de shards (0 desliga).')
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError('Use --shards >= 0.')
+        user_id = User.objects.filter(username=options['username']).values_list('id', flat=True).first()
+        if user_id is None:
+            raise CommandError(f"Usuário '{options['username']}' não encontrado.")
+        try:
+            wallet = services.set_shard_count(user_id, options['shards'])
+        except Wallet.DoesNotExist as exc:
+            raise CommandError(str(exc))
+        if wallet.shard_count:
+            self.stdout.write(self.style.SUCCESS(
+                f"Carteira de {options['username']} com {wallet.shard_count} shards (saldo {wallet.balance})."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Carteira de {options['username']} de volta ao modo comum (saldo {wallet.balance})."
+            ))
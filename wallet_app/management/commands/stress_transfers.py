@@ -0,0 +1,209 @@
+import logging
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Min, Sum
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from wallet_app import services
+from wallet_app.models import Wallet, WalletShard, Transaction
+from wallet_app.queries import ledger_mismatches
+from wallet_app.serializers import WalletTokenObtainPairSerializer
+
+from .bench import percentile
+
+
+class LockWaitTimer:
+    """
+    execute_wrapper que mede a duração das consultas SELECT ... FOR UPDATE, ou seja,
+    o tempo que cada operação passou esperando (e obtendo) os bloqueios das carteiras.
+    """
+    def __init__(self):
+        self.waits = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.waits.append(time.perf_counter() - start) # list.append é atômico entre threads
+
+
+class Command(BaseCommand):
+    help = ('Dispara transferências e depósitos concorrentes pela API, entre um conjunto de carteiras, '
+            'em níveis crescentes de concorrência. Verifica que o total de dinheiro se conserva, que '
+            'nenhum saldo fica negativo e que o registro de transações bate com os saldos; reporta '
+            'transferências por segundo e o tempo de espera por bloqueios.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=20,
+                            help='Carteiras disputadas; quanto menos carteiras, mais contenção.')
+        parser.add_argument('--operations', type=int, default=1000, help='Operações por nível de concorrência.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='Threads por nível.')
+        parser.add_argument('--deposit-ratio', type=float, default=0.2, help='Proporção de depósitos.')
+        parser.add_argument('--initial-balance', type=Decimal, default=Decimal('100.00'))
+        parser.add_argument('--hot-ratio', type=float, default=0.0,
+                            help='Proporção das transferências destinadas à primeira carteira (um lojista concorrido).')
+        parser.add_argument('--hot-shards', type=int, default=0,
+                            help='Shards da primeira carteira (carteira quente); 0 mantém a carteira comum.')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keepdb', action='store_true', help='Mantém o banco de testes entre execuções.')
+
+    def handle(self, *args, **options):
+        if options['wallets'] < 2:
+            raise CommandError('Use --wallets >= 2.')
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        # As recusas por saldo insuficiente (400) são esperadas; não as registra uma a uma
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            cache.clear()
+            with override_settings(ALLOWED_HOSTS=['testserver']): # Host usado pelo Client de teste
+                failures = self.run(options)
+        finally:
+            request_logger.setLevel(previous_level)
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if failures:
+            raise CommandError('Invariantes violados: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Nenhuma atualização perdida: todos os invariantes foram mantidos.'))
+
+    def create_wallets(self, count, balance):
+        """
+        Cria os usuários e as carteiras, cada uma com um depósito inicial registrado, de modo
+        que o registro de transações explique o saldo desde o início.
+        """
+        password = make_password(None)
+        prefix = f'stress_{random.getrandbits(32):08x}'
+        users = User.objects.bulk_create([User(username=f'{prefix}_{i}', password=password) for i in range(count)])
+        Wallet.objects.bulk_create([Wallet(user=user, balance=balance) for user in users])
+        now = timezone.now()
+        Transaction.objects.bulk_create([
+            Transaction(sender=user, receiver=user, amount=balance, transaction_type='DEPOSIT', timestamp=now)
+            for user in users
+        ])
+        return users
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        users = self.create_wallets(options['wallets'], options['initial_balance'])
+        if options['hot_shards'] > 0:
+            services.set_shard_count(users[0].id, options['hot_shards'])
+        user_ids = [user.id for user in users]
+        headers = {
+            user.username: {'Authorization': f'Bearer {WalletTokenObtainPairSerializer.get_token(user).access_token}'}
+            for user in users
+        }
+        expected_supply = options['initial_balance'] * len(users)
+        failures = []
+
+        self.stdout.write(
+            f"{'threads':>7} {'operações':>10} {'transf. ok':>11} {'recusadas':>10} {'erros':>6} {'transf./s':>10} "
+            f"{'bloqueio médio (ms)':>20} {'p95 (ms)':>9} {'bloqueio total (s)':>19}"
+        )
+        for concurrency in options['concurrency']:
+            operations = self.plan(rng, users, options['operations'], options['deposit_ratio'], options['hot_ratio'])
+            timer = LockWaitTimer()
+            outcomes, elapsed = self.fire(operations, headers, concurrency, timer)
+
+            transfers_ok = sum(1 for kind, status_code, _ in outcomes if kind == 'transfer' and status_code == 200)
+            rejected = sum(1 for kind, status_code, _ in outcomes if kind == 'transfer' and status_code == 400)
+            errors = sum(1 for _, status_code, _ in outcomes if status_code not in (200, 400))
+            expected_supply += sum(amount for kind, status_code, amount in outcomes if kind == 'deposit' and status_code == 200)
+
+            waits = sorted(timer.waits)
+            mean_wait = sum(waits) / len(waits) * 1000 if waits else 0
+            p95_wait = percentile(waits, 0.95) * 1000 if waits else 0
+            self.stdout.write(
+                f'{concurrency:>7} {len(operations):>10} {transfers_ok:>11} {rejected:>10} {errors:>6} '
+                f'{transfers_ok / elapsed:>10.1f} {mean_wait:>20.2f} {p95_wait:>9.2f} {sum(waits):>19.2f}'
+            )
+
+            level_failures = self.check_invariants(user_ids, expected_supply)
+            if errors:
+                level_failures.append(f'{errors} requisições falharam com status diferente de 200/400')
+            failures.extend(f'{concurrency} threads: {failure}' for failure in level_failures)
+        return failures
+
+    def plan(self, rng, users, count, deposit_ratio, hot_ratio=0.0):
+        """
+        Sorteia as operações: depósitos e transferências entre carteiras aleatórias, com valores
+        que às vezes excedem o saldo do remetente (para exercitar a recusa por saldo insuficiente).
+        Uma proporção `hot_ratio` das transferências vai para a primeira carteira.
+        """
+        operations = []
+        for _ in range(count):
+            sender, receiver = rng.sample(users, 2)
+            if rng.random() < hot_ratio:
+                sender, receiver = rng.choice(users[1:]), users[0]
+            if rng.random() < deposit_ratio:
+                operations.append(('deposit', sender.username, None, Decimal(rng.randint(100, 2000)) / 100))
+            else:
+                operations.append(('transfer', sender.username, receiver.username, Decimal(rng.randint(100, 5000)) / 100))
+        return operations
+
+    def fire(self, operations, headers, concurrency, timer):
+        """
+        Executa as operações pela API com `concurrency` threads, cada uma com seu próprio
+        Client e conexão. Retorna [(tipo, status, valor)], na ordem das operações, e o tempo total.
+        """
+        pending = iter(enumerate(operations))
+        pending_lock = threading.Lock()
+        outcomes = [None] * len(operations)
+
+        def worker():
+            client = Client(raise_request_exception=False)
+            try:
+                while True:
+                    with pending_lock:
+                        index, (kind, username, receiver_username, amount) = next(pending, (None, (None,) * 4))
+                    if index is None:
+                        return
+                    if kind == 'deposit':
+                        url, data = reverse('wallet_deposit'), {'amount': str(amount)}
+                    else:
+                        url, data = reverse('transaction_transfer'), {'receiver_username': receiver_username, 'amount': str(amount)}
+                    with connection.execute_wrapper(timer):
+                        response = client.post(url, data, content_type='application/json', headers=headers[username])
+                    outcomes[index] = (kind, response.status_code, amount)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes, time.perf_counter() - start
+
+    def check_invariants(self, user_ids, expected_supply):
+        wallets = Wallet.objects.filter(user_id__in=user_ids)
+        totals = wallets.aggregate(supply=Sum('balance'), lowest=Min('balance'))
+        shards = WalletShard.objects.filter(wallet__in=wallets).aggregate(supply=Sum('balance'), lowest=Min('balance'))
+        supply = totals['supply'] + (shards['supply'] or 0)
+        failures = []
+        if supply != expected_supply:
+            failures.append(f"total de dinheiro {supply} != esperado {expected_supply}")
+        lowest = min(totals['lowest'], shards['lowest'] if shards['lowest'] is not None else totals['lowest'])
+        if lowest < 0:
+            failures.append(f"saldo negativo: {lowest}")
+        mismatched = ledger_mismatches(wallets).count()
+        if mismatched:
+            failures.append(f'{mismatched} carteiras com saldo diferente do registro de transações')
+        return failures
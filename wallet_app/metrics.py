@@ -0,0 +1,168 @@
+"""
+Métricas operacionais no formato do Prometheus, expostas em /metrics.
+
+Com vários processos (ex: workers do gunicorn), defina PROMETHEUS_MULTIPROC_DIR com um
+diretório vazio antes de iniciar a aplicação: cada processo grava suas métricas em arquivos
+nesse diretório e o /metrics de qualquer um deles agrega todos (ver gunicorn.conf.py).
+"""
+
+import hmac
+import os
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from wallet_api_challenge.db.pool import pool_stats
+
+from . import services
+
+REQUEST_LATENCY = Histogram(
+    'wallet_http_request_duration_seconds', 'Latência das requisições HTTP, por view.',
+    ['view', 'method'],
+)
+REQUESTS = Counter('wallet_http_requests_total', 'Requisições HTTP, por view e status.', ['view', 'method', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'wallet_http_requests_in_flight', 'Requisições HTTP em andamento.', multiprocess_mode='livesum'
+)
+DB_QUERIES = Histogram(
+    'wallet_http_request_db_queries', 'Consultas SQL por requisição, por view.',
+    ['view'], buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100),
+)
+DB_DURATION = Histogram(
+    'wallet_http_request_db_duration_seconds', 'Tempo gasto em consultas SQL por requisição, por view.',
+    ['view'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+OPERATIONS = Counter('wallet_operations', 'Depósitos e transferências confirmados.', ['operation'])
+OPERATION_AMOUNT = Counter('wallet_operations_amount', 'Valor total movimentado por depósitos e transferências.', ['operation'])
+FAILURES = Counter('wallet_operation_failures', 'Depósitos e transferências recusados, por motivo.', ['operation', 'reason'])
+
+# Liquidação das transferências enfileiradas (comando run_settlement)
+SETTLEMENT_BATCH_SIZE = Histogram(
+    'wallet_settlement_batch_size', 'Transferências liquidadas por transação de banco.',
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000, 2000),
+)
+SETTLEMENT_WALLET_WRITES = Counter(
+    'wallet_settlement_wallet_writes', 'Carteiras gravadas pela liquidação (uma por carteira e lote, ver services.net_transfers).'
+)
+SETTLEMENT_DURATION = Histogram('wallet_settlement_batch_duration_seconds', 'Duração de cada lote de liquidação.')
+SETTLEMENT_LATENCY = Histogram(
+    'wallet_settlement_latency_seconds', 'Tempo entre aceitar uma transferência e liquidá-la (ou recusá-la).',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class ConnectionPoolCollector:
+    """
+    Métricas dos pools de conexões do processo (DB_POOL=1), lidas de pool_stats() a cada
+    coleta e rotuladas por 'alias/banco'. Com PROMETHEUS_MULTIPROC_DIR, são as do processo
+    que respondeu ao /metrics: o pool é de cada processo.
+    """
+    # (nome, documentação, chave em ConnectionPool.stats(), fator de conversão)
+    GAUGES = (
+        ('wallet_db_pool_connections', 'Conexões abertas pelo pool.', 'pool_size', 1),
+        ('wallet_db_pool_connections_available', 'Conexões ociosas no pool.', 'pool_available', 1),
+        ('wallet_db_pool_connections_max', 'Máximo de conexões simultâneas do pool.', 'pool_max', 1),
+        ('wallet_db_pool_wait_max_seconds', 'Maior espera por uma conexão do pool.', 'requests_wait_max_ms', 0.001),
+    )
+    COUNTERS = (
+        ('wallet_db_pool_requests', 'Conexões retiradas do pool (getconn).', 'requests_num', 1),
+        ('wallet_db_pool_requests_queued', 'Retiradas que esperaram por uma conexão.', 'requests_queued', 1),
+        ('wallet_db_pool_requests_errors', 'Retiradas que estouraram o tempo limite.', 'requests_errors', 1),
+        ('wallet_db_pool_wait_seconds', 'Tempo total de espera por conexões do pool.', 'requests_wait_ms', 0.001),
+        ('wallet_db_pool_connections_opened', 'Conexões abertas pelo pool desde o início.', 'connections_num', 1),
+        ('wallet_db_pool_connections_lost', 'Conexões descartadas pelo pool.', 'connections_lost', 1),
+    )
+
+    def collect(self):
+        stats = pool_stats()
+        for kind, specs in ((GaugeMetricFamily, self.GAUGES), (CounterMetricFamily, self.COUNTERS)):
+            for name, documentation, key, factor in specs:
+                family = kind(name, documentation, labels=['pool'])
+                for pool, values in stats.items():
+                    family.add_metric([pool], values[key] * factor)
+                yield family
+
+
+POOL_COLLECTOR = ConnectionPoolCollector()
+REGISTRY.register(POOL_COLLECTOR)
+
+# Motivo de falha de cada mensagem de erro dos services
+FAILURE_REASONS = {
+    services.INSUFFICIENT_BALANCE_ERROR: 'insufficient_balance',
+    services.RECEIVER_NOT_FOUND_ERROR: 'receiver_not_found',
+    services.SELF_TRANSFER_ERROR: 'self_transfer',
+    services.WALLET_NOT_FOUND_ERROR: 'wallet_not_found',
+}
+
+
+def observe_request(view, method, status_code, duration, db_queries, db_duration):
+    REQUEST_LATENCY.labels(view, method).observe(duration)
+    REQUESTS.labels(view, method, str(status_code)).inc()
+    DB_QUERIES.labels(view).observe(db_queries)
+    DB_DURATION.labels(view).observe(db_duration)
+
+
+def record_operations(operation, amounts):
+    """
+    Contabiliza operações já confirmadas no banco e seus valores.
+    """
+    OPERATIONS.labels(operation).inc(len(amounts))
+    OPERATION_AMOUNT.labels(operation).inc(float(sum(amounts)))
+
+
+def record_failure(operation, error):
+    """
+    Contabiliza uma operação recusada, a partir da mensagem de erro dos services.
+    """
+    FAILURES.labels(operation, FAILURE_REASONS.get(error, 'other')).inc()
+
+
+def record_batch(results, committed=False):
+    """
+    Contabiliza os itens de um lote de transferências: os recusados, por motivo, e, se o
+    lote foi confirmado, os realizados.
+    """
+    for result in results:
+        if result['status'] == 'erro':
+            record_failure('transfer', result['erro'])
+    if committed:
+        record_operations('transfer', [result['amount'] for result in results if result['status'] == 'ok'])
+
+
+def record_settlement(pending, wallet_writes, duration):
+    """
+    Contabiliza um lote de transferências enfileiradas já liquidado (ver services.settle_pending).
+    """
+    SETTLEMENT_BATCH_SIZE.observe(len(pending))
+    SETTLEMENT_WALLET_WRITES.inc(wallet_writes)
+    SETTLEMENT_DURATION.observe(duration)
+    settled = []
+    for item in pending:
+        SETTLEMENT_LATENCY.observe((item.settled_at - item.created_at).total_seconds())
+        if item.error:
+            record_failure('transfer', item.error)
+        else:
+            settled.append(item.amount)
+    record_operations('transfer', settled)
+
+
+def metrics_view(request):
+    """
+    Exporta as métricas no formato de texto do Prometheus. Se WALLET_METRICS_TOKEN estiver
+    definido, exige o cabeçalho `Authorization: Bearer <token>`.
+    """
+    token = getattr(settings, 'WALLET_METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(POOL_COLLECTOR)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
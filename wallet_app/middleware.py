@@ -0,0 +1,214 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger('wallet_app.performance')
+
+MAX_LOGGED_QUERIES = 200
+
+# Medições da requisição em andamento. Uma variável de contexto (e não a conexão da thread)
+# porque as consultas de uma requisição assíncrona rodam em outras threads, cada uma com sua
+# conexão; o contexto é copiado para elas por sync_to_async.
+_current_timing = ContextVar('wallet_request_timing', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute_wrapper instalado em todas as conexões: mede as consultas da requisição atual.
+    """
+    timing = _current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Receptor do sinal connection_created: instala record_query na conexão (uma vez por objeto
+    de conexão, que é reaproveitado quando ela é reaberta).
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure_authentication():
+    """
+    Mede a autenticação da requisição atual (decodificação e validação do token JWT e, fora do
+    modo sem estado, a carga do usuário). Usado pelos autenticadores de wallet_app.authentication
+    e pelas views assíncronas; o tempo medido também faz parte do tempo da view.
+    """
+    timing = _current_timing.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing.auth = (timing.auth or 0.0) + time.perf_counter() - start
+
+
+class RequestTiming:
+    """
+    Medições de uma requisição: tempo total, das consultas SQL (via record_query),
+    da autenticação (via measure_authentication), da view e da renderização.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.auth = None
+        self.view_start = None
+        self.view = None
+        self.render_start = None
+        self.render = None
+        self.db = 0.0
+        self.queries = []
+
+    def add_query(self, sql, duration):
+        self.db += duration
+        self.queries.append((sql, duration))
+
+    def finish(self):
+        end = time.perf_counter()
+        self.total = end - self.start
+        if self.view is None and self.view_start is not None:
+            self.view = end - self.view_start
+
+    def server_timing(self):
+        """
+        Valor do cabeçalho Server-Timing (durações em milissegundos).
+        """
+        parts = [f'db;dur={self.db * 1000:.2f};desc="{len(self.queries)} queries"']
+        if self.auth is not None:
+            parts.append(f'auth;dur={self.auth * 1000:.2f}')
+        if self.view is not None:
+            parts.append(f'view;dur={self.view * 1000:.2f}')
+        if self.render is not None:
+            parts.append(f'render;dur={self.render * 1000:.2f}')
+        parts.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(parts)
+
+    def as_log_record(self, request, response, include_sql=False):
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': ms(self.total),
+            'db_ms': ms(self.db),
+            'db_queries': len(self.queries),
+            'auth_ms': ms(self.auth),
+            'view_ms': ms(self.view),
+            'render_ms': ms(self.render),
+        }
+        if include_sql:
+            # Apenas o SQL parametrizado: os parâmetros podem conter dados sensíveis
+            record['sql'] = [
+                {'sql': sql, 'ms': ms(duration)} for sql, duration in self.queries[:MAX_LOGGED_QUERIES]
+            ]
+        return record
+
+
+class RequestTimingMiddleware:
+    """
+    Mede cada requisição e expõe o resultado no cabeçalho Server-Timing (db, auth, view,
+    render e total), em uma linha de log JSON no logger 'wallet_app.performance' e nas métricas do
+    Prometheus (ver wallet_app.metrics), rotuladas pelo nome da URL.
+
+    - WALLET_SERVER_TIMING: inclui o cabeçalho Server-Timing nas respostas.
+    - WALLET_TIMING_LOG_SAMPLE_RATE: fração das requisições registradas no log (0 a 1).
+    - WALLET_SLOW_REQUEST_MS: requisições mais lentas que isso são sempre registradas, com
+      nível WARNING e a lista das consultas SQL executadas.
+
+    Deve ser o primeiro middleware, para que o tempo total inclua os demais. Funciona tanto
+    no modo síncrono (WSGI) quanto no assíncrono (ASGI), sem trocar de thread. Em respostas
+    em streaming (ex: exportação), mede apenas até o envio dos cabeçalhos.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # No modo assíncrono, ganchos síncronos seriam executados em outra thread
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = request._timing = RequestTiming()
+        token = _current_timing.set(timing)
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            _current_timing.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = request._timing = RequestTiming()
+        token = _current_timing.set(timing)
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            _current_timing.reset(token)
+        return self.finish(request, response, timing)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing.view_start = time.perf_counter()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        request._timing.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        return self.start_render(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.start_render(request, response)
+
+    def start_render(self, request, response):
+        """
+        Chamado após a view e antes da renderização das respostas do DRF.
+        """
+        timing = request._timing
+        timing.render_start = time.perf_counter()
+        if timing.view_start is not None:
+            timing.view = timing.render_start - timing.view_start
+
+        def rendered(response):
+            timing.render = time.perf_counter() - timing.render_start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timing):
+        timing.finish()
+        view = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        metrics.observe_request(view, request.method, response.status_code, timing.total, len(timing.queries), timing.db)
+        if getattr(settings, 'WALLET_SERVER_TIMING', True):
+            response['Server-Timing'] = timing.server_timing()
+
+        slow = timing.total * 1000 >= getattr(settings, 'WALLET_SLOW_REQUEST_MS', 500)
+        if slow:
+            logger.warning(json.dumps(timing.as_log_record(request, response, include_sql=True)))
+        elif random.random() < getattr(settings, 'WALLET_TIMING_LOG_SAMPLE_RATE', 0.0):
+            logger.info(json.dumps(timing.as_log_record(request, response)))
+        return response
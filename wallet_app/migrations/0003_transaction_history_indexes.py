@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet_app', '0002_alter_transaction_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sender', '-timestamp', '-id'], name='tx_sender_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['receiver', '-timestamp', '-id'], name='tx_receiver_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,106 @@
+"""
+Converte wallet_app_transaction em uma tabela particionada por mês em `timestamp`
+(particionamento declarativo do PostgreSQL; ver wallet_app.partitions).
+
+A tabela é recriada e as linhas existentes copiadas, então em bases grandes a migração
+deve rodar em uma janela de manutenção. O modelo do Django não muda: a chave primária no
+banco passa a ser (id, timestamp), como o PostgreSQL exige, e o id continua vindo de uma
+sequência. Em outros bancos (ex: SQLite), a migração não faz nada.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations
+
+from wallet_app.partitions import rename_partition_indexes
+
+TABLE = 'wallet_app_transaction'
+NEW_TABLE = 'wallet_app_transaction_new'
+SEQUENCE = 'wallet_app_transaction_id_seq'
+MONTHS_AHEAD = 3
+
+
+def _months(first, last):
+    month = datetime(first.year, first.month, 1, tzinfo=dt_timezone.utc)
+    while month <= last:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+        yield month, following
+        month = following
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Recria a tabela (particionada ou não) com as mesmas colunas, linhas, índices, chaves
+    estrangeiras e sequência do id.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname <> %s", [TABLE, f'{TABLE}_pkey']
+        )
+        indexes = [row[0].replace(' ONLY ', ' ') for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT max(id), min(timestamp) FROM {quote(TABLE)}")
+        max_id, first_timestamp = cursor.fetchone()
+
+        cursor.execute(
+            f"CREATE TABLE {quote(NEW_TABLE)} (LIKE {quote(TABLE)} INCLUDING CONSTRAINTS)"
+            + (' PARTITION BY RANGE (timestamp)' if partitioned else '')
+        )
+        if partitioned:
+            now = datetime.now(dt_timezone.utc)
+            last = datetime(now.year + (now.month - 1 + MONTHS_AHEAD) // 12,
+                            (now.month - 1 + MONTHS_AHEAD) % 12 + 1, 1, tzinfo=dt_timezone.utc)
+            for month, following in _months(min(first_timestamp or now, now), last):
+                cursor.execute(
+                    f"CREATE TABLE {quote(f'{TABLE}_p{month:%Y%m}')} PARTITION OF {quote(NEW_TABLE)} "
+                    f"FOR VALUES FROM (%s) TO (%s)", [month.isoformat(), following.isoformat()]
+                )
+            cursor.execute(f"CREATE TABLE {quote(f'{TABLE}_default')} PARTITION OF {quote(NEW_TABLE)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {quote(NEW_TABLE)} SELECT * FROM {quote(TABLE)}")
+        cursor.execute(f"DROP TABLE {quote(TABLE)}") # Leva junto os índices e a sequência antiga
+        cursor.execute(f"ALTER TABLE {quote(NEW_TABLE)} RENAME TO {quote(TABLE)}")
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f'{TABLE}_pkey')} "
+            f"PRIMARY KEY {'(id, timestamp)' if partitioned else '(id)'}"
+        )
+        cursor.execute(f"CREATE SEQUENCE {quote(SEQUENCE)} OWNED BY {quote(TABLE)}.id")
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} ALTER COLUMN id SET DEFAULT nextval(%s)", [SEQUENCE])
+        if max_id is not None:
+            cursor.execute("SELECT setval(%s, %s)", [SEQUENCE, max_id])
+        for index in indexes:
+            cursor.execute(index)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}")
+
+    if partitioned:
+        # Nomeia os índices das partições a partir dos índices da tabela (ver wallet_app.partitions)
+        rename_partition_indexes(connection)
+
+
+def partition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet_app', '0004_wallet_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
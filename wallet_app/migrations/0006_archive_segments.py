@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet_app', '0005_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Segmento arquivado',
+                'verbose_name_plural': 'Segmentos arquivados',
+                'ordering': ['first_timestamp'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveSegmentUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_count', models.PositiveIntegerField()),
+                ('received', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('sent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='users', to='wallet_app.archivesegment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_segments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Usuário de segmento arquivado',
+                'verbose_name_plural': 'Usuários de segmentos arquivados',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivesegmentuser',
+            constraint=models.UniqueConstraint(fields=('user', 'segment'), name='archive_segment_user_uniq'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet_app', '0007_wallet_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendente'), ('SETTLED', 'Liquidada'), ('REJECTED', 'Recusada')], default='PENDING', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('transaction_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_transfers_received', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_transfers_sent', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transferência pendente',
+                'verbose_name_plural': 'Transferências pendentes',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['id'], name='pending_transfer_queue_idx')],
+            },
+        ),
+    ]
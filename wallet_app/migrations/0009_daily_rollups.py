@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet_app', '0008_pending_transfers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('DEPOSIT', 'Depósito'), ('TRANSFER', 'Transferência')], max_length=10)),
+                ('bucket', models.PositiveSmallIntegerField(default=0)),
+                ('received_count', models.PositiveIntegerField(default=0)),
+                ('received_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('sent_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Total diário',
+                'verbose_name_plural': 'Totais diários',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'transaction_type', 'bucket'), name='daily_rollup_uniq'),
+        ),
+    ]
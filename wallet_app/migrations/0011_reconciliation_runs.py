@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet_app', '0010_transaction_balance_after'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('FULL', 'Completa'), ('INCREMENTAL', 'Incremental')], max_length=12)),
+                ('lower_user_id', models.PositiveIntegerField()),
+                ('upper_user_id', models.PositiveIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('since', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Conferência de saldos',
+                'verbose_name_plural': 'Conferências de saldos',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReconciliationRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lower_user_id', models.PositiveIntegerField()),
+                ('upper_user_id', models.PositiveIntegerField()),
+                ('wallets', models.PositiveIntegerField()),
+                ('mismatches', models.JSONField(default=list)),
+                ('checked_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranges', to='wallet_app.reconciliationrun')),
+            ],
+            options={
+                'verbose_name': 'Intervalo conferido',
+                'verbose_name_plural': 'Intervalos conferidos',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reconciliationrange',
+            constraint=models.UniqueConstraint(fields=('run', 'lower_user_id'), name='reconciliation_range_uniq'),
+        ),
+    ]
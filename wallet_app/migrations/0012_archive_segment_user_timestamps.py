@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def copy_segment_timestamps(apps, schema_editor):
+    """
+    Os segmentos já gravados não guardam o período de cada usuário: usa o do segmento, que o
+    contém (apenas menos preciso para ignorar segmentos).
+    """
+    ArchiveSegment = apps.get_model('wallet_app', 'ArchiveSegment')
+    for segment in ArchiveSegment.objects.all():
+        segment.users.update(first_timestamp=segment.first_timestamp, last_timestamp=segment.last_timestamp)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet_app', '0011_reconciliation_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivesegmentuser',
+            name='first_timestamp',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='archivesegmentuser',
+            name='last_timestamp',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_segment_timestamps, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='archivesegmentuser',
+            name='first_timestamp',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='archivesegmentuser',
+            name='last_timestamp',
+            field=models.DateTimeField(),
+        ),
+    ]
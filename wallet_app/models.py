@@ -1,4 +1,7 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Sum
 from django.contrib.auth.models import User
 
 class Wallet(models.Model):
@@ -8,13 +11,48 @@ class Wallet(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Incrementada a cada alteração de saldo; ordena as escritas no cache de saldo (ver cache.BalanceCache)
+    version = models.PositiveBigIntegerField(default=0)
+    # Carteira quente: com shard_count > 0, os créditos vão para um dos WalletShard, sem bloquear esta linha
+    shard_count = models.PositiveSmallIntegerField(default=0)
 
     class Meta:
         verbose_name = "Carteira"
         verbose_name_plural = "Carteiras"
 
     def __str__(self):
-        return f"Carteira de {self.user.username} - Saldo: {self.balance}"
+        return f"Carteira de {self.user.username} - Saldo: {self.total_balance}"
+
+    @property
+    def total_balance(self):
+        """
+        Saldo disponível: `balance` mais, em carteiras quentes, o saldo dos shards (calculado
+        pelos services em `shard_balance` ou, se ausente, consultado aqui).
+        """
+        if not self.shard_count:
+            return self.balance
+        if getattr(self, 'shard_balance', None) is None:
+            self.shard_balance = self.shards.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+        return self.balance + self.shard_balance
+
+class WalletShard(models.Model):
+    """
+    Parte do saldo de uma carteira quente (ex: a de um lojista que recebe muitas
+    transferências por segundo). Cada crédito vai para um shard sorteado, de modo que
+    transferências concorrentes para a mesma carteira disputam N linhas em vez de uma.
+    Os débitos bloqueiam a carteira e todos os shards; consolidate_shards devolve
+    periodicamente o saldo dos shards para a carteira (ver services).
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    class Meta:
+        verbose_name = "Shard de carteira"
+        verbose_name_plural = "Shards de carteira"
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='wallet_shard_uniq'),
+        ]
 
 class Transaction(models.Model):
     """
@@ -30,14 +68,186 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     timestamp = models.DateTimeField() # Removido auto_now_add=True
+    # Saldos (carteira mais shards) do remetente e do destinatário logo após a transação, gravados
+    # pelos services; nulos enquanto desconhecidos (créditos em carteiras quentes e linhas
+    # anteriores à migração 0010), até o comando backfill_balances (ver wallet_app.balances)
+    sender_balance_after = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    receiver_balance_after = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     class Meta:
         verbose_name = "Transação"
         verbose_name_plural = "Transações"
         ordering = ['-timestamp'] # Ordena as transações mais recentes primeiro
+        indexes = [
+            # Atendem o histórico de um usuário (ver queries.TransactionHistory) já na ordem da paginação
+            models.Index(fields=['sender', '-timestamp', '-id'], name='tx_sender_timestamp_idx'),
+            models.Index(fields=['receiver', '-timestamp', '-id'], name='tx_receiver_timestamp_idx'),
+        ]
 
     def __str__(self):
         if self.transaction_type == 'DEPOSIT':
             return f"Depósito de {self.amount} para {self.receiver.username} em {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
         else:
             return f"Transferência de {self.amount} de {self.sender.username} para {self.receiver.username} em {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class PendingTransfer(models.Model):
+    """
+    Transferência aceita pela API no modo assíncrono (WALLET_TRANSFER_MODE = 'queued') e
+    ainda não liquidada, ou já liquidada/recusada. A fila é drenada em micro-lotes pelo
+    comando run_settlement (ver services.settle_pending).
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_SETTLED = 'SETTLED'
+    STATUS_REJECTED = 'REJECTED'
+    STATUSES = (
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_SETTLED, 'Liquidada'),
+        (STATUS_REJECTED, 'Recusada'),
+    )
+
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_transfers_sent')
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_transfers_received')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    error = models.CharField(max_length=255, blank=True)
+    # Id da Transaction criada; sem chave estrangeira, já que a chave primária da tabela
+    # particionada de transações é (id, timestamp) (ver migração 0005)
+    transaction_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Transferência pendente"
+        verbose_name_plural = "Transferências pendentes"
+        indexes = [
+            # A fila: apenas as pendentes, na ordem de chegada
+            models.Index(fields=['id'], condition=models.Q(status='PENDING'), name='pending_transfer_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Transferência pendente {self.id} de {self.amount} ({self.get_status_display()})"
+
+class DailyRollup(models.Model):
+    """
+    Totais diários de um usuário por tipo de transação: quantidade e valor recebidos
+    (depósitos e transferências recebidas) e enviados, com o dia no fuso local. Mantidos
+    pelos services a cada depósito e transferência (ver wallet_app.rollups) e recalculados
+    pelo comando rebuild_rollups. Servem o endpoint transactions/summary/.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    # Carteiras quentes espalham seus créditos entre vários buckets, para que as transferências
+    # concorrentes não disputem a mesma linha (ver rollups.record); as consultas somam os buckets
+    bucket = models.PositiveSmallIntegerField(default=0)
+    received_count = models.PositiveIntegerField(default=0)
+    received_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    sent_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Total diário"
+        verbose_name_plural = "Totais diários"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'transaction_type', 'bucket'], name='daily_rollup_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Totais de {self.user_id} em {self.day} ({self.transaction_type})"
+
+class ArchiveSegment(models.Model):
+    """
+    Segmento do arquivo morto: um arquivo comprimido, em colunas, com transações antigas
+    de um mês, retiradas da tabela de transações pelo comando archive_transactions
+    (ver wallet_app.archive).
+    """
+    path = models.CharField(max_length=255, unique=True) # Relativo a WALLET_ARCHIVE_DIR
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    row_count = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64) # SHA-256 das linhas (ver archive.rows_checksum)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Segmento arquivado"
+        verbose_name_plural = "Segmentos arquivados"
+        ordering = ['first_timestamp']
+
+    def __str__(self):
+        return f"{self.path} ({self.row_count} transações)"
+
+class ArchiveSegmentUser(models.Model):
+    """
+    Índice por usuário do arquivo morto: em quais segmentos o usuário aparece, com quantas
+    transações, o período delas e os totais recebido e enviado, que mantêm o saldo explicado
+    pelo registro de transações (ver queries.wallets_with_ledger_balance). O período e a
+    quantidade permitem ignorar os segmentos fora do período pedido, e contar as transações
+    dos que estão inteiramente dentro dele, sem ler os arquivos (ver archive.ArchivedTransactions).
+    """
+    segment = models.ForeignKey(ArchiveSegment, on_delete=models.CASCADE, related_name='users')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_segments')
+    row_count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField() # Primeira transação do usuário no segmento
+    last_timestamp = models.DateTimeField() # Última transação do usuário no segmento
+    received = models.DecimalField(max_digits=14, decimal_places=2) # Depósitos e transferências recebidas
+    sent = models.DecimalField(max_digits=14, decimal_places=2) # Transferências enviadas
+
+    class Meta:
+        verbose_name = "Usuário de segmento arquivado"
+        verbose_name_plural = "Usuários de segmentos arquivados"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'segment'], name='archive_segment_user_uniq'),
+        ]
+
+class ReconciliationRun(models.Model):
+    """
+    Execução do comando reconcile_wallets: a conferência do saldo das carteiras com o registro
+    de transações, em intervalos de ids de usuário. Os intervalos já conferidos
+    (ReconciliationRange) são o ponto de retomada de uma execução interrompida.
+    """
+    MODE_FULL = 'FULL'
+    MODE_INCREMENTAL = 'INCREMENTAL'
+    MODES = (
+        (MODE_FULL, 'Completa'),
+        (MODE_INCREMENTAL, 'Incremental'),
+    )
+
+    mode = models.CharField(max_length=12, choices=MODES)
+    # Intervalos [lower_user_id + k * chunk_size, ...) até upper_user_id (exclusivo)
+    lower_user_id = models.PositiveIntegerField()
+    upper_user_id = models.PositiveIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # Modo incremental: apenas as carteiras com transações a partir deste instante
+    since = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Conferência de saldos"
+        verbose_name_plural = "Conferências de saldos"
+
+    def __str__(self):
+        return f"Conferência {self.id} ({self.get_mode_display()}) em {self.started_at:%Y-%m-%d %H:%M}"
+
+class ReconciliationRange(models.Model):
+    """
+    Intervalo de ids de usuário já conferido por uma ReconciliationRun, com as divergências
+    encontradas. Gravado quando o intervalo termina, então marca o progresso da execução.
+    """
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='ranges')
+    lower_user_id = models.PositiveIntegerField()
+    upper_user_id = models.PositiveIntegerField()
+    wallets = models.PositiveIntegerField() # Carteiras conferidas
+    # [{"user_id": ..., "balance": "...", "ledger_balance": "..."}]
+    mismatches = models.JSONField(default=list)
+    checked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Intervalo conferido"
+        verbose_name_plural = "Intervalos conferidos"
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'lower_user_id'], name='reconciliation_range_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Usuários {self.lower_user_id}-{self.upper_user_id - 1} da conferência {self.run_id}"
@@ -0,0 +1,164 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.db import models
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) sobre o par (timestamp, id), do mais recente para o mais antigo.
+
+    Em vez de OFFSET, cada página filtra as linhas anteriores à última linha da página atual,
+    de modo que o custo de uma página não cresce com a sua profundidade. O cursor é opaco
+    para o cliente (base64). O total de registros é incluído por padrão, mas pode ser omitido
+    com `?count=false` para evitar o COUNT(*) sobre todo o histórico.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = 10
+    max_page_size = 100
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position = self._start(request)
+        if self.include_count(request):
+            self.count = queryset.count()
+        rows = list(self.fetch_rows(queryset, position, self.reverse, self.limit + 1))
+        return self._finish(rows, position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Versão assíncrona de paginate_queryset, usando o ORM assíncrono do Django.
+        """
+        position = self._start(request)
+        if self.include_count(request):
+            self.count = await queryset.acount()
+        rows = [row async for row in self.fetch_rows(queryset, position, self.reverse, self.limit + 1)]
+        return self._finish(rows, position)
+
+    def _start(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_page_size(request)
+        self.count = None
+        position, self.reverse = self.decode_cursor(request)
+        return position
+
+    def _finish(self, rows, position):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+
+        # Uma página anterior existe sempre que chegamos aqui por um cursor de avanço, e vice-versa
+        if self.reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def fetch_rows(self, queryset, position, reverse, limit):
+        """
+        Retorna até `limit` linhas após `position` na direção indicada.
+        Ordena por (timestamp, id) decrescentes, ou crescentes quando `reverse` é verdadeiro.
+        """
+        if reverse:
+            ordering = ('timestamp', 'id')
+        else:
+            ordering = ('-timestamp', '-id')
+
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        return queryset.order_by(*ordering)[:limit]
+
+    def keyset_filter(self, position, reverse):
+        """
+        Monta a condição (timestamp, id) < (t, i), ou > (t, i) quando `reverse` é verdadeiro.
+        """
+        timestamp, pk = position
+        if reverse:
+            return models.Q(timestamp__gt=timestamp) | models.Q(timestamp=timestamp, id__gt=pk)
+        return models.Q(timestamp__lt=timestamp) | models.Q(timestamp=timestamp, id__lt=pk)
+
+    def get_page_size(self, request):
+        """
+        Retorna o tamanho de página pedido pelo cliente, limitado a `max_page_size`.
+        """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def include_count(self, request):
+        """
+        Indica se o total de registros deve ser calculado (padrão: sim).
+        """
+        value = request.query_params.get(self.count_query_param, 'true')
+        return value.lower() not in ('false', '0', 'no')
+
+    def decode_cursor(self, request):
+        """
+        Decodifica o cursor da query string em ((timestamp, id), reverse).
+        Sem cursor, retorna (None, False), isto é, a primeira página.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+            position = (datetime.fromisoformat(data['t']), int(data['i']))
+            return position, bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        """
+        Codifica a posição de `row` (instância ou dicionário de values()) como um cursor
+        opaco e devolve a URL correspondente.
+        """
+        if isinstance(row, dict):
+            timestamp, pk = row['timestamp'], row['id']
+        else:
+            timestamp, pk = row.timestamp, row.id
+        data = {'t': timestamp.isoformat(), 'i': pk}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('ascii'), altchars=b'-_')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        response = {}
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return response
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
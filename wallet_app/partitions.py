@@ -0,0 +1,163 @@
+"""
+Particionamento mensal da tabela de transações (PostgreSQL, particionamento declarativo por
+intervalo em `timestamp`), criado pela migração 0005_partition_transactions.
+
+Cada mês tem sua partição, `wallet_app_transaction_pAAAAMM`, com limites em UTC
+(`[primeiro dia do mês, primeiro dia do mês seguinte)`). Linhas fora de qualquer partição
+mensal caem na partição padrão, `wallet_app_transaction_default`. As partições futuras são
+criadas com antecedência e as antigas desanexadas pelo comando manage_partitions, depois
+que suas linhas forem movidas para o arquivo morto (comando archive_transactions).
+"""
+
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection as default_connection, transaction
+
+from .models import Transaction
+
+TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME_RE = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+class PartitionNotArchived(Exception):
+    """
+    A partição ainda tem transações, que ainda não foram movidas para o arquivo morto.
+    """
+
+
+def month_start(value):
+    """
+    Primeiro instante (UTC) do mês de `value` (date ou datetime).
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def monthly_partitions(connection=default_connection):
+    """
+    Partições mensais anexadas à tabela, como {mês (datetime UTC): nome}, em ordem.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = {}
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            months[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return dict(sorted(months.items()))
+
+
+def partition_index_name(partition, parent_index):
+    """
+    Nome do índice de uma partição: o nome da partição seguido do nome do índice da tabela
+    (sem o prefixo da tabela), ex: wallet_app_transaction_p202610_tx_sender_timestamp_idx,
+    para que os planos de execução mostrem qual índice do modelo está sendo usado.
+    """
+    suffix = parent_index[len(TABLE) + 1:] if parent_index.startswith(f'{TABLE}_') else parent_index
+    return f'{partition}_{suffix}'[:63]
+
+
+def rename_partition_indexes(connection=default_connection):
+    """
+    Renomeia os índices das partições (que o PostgreSQL nomeia automaticamente) conforme
+    partition_index_name.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT parent_index.relname, partition.relname, child_index.relname FROM pg_inherits "
+            "JOIN pg_class parent_index ON parent_index.oid = pg_inherits.inhparent "
+            "JOIN pg_index parent ON parent.indexrelid = parent_index.oid "
+            "JOIN pg_class child_index ON child_index.oid = pg_inherits.inhrelid "
+            "JOIN pg_index child ON child.indexrelid = child_index.oid "
+            "JOIN pg_class partition ON partition.oid = child.indrelid "
+            "WHERE parent.indrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        for parent_index, partition, child_index in cursor.fetchall():
+            name = partition_index_name(partition, parent_index)
+            if child_index != name:
+                cursor.execute(f"ALTER INDEX {quote(child_index)} RENAME TO {quote(name)}")
+
+
+def create_partition(month, connection=default_connection):
+    """
+    Cria a partição do mês, se ainda não existir. Retorna (nome, linhas movidas), ou None
+    se ela já existia.
+
+    Se a partição padrão tiver linhas desse mês, elas são movidas para a nova partição
+    antes de anexá-la (o PostgreSQL recusa anexar uma partição cujas linhas ainda estão
+    na partição padrão).
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if month in monthly_partitions(connection):
+        return None
+
+    quote = connection.ops.quote_name
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} "
+            f"WHERE \"timestamp\" >= %s AND \"timestamp\" < %s RETURNING *) "
+            f"INSERT INTO {quote(name)} SELECT * FROM moved",
+            bounds,
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        rename_partition_indexes(connection)
+    return name, moved
+
+
+def detach_partition(name, drop=False, connection=default_connection):
+    """
+    Desanexa uma partição vazia, mantendo-a como tabela avulsa de mesmo nome (ou apagando-a,
+    com drop=True).
+
+    Levanta PartitionNotArchived, sem desanexar, se a partição ainda tiver linhas: elas
+    sumiriam do registro de transações sem entrar nos totais do arquivo morto, e as
+    conferências de saldo (queries.ledger_mismatches, reconcile_wallets), balances.balance_at
+    e rollups.rebuild passariam a divergir das carteiras. As linhas devem antes ser
+    arquivadas (comando archive_transactions), que as remove da tabela e registra os totais
+    de cada usuário. A verificação é feita após o DETACH, na mesma transação, enquanto a
+    partição está bloqueada, de modo que nenhuma linha entra entre ela e a desanexação.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {quote(name)})")
+        if cursor.fetchone()[0]:
+            raise PartitionNotArchived(f'A partição {name} ainda tem transações; arquive-as antes com archive_transactions.')
+        if drop:
+            cursor.execute(f"DROP TABLE {quote(name)}")
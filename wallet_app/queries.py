@@ -0,0 +1,275 @@
+import heapq
+from functools import cmp_to_key
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import archive
+from .models import ArchiveSegmentUser, Transaction, Wallet, WalletShard
+
+
+class TransactionHistory:
+    """
+    Histórico de transações de um usuário, montado como UNION ALL de dois ramos:
+    as transações em que ele é remetente e aquelas em que é apenas destinatário.
+
+    Cada ramo é servido pelos índices compostos (sender, -timestamp, -id) e
+    (receiver, -timestamp, -id) já na ordem desejada, então buscar as N linhas mais recentes
+    é uma junção top-N de duas varreduras de índice, sem o BitmapOr + DISTINCT + Sort da
+    consulta `Q(sender) | Q(receiver)`. Os depósitos (remetente == destinatário) ficam apenas
+    no primeiro ramo, o que dispensa o DISTINCT.
+
+    Se houver transações no arquivo morto (ver wallet_app.archive), elas são incluídas de
+    forma transparente: as mesmas condições são aplicadas às linhas arquivadas do usuário
+    (apenas dos segmentos do período) e o resultado é intercalado com o do banco na ordem
+    pedida. Sem arquivo morto, nada muda (e nenhuma consulta extra é feita).
+
+    Expõe o subconjunto da API de QuerySet usado pelas views e pela paginação:
+    filter(), exclude(), values(), order_by(), count(), fatiamento e iteração.
+    """
+    default_ordering = ('-timestamp', '-id')
+
+    def __init__(self, user_id, branches=None, ordering=None, archived=None):
+        self.user_id = user_id
+        if branches is None:
+            branches = (
+                Transaction.objects.filter(sender_id=user_id),
+                Transaction.objects.filter(receiver_id=user_id).exclude(sender_id=user_id),
+            )
+            if archive.has_segments():
+                archived = archive.ArchivedTransactions(user_id)
+        self.branches = tuple(branches)
+        self.ordering = tuple(ordering or self.default_ordering)
+        self.archived = archived
+
+    def _clone(self, branches=None, ordering=None, archived=None):
+        return TransactionHistory(
+            self.user_id,
+            branches=self.branches if branches is None else branches,
+            ordering=self.ordering if ordering is None else ordering,
+            archived=self.archived if archived is None else archived,
+        )
+
+    def _apply(self, method, *args, **kwargs):
+        archived = None
+        if self.archived is not None:
+            if kwargs and method == 'values':
+                raise TypeError('values() com expressões não é suportado com o arquivo morto.')
+            archived = getattr(self.archived, method)(*args, **kwargs)
+        return self._clone(branches=[getattr(branch, method)(*args, **kwargs) for branch in self.branches],
+                           archived=archived)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def values(self, *fields, **expressions):
+        return self._apply('values', *fields, **expressions)
+
+    def order_by(self, *fields):
+        if self.archived is not None:
+            self.archived.order_by(*fields) # Recusa já aqui os campos que o arquivo morto não guarda
+        return self._clone(ordering=fields)
+
+    def count(self):
+        """
+        Soma as contagens dos ramos, que são disjuntos; cada uma é atendida pelo seu índice.
+        """
+        total = sum(branch.count() for branch in self.branches)
+        if self.archived is not None:
+            total += self.archived.count()
+        return total
+
+    async def acount(self):
+        """
+        Versão assíncrona de count().
+        """
+        total = 0
+        for branch in self.branches:
+            total += await branch.acount()
+        if self.archived is not None:
+            total += await sync_to_async(self.archived.count)()
+        return total
+
+    def _union(self, limit=None):
+        """
+        Monta o UNION ALL ordenado. Com `limit`, cada ramo já é limitado às suas `limit`
+        primeiras linhas antes da junção.
+        """
+        parts = [branch.order_by(*self.ordering) for branch in self.branches]
+        if limit is not None:
+            parts = [part[:limit] for part in parts]
+        return parts[0].union(*parts[1:], all=True).order_by(*self.ordering)
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice) or k.step is not None:
+            raise TypeError("TransactionHistory suporta apenas fatiamento simples.")
+        if self.archived is not None:
+            return _MergedRows(self, k)
+        if k.stop is None:
+            return self._union()[k]
+        return self._union(limit=k.stop)[k]
+
+    def __iter__(self):
+        if self.archived is not None:
+            return iter(self[:])
+        return iter(self._union())
+
+    def iterator(self, chunk_size=2000):
+        """
+        Itera sobre todo o histórico usando um cursor do lado do servidor, lendo
+        `chunk_size` linhas por vez sem carregar o resultado inteiro em memória.
+        As linhas arquivadas, se houver, são intercaladas na ordem.
+        """
+        rows = self._union().iterator(chunk_size=chunk_size)
+        if self.archived is None:
+            return rows
+        key, reverse = self._merge_key()
+        return heapq.merge(rows, self.archived.order_by(*self.ordering).rows(), key=key, reverse=reverse)
+
+    def _merge_key(self):
+        """
+        Chave de ordenação (e direção) para intercalar linhas do banco e do arquivo morto. Com
+        todos os campos na mesma direção, a chave é a tupla dos valores; com direções mistas
+        (ex: ('-timestamp', 'id')), um comparador campo a campo.
+        """
+        fields = [(archive.resolve_field(field.lstrip('-')), field.startswith('-')) for field in self.ordering]
+
+        def value(row, field):
+            return row[field] if isinstance(row, dict) else getattr(row, field)
+
+        directions = {descending for _, descending in fields}
+        if len(directions) == 1:
+            return (lambda row: tuple(value(row, field) for field, _ in fields)), directions.pop()
+
+        def compare(first, second):
+            for field, descending in fields:
+                a, b = value(first, field), value(second, field)
+                order = (a > b) - (a < b)
+                if order:
+                    return -order if descending else order
+            return 0
+
+        return cmp_to_key(compare), False
+
+
+class _MergedRows:
+    """
+    Fatia de um TransactionHistory com arquivo morto: busca no banco e no arquivo as
+    primeiras `stop` linhas de cada um, intercala e fatia. Iterável de forma síncrona e
+    assíncrona (como o QuerySet que substitui).
+    """
+    def __init__(self, history, k):
+        self.history = history
+        self.k = k
+
+    def _live(self):
+        stop = self.k.stop
+        return self.history._union() if stop is None else self.history._union(limit=stop)[:stop]
+
+    def _archived(self):
+        return self.history.archived.order_by(*self.history.ordering).rows(limit=self.k.stop)
+
+    def _merge(self, live, archived):
+        key, reverse = self.history._merge_key()
+        return list(heapq.merge(live, archived, key=key, reverse=reverse))[self.k]
+
+    def __iter__(self):
+        return iter(self._merge(list(self._live()), self._archived()))
+
+    async def __aiter__(self):
+        live = [row async for row in self._live()]
+        for row in self._merge(live, await sync_to_async(self._archived)()):
+            yield row
+
+
+def _ledger_total(queryset, user_field):
+    total = queryset.filter(**{user_field: OuterRef('user_id')}).values(user_field).annotate(total=Sum('amount'))
+    return Coalesce(Subquery(total.values('total')), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _archived_total(field):
+    total = ArchiveSegmentUser.objects.filter(user_id=OuterRef('user_id')).values('user_id').annotate(total=Sum(field))
+    return Coalesce(Subquery(total.values('total')), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def wallets_with_ledger_balance(queryset=None):
+    """
+    Anota em cada carteira o campo `ledger_balance`: o saldo segundo o registro de transações,
+    isto é, tudo o que o usuário recebeu (depósitos e transferências) menos as transferências
+    que enviou, somando as transações já movidas para o arquivo morto (pelos totais de
+    ArchiveSegmentUser). Em uma carteira consistente, ledger_balance == balance.
+
+    Anota também `current_balance`: o saldo da carteira somado ao dos seus shards (carteiras
+    quentes), que é o valor a comparar com ledger_balance.
+    """
+    queryset = Wallet.objects.all() if queryset is None else queryset
+    received = _ledger_total(Transaction.objects.all(), 'receiver_id')
+    sent = _ledger_total(Transaction.objects.filter(transaction_type='TRANSFER'), 'sender_id')
+    archived_received = _archived_total('received')
+    archived_sent = _archived_total('sent')
+    shards = WalletShard.objects.filter(wallet=OuterRef('pk')).values('wallet').annotate(total=Sum('balance'))
+    shard_balance = Coalesce(Subquery(shards.values('total')), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2))
+    return queryset.annotate(
+        ledger_balance=received + archived_received - sent - archived_sent,
+        current_balance=F('balance') + shard_balance,
+    )
+
+
+def ledger_mismatches(queryset=None):
+    """
+    Carteiras cujo saldo não bate com o registro de transações.
+    """
+    return wallets_with_ledger_balance(queryset).exclude(current_balance=F('ledger_balance'))
+
+
+def ledger_balances(lower, upper, user_ids=None):
+    """
+    Saldo atual (carteira mais shards) e saldo segundo o registro de transações (somados os
+    totais do arquivo morto, como em wallets_with_ledger_balance) das carteiras dos usuários
+    com id em [lower, upper), ou apenas das de `user_ids`, em uma única consulta agregada:
+    um GROUP BY sobre as transações do intervalo (recebidas e enviadas, por UNION ALL),
+    em vez de uma subconsulta por carteira.
+
+    Como uma única instrução enxerga um único snapshot do banco, e os services alteram a
+    carteira e gravam a transação na mesma transação de banco, o resultado é consistente
+    sem bloquear as carteiras. Retorna a lista de (user_id, saldo atual, saldo do registro).
+    """
+    quote = connection.ops.quote_name
+    tables = {name: quote(model._meta.db_table) for name, model in (
+        ('wallet', Wallet), ('shard', WalletShard), ('tx', Transaction), ('archived', ArchiveSegmentUser),
+    )}
+    params = {'lower': lower, 'upper': upper, 'user_ids': list(user_ids) if user_ids is not None else None}
+    in_range = ("{column} >= %(lower)s AND {column} < %(upper)s"
+                + ("" if user_ids is None else " AND {column} = ANY(%(user_ids)s)"))
+    sql = f"""
+        SELECT w.user_id, w.balance + COALESCE(s.total, 0), COALESCE(l.total, 0) + COALESCE(a.total, 0)
+        FROM {tables['wallet']} w
+        LEFT JOIN (
+            SELECT sh.wallet_id, SUM(sh.balance) AS total FROM {tables['shard']} sh
+            JOIN {tables['wallet']} sw ON sw.id = sh.wallet_id
+            WHERE {in_range.format(column='sw.user_id')} GROUP BY sh.wallet_id
+        ) s ON s.wallet_id = w.id
+        LEFT JOIN (
+            SELECT user_id, SUM(delta) AS total FROM (
+                SELECT receiver_id AS user_id, amount AS delta FROM {tables['tx']}
+                WHERE {in_range.format(column='receiver_id')}
+                UNION ALL
+                SELECT sender_id, -amount FROM {tables['tx']}
+                WHERE transaction_type = 'TRANSFER' AND {in_range.format(column='sender_id')}
+            ) ledger GROUP BY user_id
+        ) l ON l.user_id = w.user_id
+        LEFT JOIN (
+            SELECT user_id, SUM(received - sent) AS total FROM {tables['archived']}
+            WHERE {in_range.format(column='user_id')} GROUP BY user_id
+        ) a ON a.user_id = w.user_id
+        WHERE {in_range.format(column='w.user_id')}
+        ORDER BY w.user_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
@@ -0,0 +1,55 @@
+import decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError: # orjson é opcional: sem ele, usa-se o json da biblioteca padrão
+    orjson = None
+
+
+class DecimalStringEncoder(encoders.JSONEncoder):
+    """
+    Encoder JSON do DRF que representa Decimal como texto exato (ex: "600.50"),
+    em vez de convertê-lo para float.
+    """
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return '{:f}'.format(obj)
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renderizador JSON baseado em orjson, com a mesma saída do JSONRenderer do DRF
+    (compacta, UTF-8, \\u2028/\\u2029 escapados). Valores Decimal são emitidos como texto exato.
+
+    Os tipos que o orjson não trata nativamente (Decimal, datas, textos preguiçosos, etc.)
+    passam pelo DecimalStringEncoder. Quando o orjson não está instalado, ou quando o
+    cliente pede indentação (ex: `Accept: application/json; indent=4`), o renderizador
+    recorre ao JSONRenderer padrão com o mesmo encoder.
+    """
+    encoder_class = DecimalStringEncoder
+    orjson_options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def __init__(self):
+        super().__init__()
+        self._encoder = self.encoder_class()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renderiza `data` em JSON, retornando bytes.
+        """
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._encoder.default, option=self.orjson_options)
+        # Assim como o JSONRenderer, escapa \u2028 e \u2029 para manter um subconjunto estrito de JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,197 @@
+"""
+Totais diários por usuário (DailyRollup), para resumos do histórico sem percorrer as transações.
+
+Cada linha guarda, para um usuário, um dia (no fuso local, o mesmo dos filtros de data da
+API) e um tipo de transação, a quantidade e o valor recebidos e enviados. Os services chamam
+record() na mesma transação de banco que cria as transações, com um upsert que soma os
+incrementos (INSERT ... ON CONFLICT DO UPDATE); as linhas são gravadas em ordem, por último,
+de modo que não criam novos ciclos de bloqueio. O comando rebuild_rollups recalcula tudo a
+partir das transações (e do arquivo morto).
+
+summary() responde ao endpoint transactions/summary/: os dias inteiros do período vêm dos
+totais diários e as frações de dia nas pontas (limites com hora) são somadas a partir das
+transações.
+"""
+
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import archive
+from .models import ArchiveSegmentUser, DailyRollup, Transaction, Wallet, WalletShard
+from .queries import TransactionHistory
+
+COUNTERS = ('received_count', 'received_total', 'sent_count', 'sent_total')
+HOT_BUCKETS = 8 # Buckets sorteados pelos créditos de carteiras quentes (ver DailyRollup.bucket)
+GROUPINGS = {
+    'day': (F('day'), lambda day: day),
+    'week': (TruncWeek('day'), lambda day: day - timedelta(days=day.weekday())),
+    'month': (TruncMonth('day'), lambda day: day.replace(day=1)),
+}
+
+
+def local_day(timestamp):
+    return timezone.localtime(timestamp).date()
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def increments(rows, user_ids=None):
+    """
+    Soma as linhas (remetente, destinatário, valor, tipo, timestamp) por (usuário, dia, tipo),
+    como {chave: [recebidas, total recebido, enviadas, total enviado]}. Depósitos contam apenas
+    como recebidos. Com `user_ids`, considera apenas esses usuários.
+    """
+    totals = {}
+    for sender_id, receiver_id, amount, transaction_type, timestamp in rows:
+        day = local_day(timestamp)
+        sides = [(receiver_id, 0)]
+        if transaction_type == 'TRANSFER':
+            sides.append((sender_id, 2))
+        for user_id, offset in sides:
+            if user_ids is not None and user_id not in user_ids:
+                continue
+            counters = totals.setdefault((user_id, day, transaction_type), [0, Decimal('0.00'), 0, Decimal('0.00')])
+            counters[offset] += 1
+            counters[offset + 1] += amount
+    return totals
+
+
+def record(transactions, spread=()):
+    """
+    Soma as transações recém-criadas aos totais diários, na transação de banco atual.
+    Os créditos dos usuários em `spread` (carteiras quentes creditadas sem bloqueio da carteira)
+    vão para um bucket sorteado.
+    """
+    totals = increments((t.sender_id, t.receiver_id, t.amount, t.transaction_type, t.timestamp) for t in transactions)
+    if not totals:
+        return
+    rows = []
+    for (user_id, day, transaction_type), counters in totals.items():
+        bucket = random.randrange(HOT_BUCKETS) if user_id in spread else 0
+        rows.append((user_id, day, transaction_type, bucket, *counters))
+    rows.sort(key=lambda row: row[:4]) # Ordem fixa dos bloqueios entre transações concorrentes
+
+    table = connection.ops.quote_name(DailyRollup._meta.db_table)
+    columns = ('user_id', 'day', 'transaction_type', 'bucket', *COUNTERS)
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+    updates = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in COUNTERS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders} "
+            f"ON CONFLICT (user_id, day, transaction_type, bucket) DO UPDATE SET {updates}",
+            [value for row in rows for value in row],
+        )
+
+
+def summary(user_id, start=None, end=None, group_by='day'):
+    """
+    Totais do usuário no período [start, end) (datetimes com fuso, ou None), agrupados por
+    período (`group_by`: day, week ou month, no fuso local) e tipo de transação.
+    Retorna uma lista de dicionários ordenada por período e tipo.
+    """
+    expression, period_of = GROUPINGS[group_by]
+    rollups = DailyRollup.objects.filter(user_id=user_id)
+    edges = []
+    if start is not None:
+        first_day = local_day(start)
+        if timezone.localtime(start).time() != time.min:
+            first_day += timedelta(days=1)
+            edges.append((start, _midnight(first_day)))
+        rollups = rollups.filter(day__gte=first_day)
+    if end is not None:
+        end_day = local_day(end)
+        if timezone.localtime(end).time() != time.min:
+            edges.append((_midnight(end_day), end))
+        rollups = rollups.filter(day__lt=end_day)
+    if start is not None and end is not None and len(edges) == 2 and edges[0][1] > edges[1][0]:
+        edges = [(start, end)] # Período dentro de um único dia
+
+    totals = {}
+    grouped = rollups.annotate(period=expression).values('period', 'transaction_type').annotate(
+        **{counter: Sum(counter) for counter in COUNTERS}
+    )
+    for row in grouped:
+        totals[(row['period'], row['transaction_type'])] = [row[counter] for counter in COUNTERS]
+
+    for lower, upper in edges:
+        if lower >= upper:
+            continue
+        rows = TransactionHistory(user_id).filter(timestamp__gte=lower, timestamp__lt=upper).values(
+            'id', 'sender_id', 'receiver_id', 'amount', 'transaction_type', 'timestamp'
+        ) # O id entra na ordenação do histórico
+        partial = increments(
+            ((row['sender_id'], row['receiver_id'], row['amount'], row['transaction_type'], row['timestamp'])
+             for row in rows.iterator()),
+            user_ids={user_id},
+        )
+        for (_, day, transaction_type), counters in partial.items():
+            current = totals.setdefault((period_of(day), transaction_type), [0, Decimal('0.00'), 0, Decimal('0.00')])
+            for index, value in enumerate(counters):
+                current[index] += value
+
+    return [
+        {'period': period, 'transaction_type': transaction_type, **dict(zip(COUNTERS, counters))}
+        for (period, transaction_type), counters in sorted(totals.items())
+        if counters[0] or counters[2]
+    ]
+
+
+def rebuild(lower, upper):
+    """
+    Recalcula os totais diários dos usuários com id em [lower, upper): apaga os atuais e os
+    refaz com uma consulta agrupada por lado (recebidas e enviadas) sobre as transações, mais
+    as linhas arquivadas dos segmentos que contêm esses usuários. Retorna as linhas criadas.
+
+    Deve ser chamada dentro de transaction.atomic(). As carteiras do intervalo (e os shards das
+    quentes) são bloqueadas antes da contagem, na ordem usada pelos services: as operações em
+    andamento sobre esses usuários terminam antes e as novas esperam o fim do recálculo.
+    """
+    wallet_ids = list(
+        Wallet.objects.select_for_update().filter(user_id__gte=lower, user_id__lt=upper)
+        .order_by('id').values_list('id', flat=True)
+    )
+    list(WalletShard.objects.select_for_update().filter(wallet_id__in=wallet_ids)
+         .order_by('wallet_id', 'index').values_list('id', flat=True))
+
+    totals = {}
+    for user_field, transactions, offset in (
+        ('receiver_id', Transaction.objects.all(), 0),
+        ('sender_id', Transaction.objects.filter(transaction_type='TRANSFER'), 2),
+    ):
+        grouped = (
+            transactions.filter(**{f'{user_field}__gte': lower, f'{user_field}__lt': upper})
+            .values(user_field, 'transaction_type', day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone()))
+            .annotate(count=Count('id'), total=Sum('amount')).order_by()
+        )
+        for row in grouped:
+            counters = totals.setdefault((row[user_field], row['day'], row['transaction_type']),
+                                         [0, Decimal('0.00'), 0, Decimal('0.00')])
+            counters[offset] += row['count']
+            counters[offset + 1] += row['total']
+
+    segments = (
+        ArchiveSegmentUser.objects.filter(user_id__gte=lower, user_id__lt=upper)
+        .values_list('segment__path', 'segment__checksum').distinct()
+    )
+    for path, checksum in segments:
+        rows = archive.load_segment(path, checksum).rows()
+        archived = increments(((row[1], row[2], row[3], row[4], row[5]) for row in rows), user_ids=range(lower, upper))
+        for key, counters in archived.items():
+            current = totals.setdefault(key, [0, Decimal('0.00'), 0, Decimal('0.00')])
+            for index, value in enumerate(counters):
+                current[index] += value
+
+    DailyRollup.objects.filter(user_id__gte=lower, user_id__lt=upper).delete()
+    DailyRollup.objects.bulk_create([
+        DailyRollup(user_id=user_id, day=day, transaction_type=transaction_type, **dict(zip(COUNTERS, counters)))
+        for (user_id, day, transaction_type), counters in totals.items()
+    ], batch_size=1000)
+    return len(totals)
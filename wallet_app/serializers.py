@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import Wallet, Transaction
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,6 +26,18 @@ class UserSerializer(serializers.ModelSerializer):
         Wallet.objects.create(user=user, balance=0.00) # Cria uma carteira com saldo inicial zero
         return user
 
+class WalletTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Serializador de login que inclui username e wallet_id nas claims do token,
+    permitindo a autenticação sem estado (ver authentication.StatelessWalletJWTAuthentication).
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['wallet_id'] = Wallet.objects.filter(user=user).values_list('id', flat=True).first()
+        return token
+
 class WalletSerializer(serializers.ModelSerializer):
     """
     Serializador para o modelo Wallet.
@@ -45,6 +59,21 @@ class TransferSerializer(serializers.Serializer):
     receiver_username = serializers.CharField(max_length=150)
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0.01)
 
+class BatchTransferSerializer(serializers.Serializer):
+    """
+    Serializador para a entrada de um lote de transferências.
+    `mode` define se o lote é tudo-ou-nada ou melhor-esforço.
+    """
+    MODE_ALL_OR_NOTHING = 'all_or_nothing'
+    MODE_BEST_EFFORT = 'best_effort'
+    MAX_BATCH_SIZE = 5000
+
+    transfers = TransferSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
+    mode = serializers.ChoiceField(
+        choices=[MODE_ALL_OR_NOTHING, MODE_BEST_EFFORT],
+        default=MODE_ALL_OR_NOTHING
+    )
+
 class TransactionSerializer(serializers.ModelSerializer):
     """
     Serializador para o modelo Transaction.
@@ -56,3 +85,41 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = ['id', 'sender', 'receiver', 'amount', 'transaction_type', 'timestamp']
+
+class TransactionValuesSerializer:
+    """
+    Serializador leve para listagens de transações.
+    Trabalha sobre dicionários de .values() (com os nomes de usuário já trazidos por JOIN
+    na mesma consulta) e produz exatamente a mesma saída de TransactionSerializer, sem
+    o custo da maquinaria de campos do DRF por linha.
+    Suporta apenas leitura: `instance`, `many` e `.data`.
+    """
+    values_fields = ('id', 'sender__username', 'receiver__username', 'amount', 'transaction_type', 'timestamp')
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(row) for row in self.instance]
+        return self.to_representation(self.instance)
+
+    @staticmethod
+    def to_representation(row):
+        """
+        Converte uma linha de values() no formato de TransactionSerializer:
+        valor decimal como texto e data/hora ISO-8601 no fuso horário atual.
+        """
+        timestamp = timezone.localtime(row['timestamp']).isoformat()
+        if timestamp.endswith('+00:00'):
+            timestamp = timestamp[:-6] + 'Z'
+        return {
+            'id': row['id'],
+            'sender': row['sender__username'],
+            'receiver': row['receiver__username'],
+            'amount': '{:f}'.format(row['amount']),
+            'transaction_type': row['transaction_type'],
+            'timestamp': timestamp,
+        }
@@ -0,0 +1,539 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Subquery, Sum
+from django.utils import timezone
+
+from . import rollups
+from .cache import balance_cache
+from .models import PendingTransfer, Wallet, WalletShard, Transaction
+
+
+# Mensagens de erro compartilhadas entre as views e o processamento em lote
+SELF_TRANSFER_ERROR = "Não é possível transferir para si mesmo."
+RECEIVER_NOT_FOUND_ERROR = "Usuário destinatário não encontrado."
+INSUFFICIENT_BALANCE_ERROR = "Saldo insuficiente para realizar a transferência."
+WALLET_NOT_FOUND_ERROR = "Carteira não encontrada para este usuário."
+
+
+class InsufficientBalanceError(Exception):
+    """
+    Levantada quando a carteira do remetente não possui saldo suficiente.
+    """
+
+
+class BatchTransferError(Exception):
+    """
+    Levantada quando um lote no modo tudo-ou-nada contém ao menos um item inválido.
+    Carrega o resultado de cada item para ser devolvido ao cliente.
+    """
+    def __init__(self, results):
+        super().__init__("Lote de transferências rejeitado.")
+        self.results = results
+
+
+class _HotWalletChanged(Exception):
+    """
+    A operação precisa ser refeita com outras opções de bloqueio (ver _retry_on_hot_wallet_change):
+    um crédito em carteira quente não encontrou shard (a carteira deixou de ser quente depois
+    de lida, ou não existe), ou a operação debita uma carteira quente e por isso precisa
+    bloquear também as carteiras quentes que apenas recebem créditos (lock_receivers=True).
+    """
+    def __init__(self, lock_receivers=False):
+        super().__init__()
+        self.retry_options = {'lock_receivers': True} if lock_receivers else {}
+
+
+def _retry_on_hot_wallet_change(operation, *args):
+    options = {}
+    for _ in range(3):
+        try:
+            return operation(*args, **options)
+        except _HotWalletChanged as exc:
+            options.update(exc.retry_options)
+    raise Wallet.DoesNotExist(WALLET_NOT_FOUND_ERROR)
+
+
+def _select_wallets_for_update(user_ids, credit_only=()):
+    """
+    Bloqueia (SELECT ... FOR UPDATE) as carteiras dos usuários informados em uma única consulta.
+    As linhas são bloqueadas sempre em ordem crescente de id da carteira, de modo que duas
+    transferências em sentidos opostos nunca aguardem uma pela outra em ordem inversa (deadlock).
+
+    As carteiras quentes dos usuários em `credit_only` (que apenas receberão créditos) não são
+    bloqueadas nem retornadas: seus créditos vão para um shard (ver _credit_shards).
+    Os shards são sempre bloqueados depois das carteiras e em ordem crescente de id da carteira.
+    Uma operação que debita uma carteira quente (e bloqueia todos os seus shards) não usa
+    `credit_only` (ver _check_hot_debit); assim, nenhuma espera entre shards fecha um ciclo.
+    """
+    wallets = Wallet.objects.select_for_update().filter(user_id__in=set(user_ids)).order_by('id')
+    if credit_only:
+        wallets = wallets.exclude(user_id__in=set(credit_only), shard_count__gt=0)
+    return {wallet.user_id: wallet for wallet in wallets}
+
+
+def _hot_receivers(user_ids):
+    """
+    Das carteiras não bloqueadas dos usuários informados, as quentes, como {user_id: id da carteira}.
+    """
+    if not user_ids:
+        return {}
+    return dict(Wallet.objects.filter(user_id__in=user_ids, shard_count__gt=0).values_list('user_id', 'id'))
+
+
+def _check_hot_debit(debited_wallets, hot_receivers):
+    """
+    Uma operação que debita carteiras quentes não pode creditar shards sem bloquear a carteira
+    (ver _select_wallets_for_update): nesse caso ela é refeita bloqueando todas as carteiras.
+    """
+    if hot_receivers and any(wallet.shard_count for wallet in debited_wallets):
+        raise _HotWalletChanged(lock_receivers=True)
+
+
+def _credit_shard(user_id, amount):
+    """
+    Credita `amount` em um shard sorteado da carteira quente do usuário, bloqueando apenas
+    esse shard. Levanta _HotWalletChanged se a carteira não tiver shards.
+    """
+    shard = WalletShard.objects.filter(wallet__user_id=user_id).order_by('?').values('pk')[:1]
+    if not WalletShard.objects.filter(pk=Subquery(shard)).update(balance=F('balance') + amount):
+        raise _HotWalletChanged()
+
+
+def _credit_shards(credits, hot_receivers):
+    """
+    Aplica os créditos {user_id: valor} nas carteiras quentes, um shard por carteira, em
+    ordem crescente de id da carteira (`hot_receivers`, ver _hot_receivers).
+    """
+    for user_id in sorted(credits, key=hot_receivers.__getitem__):
+        _credit_shard(user_id, credits[user_id])
+
+
+def _hot_wallet(user_id):
+    """
+    A carteira (sem bloqueio) com o saldo dos shards já somado em shard_balance.
+    """
+    return Wallet.objects.annotate(shard_balance=Sum('shards__balance')).get(user_id=user_id)
+
+
+def _lock_shards(wallet):
+    """
+    Bloqueia os shards de uma carteira quente (cuja linha já está bloqueada) e guarda a
+    soma dos seus saldos em wallet.shard_balance.
+    """
+    shards = list(WalletShard.objects.select_for_update().filter(wallet=wallet).order_by('index'))
+    wallet.shard_balance = sum((shard.balance for shard in shards), Decimal('0.00'))
+    return shards
+
+
+def _debit(wallet, amount, shards=()):
+    """
+    Debita `amount` de uma carteira bloqueada, cujo total disponível já foi conferido.
+    Em carteiras quentes, usa primeiro o saldo da própria carteira e depois o dos shards
+    (bloqueados com _lock_shards), dos maiores para os menores.
+    """
+    taken = min(wallet.balance, amount)
+    wallet.balance -= taken
+    remaining = amount - taken
+    changed = []
+    for shard in sorted(shards, key=lambda s: s.balance, reverse=True):
+        if not remaining:
+            break
+        taken = min(shard.balance, remaining)
+        shard.balance -= taken
+        remaining -= taken
+        changed.append(shard)
+    if changed:
+        WalletShard.objects.bulk_update(changed, ['balance'])
+        wallet.shard_balance = sum((shard.balance for shard in shards), Decimal('0.00'))
+
+
+def net_transfers(transfers, available, credit_only=()):
+    """
+    Motor de compensação (netting) de uma janela de transferências.
+
+    `transfers` é a sequência de (remetente, destinatário, valor), na ordem em que devem ser
+    aplicadas; `available` é o saldo disponível de cada carteira bloqueada, {user_id: saldo};
+    `credit_only` são os usuários cujas carteiras apenas recebem (carteiras quentes não bloqueadas).
+    Cada transferência é conferida contra o saldo já compensado pelas anteriores aceitas, de modo
+    que um crédito recebido no início da janela pode ser gasto depois dela.
+
+    Retorna (erros, deltas): a mensagem de erro de cada transferência (None se aceita), na ordem,
+    e a variação líquida do saldo de cada carteira, {user_id: delta}, sem as que ficaram em zero.
+    """
+    running = dict(available)
+    deltas = {}
+    errors = []
+    for sender_id, receiver_id, amount in transfers:
+        if sender_id not in running or (receiver_id not in running and receiver_id not in credit_only):
+            errors.append(WALLET_NOT_FOUND_ERROR)
+            continue
+        if running[sender_id] < amount:
+            errors.append(INSUFFICIENT_BALANCE_ERROR)
+            continue
+        running[sender_id] -= amount
+        if receiver_id in running:
+            running[receiver_id] += amount
+        deltas[sender_id] = deltas.get(sender_id, 0) - amount
+        deltas[receiver_id] = deltas.get(receiver_id, 0) + amount
+        errors.append(None)
+    return errors, {user_id: delta for user_id, delta in deltas.items() if delta}
+
+
+def _apply_deltas(wallets, deltas, shards, hot_receivers):
+    """
+    Grava as variações líquidas de net_transfers: uma única escrita (bulk_update) para todas as
+    carteiras bloqueadas com delta diferente de zero e um crédito por carteira quente não bloqueada.
+    `shards` são os shards bloqueados das carteiras quentes debitadas, {user_id: [WalletShard]}.
+    Retorna o número de carteiras gravadas.
+    """
+    touched = []
+    for user_id, delta in deltas.items():
+        wallet = wallets.get(user_id)
+        if wallet is None:
+            continue
+        if delta < 0:
+            _debit(wallet, -delta, shards.get(user_id, ()))
+        else:
+            wallet.balance += delta
+        wallet.version += 1
+        balance_cache.store_on_commit(wallet)
+        touched.append(wallet)
+    touched.sort(key=lambda w: w.id)
+    Wallet.objects.bulk_update(touched, ['balance', 'version'])
+    credits = {user_id: delta for user_id, delta in deltas.items() if user_id not in wallets}
+    _credit_shards(credits, hot_receivers)
+    return len(touched) + len(credits)
+
+
+def _known_balances(wallets, available, shards):
+    """
+    Dos saldos `available` lidos antes de uma janela, os das carteiras cujo saldo total está
+    bloqueado: as comuns e as quentes com os shards bloqueados (`shards`, {user_id: [WalletShard]}).
+    """
+    return {
+        user_id: balance for user_id, balance in available.items()
+        if not wallets[user_id].shard_count or user_id in shards
+    }
+
+
+def _stamp(new_transactions):
+    """
+    Data das transações de uma janela, tomada depois dos créditos nos shards: um débito que
+    bloqueou uma carteira quente antes desses créditos fica com uma data anterior à deles,
+    como na ordem em que os saldos foram alterados (ver wallet_app.balances). Retorna a data.
+    """
+    now = timezone.now()
+    for new_transaction in new_transactions:
+        new_transaction.timestamp = now
+    return now
+
+
+def _set_balances_after(new_transactions, balances):
+    """
+    Preenche o saldo após cada transferência de uma janela compensada, reaplicando as
+    transferências em ordem sobre `balances`, {user_id: saldo antes da janela}, das carteiras
+    cujo saldo total está bloqueado. Os créditos em carteiras quentes sem os shards bloqueados
+    ficam sem saldo (ver wallet_app.balances).
+    """
+    running = dict(balances)
+    for new_transaction in new_transactions:
+        if new_transaction.sender_id in running:
+            running[new_transaction.sender_id] -= new_transaction.amount
+            new_transaction.sender_balance_after = running[new_transaction.sender_id]
+        if new_transaction.receiver_id in running:
+            running[new_transaction.receiver_id] += new_transaction.amount
+            new_transaction.receiver_balance_after = running[new_transaction.receiver_id]
+
+
+def lock_wallets(*user_ids):
+    """
+    Bloqueia as carteiras dos usuários informados (ver _select_wallets_for_update).
+    Deve ser chamada dentro de transaction.atomic(). Retorna um dicionário {user_id: Wallet}
+    e levanta Wallet.DoesNotExist se algum dos usuários não possuir carteira.
+    """
+    locked = _select_wallets_for_update(user_ids)
+    for user_id in user_ids:
+        if user_id not in locked:
+            raise Wallet.DoesNotExist(f"Carteira não encontrada para o usuário {user_id}.")
+    return locked
+
+
+def deposit(user_id, amount):
+    """
+    Credita `amount` na carteira do usuário (em um shard, se for uma carteira quente) e
+    registra a transação de depósito. Retorna a tupla (carteira atualizada, transação criada).
+    """
+    return _retry_on_hot_wallet_change(_deposit, user_id, amount)
+
+
+def _deposit(user_id, amount):
+    with transaction.atomic():
+        wallet = _select_wallets_for_update([user_id], credit_only=[user_id]).get(user_id)
+        hot = wallet is None
+        if hot:
+            _credit_shard(user_id, amount)
+            wallet = _hot_wallet(user_id)
+            balance_after = None # Os demais shards não estão bloqueados (ver wallet_app.balances)
+        else:
+            wallet.balance += amount
+            wallet.version += 1
+            wallet.save(update_fields=['balance', 'version'])
+            balance_cache.store_on_commit(wallet)
+            balance_after = wallet.balance
+
+        new_transaction = Transaction.objects.create(
+            sender_id=user_id, # O próprio usuário é o remetente (para depósitos)
+            receiver_id=user_id,
+            amount=amount,
+            transaction_type='DEPOSIT',
+            timestamp=timezone.now(),
+            sender_balance_after=balance_after,
+            receiver_balance_after=balance_after,
+        )
+        rollups.record([new_transaction], spread={user_id} if hot else ())
+    return wallet, new_transaction
+
+
+def transfer(sender_id, receiver_id, amount):
+    """
+    Transfere `amount` da carteira do remetente para a do destinatário.
+    As duas carteiras são bloqueadas na ordem do id antes da verificação de saldo, o que
+    impede atualizações perdidas quando várias transferências concorrem pelas mesmas carteiras.
+    Levanta InsufficientBalanceError se o saldo do remetente for menor que `amount`.
+    Retorna a tupla (carteira do remetente, carteira do destinatário, transação criada).
+
+    Se o destinatário for uma carteira quente, sua linha não é bloqueada: o crédito vai para
+    um shard sorteado. Se o remetente for uma carteira quente, o saldo conferido é o total
+    (carteira mais shards), com os shards bloqueados.
+    """
+    return _retry_on_hot_wallet_change(_transfer, sender_id, receiver_id, amount)
+
+
+def _transfer(sender_id, receiver_id, amount, lock_receivers=False):
+    with transaction.atomic():
+        wallets = _select_wallets_for_update([sender_id, receiver_id], credit_only=() if lock_receivers else [receiver_id])
+        if sender_id not in wallets:
+            raise Wallet.DoesNotExist(f"Carteira não encontrada para o usuário {sender_id}.")
+        sender_wallet = wallets[sender_id]
+        receiver_wallet = wallets.get(receiver_id)
+        if receiver_wallet is None and lock_receivers:
+            raise Wallet.DoesNotExist(f"Carteira não encontrada para o usuário {receiver_id}.")
+        _check_hot_debit([sender_wallet], {receiver_id} if receiver_wallet is None else ())
+
+        shards = _lock_shards(sender_wallet) if sender_wallet.shard_count else ()
+        if sender_wallet.total_balance < amount:
+            raise InsufficientBalanceError(INSUFFICIENT_BALANCE_ERROR)
+
+        _debit(sender_wallet, amount, shards)
+        if receiver_wallet is not None:
+            receiver_wallet.balance += amount
+
+        # Grava na mesma ordem em que os bloqueios foram obtidos
+        for wallet in sorted(wallets.values(), key=lambda w: w.id):
+            wallet.version += 1
+            wallet.save(update_fields=['balance', 'version'])
+            balance_cache.store_on_commit(wallet)
+        hot_receiver = receiver_wallet is None
+        # Com os shards do destinatário quente livres, seu saldo total não é conhecido aqui
+        receiver_balance_after = None if hot_receiver or receiver_wallet.shard_count else receiver_wallet.balance
+        if hot_receiver:
+            _credit_shard(receiver_id, amount)
+            receiver_wallet = _hot_wallet(receiver_id)
+
+        new_transaction = Transaction.objects.create(
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            amount=amount,
+            transaction_type='TRANSFER',
+            timestamp=timezone.now(),
+            sender_balance_after=sender_wallet.total_balance,
+            receiver_balance_after=receiver_balance_after,
+        )
+        rollups.record([new_transaction], spread={receiver_id} if hot_receiver else ())
+    return sender_wallet, receiver_wallet, new_transaction
+
+
+def transfer_batch(sender_id, items, all_or_nothing=True):
+    """
+    Liquida várias transferências de um mesmo remetente em uma única transação de banco.
+    `items` é a lista validada por TransferSerializer(many=True).
+
+    Os destinatários são resolvidos em uma consulta, todas as carteiras envolvidas são bloqueadas
+    em uma consulta (ordem de id), o saldo do remetente é lido uma única vez e as atualizações são
+    gravadas com bulk_update/bulk_create. No modo tudo-ou-nada qualquer item inválido rejeita o
+    lote inteiro (BatchTransferError); no modo melhor-esforço os itens inválidos são ignorados.
+    Destinatários que são carteiras quentes recebem os créditos em shards, sem bloqueio da carteira.
+    Retorna a tupla (carteira do remetente, resultados por item).
+    """
+    usernames = {item['receiver_username'] for item in items}
+    receiver_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    return _retry_on_hot_wallet_change(_transfer_batch, sender_id, items, receiver_ids, all_or_nothing)
+
+
+def _transfer_batch(sender_id, items, receiver_ids, all_or_nothing, lock_receivers=False):
+    results = []
+    with transaction.atomic():
+        receivers = set(receiver_ids.values()) - {sender_id}
+        wallets = _select_wallets_for_update([sender_id, *receivers], credit_only=() if lock_receivers else receivers)
+        if sender_id not in wallets:
+            raise Wallet.DoesNotExist(WALLET_NOT_FOUND_ERROR)
+        sender_wallet = wallets[sender_id]
+        hot_receivers = {} if lock_receivers else _hot_receivers(receivers - set(wallets))
+        _check_hot_debit([sender_wallet], hot_receivers)
+
+        shards = {sender_id: _lock_shards(sender_wallet)} if sender_wallet.shard_count else {}
+        candidates = []
+        for index, item in enumerate(items):
+            receiver_id = receiver_ids.get(item['receiver_username'])
+            result = {
+                "indice": index,
+                "receiver_username": item['receiver_username'],
+                "amount": item['amount'],
+            }
+            results.append(result)
+
+            if receiver_id == sender_id:
+                result.update(status="erro", erro=SELF_TRANSFER_ERROR)
+            elif receiver_id is None:
+                result.update(status="erro", erro=RECEIVER_NOT_FOUND_ERROR)
+            else:
+                candidates.append((result, (sender_id, receiver_id, item['amount'])))
+
+        available = {user_id: wallet.total_balance for user_id, wallet in wallets.items()}
+        errors, deltas = net_transfers([t for _, t in candidates], available, credit_only=hot_receivers)
+        new_transactions = []
+        for (result, (_, receiver_id, amount)), error in zip(candidates, errors):
+            if error:
+                result.update(status="erro", erro=error)
+                continue
+            new_transactions.append((result, Transaction(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                amount=amount,
+                transaction_type='TRANSFER',
+            )))
+            result.update(status="ok")
+
+        if all_or_nothing and len(new_transactions) != len(items):
+            raise BatchTransferError(results)
+
+        if new_transactions:
+            _set_balances_after([t for _, t in new_transactions], _known_balances(wallets, available, shards))
+            _apply_deltas(wallets, deltas, shards, hot_receivers)
+            _stamp([t for _, t in new_transactions])
+            Transaction.objects.bulk_create([t for _, t in new_transactions])
+            rollups.record([t for _, t in new_transactions], spread=hot_receivers)
+            for result, new_transaction in new_transactions:
+                result["id_transacao"] = new_transaction.id
+    return sender_wallet, results
+
+
+def enqueue_transfer(sender_id, receiver_id, amount):
+    """
+    Aceita uma transferência para liquidação posterior (ver settle_pending), sem bloquear
+    carteiras. Retorna a PendingTransfer criada.
+    """
+    return PendingTransfer.objects.create(sender_id=sender_id, receiver_id=receiver_id, amount=amount)
+
+
+def settle_pending(limit):
+    """
+    Liquida até `limit` transferências pendentes, na ordem de chegada, em uma única transação
+    de banco: um único commit (e fsync) para o lote inteiro, em vez de um por transferência.
+
+    As pendentes são reservadas com SELECT ... FOR UPDATE SKIP LOCKED (vários processos podem
+    drenar a fila ao mesmo tempo) e todas as carteiras envolvidas são bloqueadas em uma consulta,
+    em ordem de id. O lote é compensado (net_transfers): cada transferência é conferida contra
+    o saldo já compensado pelas anteriores, cada carteira recebe uma única escrita com a sua
+    variação líquida e cada transferência aceita continua gerando sua Transaction. As recusadas
+    (saldo insuficiente ou carteira inexistente) ficam com status REJECTED.
+    Retorna a tupla (PendingTransfer processadas, carteiras gravadas).
+    """
+    return _retry_on_hot_wallet_change(_settle_pending, limit)
+
+
+def _settle_pending(limit, lock_receivers=False):
+    with transaction.atomic():
+        pending = list(
+            PendingTransfer.objects.select_for_update(skip_locked=True)
+            .filter(status=PendingTransfer.STATUS_PENDING).order_by('id')[:limit]
+        )
+        if not pending:
+            return [], 0
+        senders = {item.sender_id for item in pending}
+        receivers = {item.receiver_id for item in pending} - senders
+        wallets = _select_wallets_for_update([*senders, *receivers], credit_only=() if lock_receivers else receivers)
+        hot_receivers = {} if lock_receivers else _hot_receivers(receivers - set(wallets))
+        hot_senders = sorted((wallet for wallet in wallets.values() if wallet.shard_count), key=lambda w: w.id)
+        _check_hot_debit(hot_senders, hot_receivers)
+        shards = {wallet.user_id: _lock_shards(wallet) for wallet in hot_senders}
+
+        available = {user_id: wallet.total_balance for user_id, wallet in wallets.items()}
+        errors, deltas = net_transfers(
+            [(item.sender_id, item.receiver_id, item.amount) for item in pending], available, credit_only=hot_receivers
+        )
+        settled = []
+        for item, error in zip(pending, errors):
+            if error:
+                item.status, item.error = PendingTransfer.STATUS_REJECTED, error
+                continue
+            item.status = PendingTransfer.STATUS_SETTLED
+            settled.append((item, Transaction(
+                sender_id=item.sender_id,
+                receiver_id=item.receiver_id,
+                amount=item.amount,
+                transaction_type='TRANSFER',
+            )))
+
+        _set_balances_after([t for _, t in settled], _known_balances(wallets, available, shards))
+        written = _apply_deltas(wallets, deltas, shards, hot_receivers)
+        now = _stamp([t for _, t in settled])
+        for item in pending:
+            item.settled_at = now
+        Transaction.objects.bulk_create([t for _, t in settled])
+        rollups.record([t for _, t in settled], spread=hot_receivers)
+        for item, new_transaction in settled:
+            item.transaction_id = new_transaction.id
+        PendingTransfer.objects.bulk_update(pending, ['status', 'error', 'transaction_id', 'settled_at'])
+    return pending, written
+
+
+def set_shard_count(user_id, shard_count):
+    """
+    Liga (shard_count > 0), ajusta ou desliga (0) o modo de carteira quente: consolida o
+    saldo dos shards atuais na carteira e cria `shard_count` shards zerados.
+    Retorna a carteira atualizada.
+    """
+    with transaction.atomic():
+        wallet = lock_wallets(user_id)[user_id]
+        _lock_shards(wallet)
+        wallet.balance += wallet.shard_balance
+        WalletShard.objects.filter(wallet=wallet).delete()
+        WalletShard.objects.bulk_create([WalletShard(wallet=wallet, index=index) for index in range(shard_count)])
+        wallet.shard_count = shard_count
+        wallet.shard_balance = Decimal('0.00')
+        wallet.version += 1
+        wallet.save(update_fields=['balance', 'shard_count', 'version'])
+        balance_cache.store_on_commit(wallet)
+    return wallet
+
+
+def consolidate_shards(user_id):
+    """
+    Move o saldo dos shards de uma carteira quente para a própria carteira, zerando-os.
+    Retorna o valor movido.
+    """
+    with transaction.atomic():
+        wallet = lock_wallets(user_id)[user_id]
+        shards = _lock_shards(wallet)
+        moved = wallet.shard_balance
+        if moved:
+            wallet.balance += moved
+            WalletShard.objects.filter(pk__in=[shard.pk for shard in shards]).update(balance=0)
+            wallet.shard_balance = Decimal('0.00')
+            wallet.version += 1
+            wallet.save(update_fields=['balance', 'version'])
+            balance_cache.store_on_commit(wallet)
+    return moved
@@ -1,10 +1,15 @@
 from django.urls import path
+from . import async_views
 from .views import (
     UserCreateView,
     WalletBalanceView,
     WalletDepositView,
     TransferCreateView,
-    TransactionListView
+    TransferStatusView,
+    BatchTransferCreateView,
+    TransactionListView,
+    TransactionSummaryView,
+    TransactionExportView
 )
 
 urlpatterns = [
@@ -17,5 +22,15 @@ urlpatterns = [
 
     # Rotas de Transação
     path('transactions/transfer/', TransferCreateView.as_view(), name='transaction_transfer'),
+    path('transactions/<int:pk>/status/', TransferStatusView.as_view(), name='transaction_status'),
+    path('transactions/transfer/batch/', BatchTransferCreateView.as_view(), name='transaction_transfer_batch'),
     path('transactions/list/', TransactionListView.as_view(), name='transaction_list'),
+    path('transactions/summary/', TransactionSummaryView.as_view(), name='transaction_summary'),
+    path('transactions/export/', TransactionExportView.as_view(), name='transaction_export'),
+
+    # Versões assíncronas (ASGI) dos endpoints mais acessados
+    path('async/wallet/balance/', async_views.wallet_balance, name='async_wallet_balance'),
+    path('async/wallet/deposit/', async_views.wallet_deposit, name='async_wallet_deposit'),
+    path('async/transactions/transfer/', async_views.transaction_transfer, name='async_transaction_transfer'),
+    path('async/transactions/list/', async_views.transaction_list, name='async_transaction_list'),
 ]
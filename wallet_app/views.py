@@ -3,20 +3,96 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ParseError
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import transaction, models
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, time, timedelta
+import csv
+import json
 
-from .models import Wallet, Transaction
+from . import balances, metrics, rollups, services
+from .authentication import claimed_wallet_id
+from .cache import balance_cache
+from .models import PendingTransfer, Wallet, Transaction
+from .pagination import TransactionCursorPagination
+from .queries import TransactionHistory
 from .serializers import (
     UserSerializer,
     WalletSerializer,
     DepositSerializer,
     TransferSerializer,
-    TransactionSerializer
+    BatchTransferSerializer,
+    TransactionValuesSerializer
 )
 
+def _parse_period_bound(value, param, is_end):
+    """
+    Converte o valor de `start_date`/`end_date` em um datetime com fuso horário.
+    Datas no formato AAAA-MM-DD viram a meia-noite local do dia (ou do dia seguinte, para
+    `end_date`, que é inclusivo); datas e horas ISO-8601 são usadas como estão.
+    """
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        # Um '+' não codificado no deslocamento de fuso chega como espaço na query string
+        moment = parse_datetime(value.replace(' ', '+')) if 'T' in value else None
+        if moment is None:
+            raise ParseError(
+                detail=f"Formato de data inválido para '{param}'. Use AAAA-MM-DD. "
+                       "Também é aceita data e hora ISO-8601 (ex: 2024-01-01T10:00:00-03:00)."
+            )
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    if is_end:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def get_balance_at(query_params):
+    """
+    Instante da consulta de saldo histórico (`at`), ou None. Uma data AAAA-MM-DD pede o saldo
+    ao fim do dia; uma data e hora ISO-8601, o saldo imediatamente antes dela.
+    """
+    value = query_params.get('at')
+    return None if value is None else _parse_period_bound(value, 'at', is_end=True)
+
+def balance_at_data(user_id, at):
+    """
+    Corpo da resposta da consulta de saldo em um instante (ver wallet_app.balances).
+    """
+    return {**WalletSerializer({'balance': balances.balance_at(user_id, at)}).data,
+            "at": timezone.localtime(at).isoformat()}
+
+def accepted_transfer_data(pending):
+    """
+    Corpo da resposta 202 de uma transferência enfileirada (WALLET_TRANSFER_MODE = 'queued').
+    """
+    return {
+        "mensagem": "Transferência aceita para processamento.",
+        "id_transferencia": pending.id,
+        "status": pending.status,
+    }
+
+def get_period_filters(query_params):
+    """
+    Monta os filtros de período a partir de `start_date` e `end_date` como um intervalo
+    semiaberto `start <= timestamp < end` sobre a própria coluna, que pode ser atendido
+    pelos índices em timestamp (ao contrário de timestamp__date, que converte cada linha
+    para o fuso local antes de comparar).
+    """
+    filters = {}
+    start_date_str = query_params.get('start_date')
+    end_date_str = query_params.get('end_date')
+
+    if start_date_str:
+        filters['timestamp__gte'] = _parse_period_bound(start_date_str, 'start_date', is_end=False)
+    if end_date_str:
+        filters['timestamp__lt'] = _parse_period_bound(end_date_str, 'end_date', is_end=True)
+    return filters
+
 class UserCreateView(generics.CreateAPIView):
     """
     View para criar um novo usuário (registro).
@@ -35,15 +111,22 @@ class WalletBalanceView(APIView):
 
     def get(self, request):
         """
-        Retorna o saldo da carteira do usuário logado.
+        Retorna o saldo da carteira do usuário logado (servido pelo cache de saldo), ou, com o
+        parâmetro `at`, o saldo naquele instante.
         """
-        try:
-            wallet = request.user.wallet
-            serializer = WalletSerializer(wallet)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Wallet.DoesNotExist:
-            return Response({"erro": "Carteira não encontrada para este usuário."},
+        at = get_balance_at(request.query_params)
+        if at is not None:
+            # Com a autenticação sem estado, a claim wallet_id já garante que a carteira existe
+            if claimed_wallet_id(request.user) is None and not Wallet.objects.filter(user_id=request.user.id).exists():
+                return Response({"erro": services.WALLET_NOT_FOUND_ERROR},
+                                status=status.HTTP_404_NOT_FOUND)
+            return Response(balance_at_data(request.user.id, at), status=status.HTTP_200_OK)
+        balance = balance_cache.get_balance(request.user.id)
+        if balance is None:
+            return Response({"erro": services.WALLET_NOT_FOUND_ERROR},
                             status=status.HTTP_404_NOT_FOUND)
+        serializer = WalletSerializer({'balance': balance})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 class WalletDepositView(APIView):
     """
@@ -60,21 +143,15 @@ class WalletDepositView(APIView):
         if serializer.is_valid():
             amount = serializer.validated_data['amount']
 
-            with transaction.atomic(): # Garante atomicidade da operação
-                wallet = request.user.wallet
-                wallet.balance += amount
-                wallet.save()
-
-                # Registra a transação de depósito
-                Transaction.objects.create(
-                    sender=request.user, # O próprio usuário é o remetente (para depósitos)
-                    receiver=request.user,
-                    amount=amount,
-                    transaction_type='DEPOSIT',
-                    timestamp=timezone.now() # Adicionado explicitamente
-                )
+            try:
+                wallet, _ = services.deposit(request.user.id, amount)
+            except Wallet.DoesNotExist:
+                metrics.record_failure('deposit', services.WALLET_NOT_FOUND_ERROR)
+                return Response({"erro": services.WALLET_NOT_FOUND_ERROR},
+                                status=status.HTTP_404_NOT_FOUND)
+            metrics.record_operations('deposit', [amount])
             return Response(
-                {"mensagem": "Depósito realizado com sucesso.", "novo_saldo": wallet.balance},
+                {"mensagem": "Depósito realizado com sucesso.", "novo_saldo": wallet.total_balance},
                 status=status.HTTP_200_OK
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -98,87 +175,233 @@ class TransferCreateView(APIView):
 
             # Não permitir transferência para si mesmo
             if sender_user.username == receiver_username:
+                metrics.record_failure('transfer', services.SELF_TRANSFER_ERROR)
                 return Response(
-                    {"erro": "Não é possível transferir para si mesmo."},
+                    {"erro": services.SELF_TRANSFER_ERROR},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
             try:
                 receiver_user = User.objects.get(username=receiver_username)
             except User.DoesNotExist:
+                metrics.record_failure('transfer', services.RECEIVER_NOT_FOUND_ERROR)
                 return Response(
-                    {"erro": "Usuário destinatário não encontrado."},
+                    {"erro": services.RECEIVER_NOT_FOUND_ERROR},
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            with transaction.atomic(): # Garante atomicidade da operação
-                sender_wallet = sender_user.wallet
-                receiver_wallet = receiver_user.wallet
-
-                if sender_wallet.balance < amount:
-                    return Response(
-                        {"erro": "Saldo insuficiente para realizar a transferência."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                sender_wallet.balance -= amount
-                receiver_wallet.balance += amount
-
-                sender_wallet.save()
-                receiver_wallet.save()
-
-                # Registra a transação de transferência
-                new_transaction = Transaction.objects.create(
-                    sender=sender_user,
-                    receiver=receiver_user,
-                    amount=amount,
-                    transaction_type='TRANSFER',
-                    timestamp=timezone.now() # Adicionado explicitamente
+            # Modo assíncrono: apenas enfileira; o comando run_settlement liquida
+            if settings.WALLET_TRANSFER_MODE == 'queued':
+                pending = services.enqueue_transfer(sender_user.id, receiver_user.id, amount)
+                return Response(accepted_transfer_data(pending), status=status.HTTP_202_ACCEPTED)
+
+            try:
+                sender_wallet, receiver_wallet, new_transaction = services.transfer(
+                    sender_user.id, receiver_user.id, amount
                 )
+            except services.InsufficientBalanceError:
+                metrics.record_failure('transfer', services.INSUFFICIENT_BALANCE_ERROR)
+                return Response(
+                    {"erro": services.INSUFFICIENT_BALANCE_ERROR},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except Wallet.DoesNotExist:
+                metrics.record_failure('transfer', services.WALLET_NOT_FOUND_ERROR)
+                return Response({"erro": services.WALLET_NOT_FOUND_ERROR},
+                                status=status.HTTP_404_NOT_FOUND)
+            metrics.record_operations('transfer', [amount])
             return Response(
                 {
                     "mensagem": "Transferência realizada com sucesso.",
                     "id_transacao": new_transaction.id,
-                    "novo_saldo_remetente": sender_wallet.balance,
-                    "novo_saldo_destinatario": receiver_wallet.balance
+                    "novo_saldo_remetente": sender_wallet.total_balance,
+                    "novo_saldo_destinatario": receiver_wallet.total_balance
                 },
                 status=status.HTTP_200_OK
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class TransferStatusView(APIView):
+    """
+    View para consultar o andamento de uma transferência enfileirada do usuário autenticado.
+    Requer autenticação.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """
+        Retorna o status da transferência: PENDING, SETTLED (com o id da transação) ou
+        REJECTED (com o motivo).
+        """
+        pending = (
+            PendingTransfer.objects.filter(pk=pk, sender_id=request.user.id)
+            .values('id', 'receiver__username', 'amount', 'status', 'error', 'transaction_id', 'created_at', 'settled_at')
+            .first()
+        )
+        if pending is None:
+            return Response({"erro": "Transferência não encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                "id_transferencia": pending['id'],
+                "receiver_username": pending['receiver__username'],
+                "amount": pending['amount'],
+                "status": pending['status'],
+                "erro": pending['error'] or None,
+                "id_transacao": pending['transaction_id'],
+                "criada_em": pending['created_at'],
+                "liquidada_em": pending['settled_at'],
+            },
+            status=status.HTTP_200_OK
+        )
+
+class BatchTransferCreateView(APIView):
+    """
+    View para liquidar um lote de transferências do usuário autenticado em uma única transação.
+    Requer autenticação.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Processa um lote de transferências e retorna o resultado de cada item.
+        """
+        serializer = BatchTransferSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        all_or_nothing = serializer.validated_data['mode'] == BatchTransferSerializer.MODE_ALL_OR_NOTHING
+        try:
+            sender_wallet, results = services.transfer_batch(
+                request.user.id, serializer.validated_data['transfers'], all_or_nothing=all_or_nothing
+            )
+        except services.BatchTransferError as exc:
+            metrics.record_batch(exc.results)
+            return Response(
+                {"erro": "Lote rejeitado: nenhuma transferência foi realizada.", "resultados": exc.results},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Wallet.DoesNotExist:
+            metrics.record_failure('transfer', services.WALLET_NOT_FOUND_ERROR)
+            return Response({"erro": services.WALLET_NOT_FOUND_ERROR},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        metrics.record_batch(results, committed=True)
+        successful = sum(1 for result in results if result["status"] == "ok")
+        return Response(
+            {
+                "mensagem": "Lote processado.",
+                "realizadas": successful,
+                "falhas": len(results) - successful,
+                "novo_saldo_remetente": sender_wallet.total_balance,
+                "resultados": results
+            },
+            status=status.HTTP_200_OK
+        )
+
 class TransactionListView(generics.ListAPIView):
     """
     View para listar as transações de um usuário, com filtro opcional por período de data.
     Requer autenticação.
     """
-    serializer_class = TransactionSerializer
+    serializer_class = TransactionValuesSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionCursorPagination
 
     def get_queryset(self):
         """
-        Retorna as transações onde o usuário é remetente ou destinatário.
-        Permite filtrar por start_date e end_date.
+        Retorna as transações onde o usuário é remetente ou destinatário
+        (UNION ALL indexado, ver TransactionHistory), como dicionários de values()
+        com os nomes de usuário obtidos por JOIN na mesma consulta.
+        Permite filtrar por start_date e end_date (ver get_period_filters).
         """
-        user = self.request.user
-        queryset = Transaction.objects.filter(
-            models.Q(sender=user) | models.Q(receiver=user)
-        ).distinct()
+        queryset = TransactionHistory(self.request.user.id)
+        queryset = queryset.filter(**get_period_filters(self.request.query_params))
+        return queryset.values(*TransactionValuesSerializer.values_fields)
 
-        start_date_str = self.request.query_params.get('start_date')
-        end_date_str = self.request.query_params.get('end_date')
+class _Echo:
+    """
+    Pseudo-buffer para o csv.writer: devolve cada linha escrita em vez de armazená-la.
+    """
+    def write(self, value):
+        return value
 
-        if start_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                queryset = queryset.filter(timestamp__date__gte=start_date)
-            except ValueError:
-                raise ParseError(detail="Formato de data inválido para 'start_date'. Use AAAA-MM-DD.")
+class TransactionSummaryView(APIView):
+    """
+    View para resumir as transações do usuário autenticado: quantidades e totais recebidos e
+    enviados por dia, semana ou mês e por tipo, com os mesmos filtros de período da listagem.
+    Servida pelos totais diários (ver wallet_app.rollups), sem percorrer o histórico.
+    Requer autenticação.
+    """
+    permission_classes = [IsAuthenticated]
 
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                queryset = queryset.filter(timestamp__date__lte=end_date)
-            except ValueError:
-                raise ParseError(detail="Formato de data inválido para 'end_date'. Use AAAA-MM-DD.")
+    def get(self, request):
+        """
+        Retorna os totais por período (`group_by`: day, week ou month; padrão day) e tipo,
+        e os totais de todo o período por tipo.
+        """
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in rollups.GROUPINGS:
+            raise ParseError(detail="Valor inválido para 'group_by'. Use day, week ou month.")
+        filters = get_period_filters(request.query_params)
+        rows = rollups.summary(
+            request.user.id, filters.get('timestamp__gte'), filters.get('timestamp__lt'), group_by
+        )
+
+        results = []
+        totals = {}
+        for row in rows:
+            values = {
+                "recebidas": row['received_count'],
+                "total_recebido": row['received_total'],
+                "enviadas": row['sent_count'],
+                "total_enviado": row['sent_total'],
+            }
+            results.append({"periodo": row['period'], "transaction_type": row['transaction_type'], **values})
+            total = totals.setdefault(row['transaction_type'], dict.fromkeys(values, 0))
+            for key, value in values.items():
+                total[key] += value
+        return Response({"group_by": group_by, "resultados": results, "totais": totals}, status=status.HTTP_200_OK)
+
+class TransactionExportView(APIView):
+    """
+    View para exportar todo o histórico de transações do usuário autenticado em CSV ou NDJSON.
+    Aceita os mesmos filtros de período da listagem. Requer autenticação.
+    """
+    permission_classes = [IsAuthenticated]
+    export_fields = ['id', 'sender', 'receiver', 'amount', 'transaction_type', 'timestamp']
+    chunk_size = 2000
+    content_types = {
+        'csv': 'text/csv; charset=utf-8',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def get(self, request):
+        """
+        Transmite o histórico linha a linha (StreamingHttpResponse), lendo o banco por um
+        cursor do lado do servidor, de modo que a memória usada não depende do total de linhas.
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in self.content_types:
+            raise ParseError(detail="Formato de exportação inválido. Use 'csv' ou 'ndjson'.")
+
+        history = TransactionHistory(request.user.id).filter(**get_period_filters(request.query_params))
+        rows = history.values(*TransactionValuesSerializer.values_fields).iterator(chunk_size=self.chunk_size)
+
+        if export_format == 'csv':
+            content = self._stream_csv(rows)
+        else:
+            content = self._stream_ndjson(rows)
+
+        response = StreamingHttpResponse(content, content_type=self.content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="transacoes.{export_format}"'
+        return response
+
+    def _stream_csv(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            yield writer.writerow(TransactionValuesSerializer.to_representation(row).values())
 
-        return queryset.order_by('-timestamp')
+    def _stream_ndjson(self, rows):
+        for row in rows:
+            yield json.dumps(TransactionValuesSerializer.to_representation(row), ensure_ascii=False) + '\n'